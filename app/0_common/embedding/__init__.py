@@ -0,0 +1,33 @@
+from llama_index.embeddings.base import BaseEmbedding
+
+from .variables import CACHE_ENABLED, SERVICE_HOST
+
+
+def cached(embed_model: BaseEmbedding) -> BaseEmbedding:
+    """
+    Makes the embed model read through the on-disk embedding cache, unless EMBEDDING_CACHE is false
+    """
+    if not CACHE_ENABLED:
+        return embed_model
+
+    from .cache import CachedEmbedding, get_embedding_cache
+
+    return CachedEmbedding(embed_model, get_embedding_cache())
+
+
+def get_embed_model(model_name: str, **kwargs) -> BaseEmbedding:
+    """
+    Returns the embedding model used to build and query indices
+    :param model_name: Hugging Face model name, the service must serve the same model
+    :param kwargs: Passed to the embedding model, e.g. embed_batch_size
+    :return: RemoteEmbedding when EMBEDDING_SERVICE_HOST is set, else an in process HuggingFaceEmbedding,
+        reading through the embedding cache
+    """
+    if SERVICE_HOST:
+        from .remote import RemoteEmbedding
+
+        return cached(RemoteEmbedding(model_name=model_name, **kwargs))
+
+    from llama_index.embeddings import HuggingFaceEmbedding
+
+    return cached(HuggingFaceEmbedding(model_name=model_name, **kwargs))
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Any, Callable, Dict, List, Optional
+
+from llama_index.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.base import BaseEmbedding
+from logger import create_logger
+
+from .variables import CACHE_PATH
+
+_logger = create_logger("embedding:cache")
+
+TEXT = "text"
+QUERY = "query"
+
+# Stays below SQLite's limit of host parameters per statement
+LOOKUP_CHUNK_SIZE = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    SQLite store of embeddings keyed by (model, kind, text hash), where model is the model name and the
+    precision the vectors were computed in.
+
+    Vectors are stored as float32 blobs, the precision the models compute them in. Every thread uses its own
+    connection and the database runs in WAL mode, so concurrent indexers read while another one writes.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, kind TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, kind, hash)) WITHOUT ROWID"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, model: str, kind: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """
+        Looks up the embeddings of the given text hashes
+        :return: Embeddings of the cached hashes, keyed by hash
+        """
+        found = {}
+        connection = self._connection()
+        for start in range(0, len(hashes), LOOKUP_CHUNK_SIZE):
+            chunk = hashes[start : start + LOOKUP_CHUNK_SIZE]
+            rows = connection.execute(
+                "SELECT hash, vector FROM embeddings WHERE model = ? AND kind = ? "
+                f"AND hash IN ({','.join('?' * len(chunk))})",
+                (model, kind, *chunk),
+            )
+            for digest, vector in rows:
+                found[digest] = array("f", vector).tolist()
+        self.hits += len(found)
+        self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model: str, kind: str, embeddings: Dict[str, List[float]]):
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, kind, hash, vector) VALUES (?, ?, ?, ?)",
+                [
+                    (model, kind, digest, array("f", vector).tobytes())
+                    for digest, vector in embeddings.items()
+                ],
+            )
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Reads embeddings through an EmbeddingCache and only computes the missing ones with the wrapped model.
+
+    Entries are keyed by model name and precision: the in process model and a fp32 embedding service share
+    them, fp16 or int8 service vectors are kept apart.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _cache_model: Optional[str] = PrivateAttr(default=None)
+
+    def __init__(self, embed_model: BaseEmbedding, cache: EmbeddingCache, **kwargs: Any) -> None:
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            callback_manager=embed_model.callback_manager,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._cache = cache
+        self._cache_model = None
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        return self._embed_model
+
+    @property
+    def cache_model(self) -> str:
+        # In process models compute in fp32, RemoteEmbedding reports the precision of the service
+        if self._cache_model is None:
+            precision = getattr(self._embed_model, "precision", "fp32")
+            self._cache_model = f"{self.model_name}@{precision}"
+        return self._cache_model
+
+    def _lookup(self, kind: str, texts: List[str]):
+        hashes = [text_hash(text) for text in texts]
+        found = self._cache.get_many(self.cache_model, kind, list(set(hashes)))
+        missing = {digest: text for digest, text in zip(hashes, texts) if digest not in found}
+        return hashes, found, missing
+
+    def _store(self, kind: str, found: Dict, missing: Dict, embeddings: List[List[float]]):
+        computed = dict(zip(missing, embeddings))
+        if computed:
+            self._cache.put_many(self.cache_model, kind, computed)
+        found.update(computed)
+
+    def _read_through(self, kind: str, texts: List[str], embed: Callable) -> List[List[float]]:
+        hashes, found, missing = self._lookup(kind, texts)
+        if missing:
+            self._store(kind, found, missing, embed(list(missing.values())))
+        return [found[digest] for digest in hashes]
+
+    async def _aread_through(self, kind: str, texts: List[str], embed: Callable) -> List[List[float]]:
+        hashes, found, missing = self._lookup(kind, texts)
+        if missing:
+            self._store(kind, found, missing, await embed(list(missing.values())))
+        return [found[digest] for digest in hashes]
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return [self._embed_model._get_query_embedding(query) for query in queries]
+
+    async def _aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        return [await self._embed_model._aget_query_embedding(query) for query in queries]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._read_through(QUERY, [query], self._embed_queries)[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._aread_through(QUERY, [query], self._aembed_queries))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._read_through(TEXT, texts, self._embed_model._get_text_embeddings)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._aread_through(TEXT, texts, self._embed_model._aget_text_embeddings)
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Returns the process-wide embedding cache
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(CACHE_PATH)
+        return _cache
@@ -0,0 +1,98 @@
+from typing import Any, List, Optional
+
+import grpc
+from embedding_proto import embedding_pb2, embedding_pb2_grpc
+from llama_index.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.base import BaseEmbedding
+
+from .variables import BATCH_SIZE, SERVICE_HOST, TIMEOUT
+
+MAX_MESSAGE_LENGTH = 64 * 1024 * 1024
+
+
+class RemoteEmbedding(BaseEmbedding):
+    """
+    Embeds texts through the shared embedding service, which batches the requests of every indexer and
+    query engine together instead of each of them loading its own copy of the model.
+    """
+
+    host: str
+    timeout: float
+
+    _channel: grpc.Channel = PrivateAttr()
+    _stub: embedding_pb2_grpc.EmbeddingStub = PrivateAttr()
+    _aio_channel: Any = PrivateAttr(default=None)
+    _aio_stub: Any = PrivateAttr(default=None)
+    _precision: Optional[str] = PrivateAttr(default=None)
+
+    def __init__(
+        self,
+        model_name: str,
+        host: str = SERVICE_HOST,
+        embed_batch_size: int = BATCH_SIZE,
+        timeout: float = TIMEOUT,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            model_name=model_name, host=host, embed_batch_size=embed_batch_size, timeout=timeout, **kwargs
+        )
+        self._channel = grpc.insecure_channel(host, options=self._channel_options())
+        self._stub = embedding_pb2_grpc.EmbeddingStub(self._channel)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RemoteEmbedding"
+
+    @property
+    def precision(self) -> str:
+        """
+        Precision the service computes embeddings in, fetched on first use
+        """
+        if self._precision is None:
+            info = self._stub.getEmbeddingInfo(embedding_pb2.EmbedEmpty(), timeout=self.timeout)
+            self._precision = info.precision
+        return self._precision
+
+    @staticmethod
+    def _channel_options():
+        return [
+            ("grpc.max_send_message_length", MAX_MESSAGE_LENGTH),
+            ("grpc.max_receive_message_length", MAX_MESSAGE_LENGTH),
+        ]
+
+    def _request(self, texts: List[str], type: int) -> embedding_pb2.EmbedRequest:
+        return embedding_pb2.EmbedRequest(model=self.model_name, texts=texts, type=type)
+
+    @staticmethod
+    def _vectors(response: embedding_pb2.EmbedResponse) -> List[List[float]]:
+        return [list(embedding.values) for embedding in response.embeddings]
+
+    def _embed(self, texts: List[str], type: int) -> List[List[float]]:
+        response = self._stub.embed(self._request(texts, type), timeout=self.timeout)
+        return self._vectors(response)
+
+    async def _aembed(self, texts: List[str], type: int) -> List[List[float]]:
+        # grpc.aio channels are bound to the event loop they are created in
+        if self._aio_stub is None:
+            self._aio_channel = grpc.aio.insecure_channel(self.host, options=self._channel_options())
+            self._aio_stub = embedding_pb2_grpc.EmbeddingStub(self._aio_channel)
+        response = await self._aio_stub.embed(self._request(texts, type), timeout=self.timeout)
+        return self._vectors(response)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed([query], embedding_pb2.EmbedRequest.QUERY)[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._aembed([query], embedding_pb2.EmbedRequest.QUERY))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed([text], embedding_pb2.EmbedRequest.TEXT)[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aembed([text], embedding_pb2.EmbedRequest.TEXT))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, embedding_pb2.EmbedRequest.TEXT)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed(texts, embedding_pb2.EmbedRequest.TEXT)
@@ -0,0 +1,11 @@
+import os
+
+# host:port of the shared embedding service, models are loaded in process when it is unset
+SERVICE_HOST = os.environ.get("EMBEDDING_SERVICE_HOST", "")
+# Texts sent per request, the service splits them into length-bucketed forward passes
+BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 256))
+TIMEOUT = float(os.environ.get("EMBEDDING_TIMEOUT", 120))
+
+# On-disk cache of computed embeddings keyed by model name and text hash, shared by the processes of the host
+CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE", "true").lower() == "true"
+CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "/tmp/embedding-cache/embeddings.sqlite3")
@@ -0,0 +1,4 @@
+from .scheduler import BatchScheduler
+from .variables import BATCHING_ENABLED
+
+__all__ = ["BatchScheduler", "BATCHING_ENABLED"]
@@ -0,0 +1,76 @@
+"""
+Throughput benchmark of the batching scheduler under a synthetic load.
+
+    python -m generation.benchmark --model MBZUAI/LaMini-GPT-124M --requests 32 --batch-sizes 1 2 4 8
+"""
+
+import argparse
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from .scheduler import BatchScheduler
+
+WORDS = "revenue margin growth quarter fiscal year operating income guidance segment cash flow debt".split()
+
+
+def synthetic_prompts(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [
+        "Summarize the following: " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(16, 96)))
+        for _ in range(count)
+    ]
+
+
+def run(model, tokenizer, prompts, batch_size: int, max_new_tokens: int, max_wait_ms: float):
+    scheduler = BatchScheduler(model, tokenizer, max_batch_size=batch_size, max_wait_ms=max_wait_ms)
+
+    def timed_request(prompt):
+        start = time.perf_counter()
+        tokens = scheduler.submit(prompt, max_new_tokens=max_new_tokens, temperature=0).result()
+        return time.perf_counter() - start, len(tokens)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+        results = list(executor.map(timed_request, prompts))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    generated = sum(tokens for _, tokens in results)
+    return {
+        "batch_size": batch_size,
+        "tokens_per_s": round(generated / elapsed, 1),
+        "requests_per_s": round(len(prompts) / elapsed, 2),
+        "p50_latency_s": round(statistics.median(latencies), 2),
+        "p95_latency_s": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+        "average_batch_size": scheduler.stats()["average_batch_size"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--model", default="MBZUAI/LaMini-GPT-124M")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model, device_map="auto")
+    model.eval()
+    prompts = synthetic_prompts(args.requests)
+
+    # Warm up kernels and allocator before measuring
+    run(model, tokenizer, prompts[:2], 2, 4, args.max_wait_ms)
+    for batch_size in args.batch_sizes:
+        print(run(model, tokenizer, prompts, batch_size, args.max_new_tokens, args.max_wait_ms))
+
+
+if __name__ == "__main__":
+    main()
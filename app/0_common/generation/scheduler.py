@@ -0,0 +1,217 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+import torch
+from logger import create_logger
+
+from .variables import BATCH_MAX_WAIT_MS, MAX_BATCH_SIZE
+
+_logger = create_logger("generation:scheduler")
+
+
+@dataclass
+class GenerationRequest:
+    input_ids: List[int]
+    max_new_tokens: int
+    temperature: float
+    top_k: int
+    repetition_penalty: float
+    streamer: Optional[object] = None
+    future: Future = field(default_factory=Future)
+    generated: List[int] = field(default_factory=list)
+    done: bool = False
+
+    def emit(self, token: int, finished: bool):
+        if not finished:
+            self.generated.append(token)
+            if self.streamer is not None:
+                self.streamer.put(torch.tensor([token]))
+        if finished or len(self.generated) >= self.max_new_tokens:
+            self.finish()
+
+    def finish(self, exc: Optional[Exception] = None):
+        if self.done:
+            return
+        self.done = True
+        if self.streamer is not None:
+            self.streamer.end()
+        if exc is not None:
+            self.future.set_exception(exc)
+        else:
+            self.future.set_result(self.generated)
+
+
+class BatchScheduler:
+    """
+    BatchScheduler collects concurrent generation requests into dynamic batches and decodes them together.
+
+    The first request of a batch waits up to `max_wait_ms` for others to join. Prompts are left padded and
+    stacked, every decoding step runs the model once for the whole batch and the sampled tokens are pushed to
+    the streamer of the request they belong to. Requests that arrive while a batch is decoding form the next
+    one.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        eos_token_ids: Optional[Iterable[int]] = None,
+    ) -> None:
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        if eos_token_ids is None:
+            eos_token_ids = [tokenizer.eos_token_id]
+        self.eos_token_ids = set(eos_token_ids)
+        self.pad_token_id = (
+            tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        )
+        self.batches = 0
+        self.batched_requests = 0
+        self._queue: "queue.Queue[GenerationRequest]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+        self._worker.start()
+        _logger.info(f"Batch scheduler started (max batch size: {max_batch_size}, max wait: {max_wait_ms}ms)")
+
+    def submit(
+        self,
+        prompt: str,
+        max_new_tokens: int,
+        temperature: float = 1.0,
+        top_k: int = 0,
+        repetition_penalty: float = 1.0,
+        streamer=None,
+    ) -> Future:
+        """
+        Queues a prompt for generation
+        :param prompt: Prompt, already formatted with the chat template if any
+        :param max_new_tokens: Maximum number of generated tokens
+        :param temperature: Sampling temperature, 0 decodes greedily
+        :param top_k: Number of highest probability tokens to sample from, 0 disables the filter
+        :param repetition_penalty: Penalty applied to tokens already present in the sequence
+        :param streamer: Optional transformers streamer receiving the tokens as they are generated
+        :return: Future resolving to the generated token IDs
+        """
+        input_ids = self.tokenizer(prompt, add_special_tokens=False)["input_ids"]
+        request = GenerationRequest(
+            input_ids, max_new_tokens, temperature, top_k, repetition_penalty, streamer
+        )
+        self._queue.put(request)
+        return request.future
+
+    def generate(self, prompt: str, **kwargs) -> str:
+        """
+        Generates a completion for the prompt, blocking until it is done
+        :return: Newly generated text, without the prompt
+        """
+        token_ids = self.submit(prompt, **kwargs).result()
+        return self.tokenizer.decode(token_ids, skip_special_tokens=True)
+
+    def _collect(self) -> List[GenerationRequest]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self.batches += 1
+            self.batched_requests += len(batch)
+            try:
+                self._generate_batch(batch)
+            except Exception as exc:
+                _logger.exception(f"Batch generation failed: {exc}")
+                for request in batch:
+                    request.finish(exc)
+
+    def _next_tokens(self, logits: torch.Tensor, sequences: torch.Tensor, batch: List[GenerationRequest]):
+        device = logits.device
+        penalties = torch.tensor([request.repetition_penalty for request in batch], device=device)[:, None]
+        scores = torch.gather(logits, 1, sequences)
+        scores = torch.where(scores < 0, scores * penalties, scores / penalties)
+        logits = logits.scatter(1, sequences, scores)
+
+        temperatures = torch.tensor([request.temperature for request in batch], device=device)
+        greedy = temperatures <= 0
+        logits = logits / temperatures.clamp(min=1e-5)[:, None]
+
+        vocab_size = logits.shape[-1]
+        top_ks = torch.tensor(
+            [min(request.top_k, vocab_size) if request.top_k > 0 else vocab_size for request in batch],
+            device=device,
+        )
+        top_values = torch.topk(logits, int(top_ks.max()), dim=-1).values
+        kth_values = top_values.gather(1, (top_ks - 1)[:, None])
+        logits = logits.masked_fill(logits < kth_values, float("-inf"))
+
+        sampled = torch.multinomial(torch.softmax(logits, dim=-1), num_samples=1).squeeze(1)
+        return torch.where(greedy, logits.argmax(dim=-1), sampled)
+
+    @torch.inference_mode()
+    def _generate_batch(self, batch: List[GenerationRequest]):
+        device = self.model.device
+        max_length = max(len(request.input_ids) for request in batch)
+        input_ids = torch.tensor(
+            [[self.pad_token_id] * (max_length - len(r.input_ids)) + r.input_ids for r in batch],
+            device=device,
+        )
+        attention_mask = torch.tensor(
+            [[0] * (max_length - len(r.input_ids)) + [1] * len(r.input_ids) for r in batch], device=device
+        )
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        # Padded slots point at the last prompt token so that the repetition penalty ignores them
+        penalty_ids = torch.where(attention_mask.bool(), input_ids, input_ids[:, -1:])
+
+        for request in batch:
+            if request.streamer is not None:
+                # Matches generate(): the first put is the prompt, which streamers may skip
+                request.streamer.put(torch.tensor(request.input_ids))
+
+        past_key_values = None
+        while not all(request.done for request in batch):
+            outputs = self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=past_key_values,
+                use_cache=True,
+            )
+            past_key_values = outputs.past_key_values
+            next_tokens = self._next_tokens(outputs.logits[:, -1, :].float(), penalty_ids, batch)
+
+            for request, token in zip(batch, next_tokens.tolist()):
+                if not request.done:
+                    request.emit(token, finished=token in self.eos_token_ids)
+
+            # Finished rows keep decoding padding until the whole batch is done
+            next_tokens = torch.tensor(
+                [self.pad_token_id if r.done else t for r, t in zip(batch, next_tokens.tolist())],
+                device=device,
+            )
+            input_ids = next_tokens[:, None]
+            penalty_ids = torch.cat([penalty_ids, input_ids], dim=-1)
+            attention_mask = torch.cat([attention_mask, torch.ones_like(input_ids)], dim=-1)
+            position_ids = position_ids[:, -1:] + 1
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "average_batch_size": round(self.batched_requests / self.batches, 2) if self.batches else 0,
+            "queued": self._queue.qsize(),
+        }
@@ -0,0 +1,7 @@
+import os
+
+# Serve generation through the batching scheduler instead of one pipeline() call per request
+BATCHING_ENABLED = os.environ.get("GENERATION_BATCHING", "true").lower() == "true"
+MAX_BATCH_SIZE = int(os.environ.get("GENERATION_MAX_BATCH_SIZE", 8))
+# How long the first request of a batch waits for others to join it
+BATCH_MAX_WAIT_MS = float(os.environ.get("GENERATION_BATCH_MAX_WAIT_MS", 10))
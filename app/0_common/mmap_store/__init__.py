@@ -0,0 +1,15 @@
+from .bm25 import BM25Index, persist_bm25_index
+from .shared import folder_version, shared_persist_dir
+from .storage_context import copy_storage_context, load_storage_context, persist_storage_context
+from .vector_store import MmapVectorStore
+
+__all__ = [
+    "BM25Index",
+    "MmapVectorStore",
+    "copy_storage_context",
+    "folder_version",
+    "load_storage_context",
+    "persist_bm25_index",
+    "persist_storage_context",
+    "shared_persist_dir",
+]
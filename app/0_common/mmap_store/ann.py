@@ -0,0 +1,138 @@
+import hashlib
+import json
+import math
+import os
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+from logger import create_logger
+
+from .variables import (
+    ANN_EF_SEARCH,
+    ANN_HNSW_EF_CONSTRUCTION,
+    ANN_HNSW_M,
+    ANN_IVF_NLIST,
+    ANN_NPROBE,
+    ANN_PQ_M,
+)
+from .vector_store import ANN_FNAME, ANN_INFO_FNAME, MmapVectorStore
+
+_logger = create_logger("mmap_store:ann")
+
+ANN_TYPES = ["hnsw", "ivfpq"]
+# Rows added to the index at once, the memory-mapped matrix is read in chunks
+ADD_BATCH_SIZE = 65_536
+# k-means needs a few dozen points per centroid, more barely improves the clustering
+TRAIN_POINTS_PER_CENTROID = 64
+
+
+def fingerprint(node_ids: List[str]) -> str:
+    """
+    Identifies the rows an ANN index was built over, an index built over other rows must not be used
+    """
+    return hashlib.sha256("\n".join(node_ids).encode()).hexdigest()
+
+
+def _pq_subquantizers(dim: int, m: int) -> int:
+    # Product quantization splits the vector in m equal parts
+    return max(divisor for divisor in range(1, min(m, dim) + 1) if dim % divisor == 0)
+
+
+class AnnIndex:
+    """
+    Approximate nearest neighbour index over the normalized rows of a MmapVectorStore, searched by inner
+    product. Its IDs are the rows of the matrix, so the store's masks filter it through a faiss ID selector.
+    """
+
+    def __init__(self, index, kind: str, rows_fingerprint: str) -> None:
+        self.index = index
+        self.kind = kind
+        self.fingerprint = rows_fingerprint
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, node_ids: List[str], kind: str) -> "AnnIndex":
+        """
+        :param vectors: Normalized rows
+        :param kind: hnsw, or ivfpq which needs at least 256 rows to train its quantizers
+        """
+        rows, dim = vectors.shape
+        if kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, ANN_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = ANN_HNSW_EF_CONSTRUCTION
+        elif kind == "ivfpq":
+            nlist = ANN_IVF_NLIST or int(4 * math.sqrt(rows))
+            nlist = max(1, min(nlist, rows // TRAIN_POINTS_PER_CENTROID))
+            subquantizers = _pq_subquantizers(dim, ANN_PQ_M)
+            index = faiss.IndexIVFPQ(
+                faiss.IndexFlatIP(dim), dim, nlist, subquantizers, 8, faiss.METRIC_INNER_PRODUCT
+            )
+            sample_size = min(rows, max(nlist * TRAIN_POINTS_PER_CENTROID, 256 * TRAIN_POINTS_PER_CENTROID))
+            sample = np.sort(np.random.default_rng(0).choice(rows, sample_size, replace=False))
+            index.train(np.ascontiguousarray(vectors[sample], dtype=np.float32))
+        else:
+            raise ValueError(f"Unknown ANN index type {kind}, expected one of {ANN_TYPES}")
+
+        for start in range(0, rows, ADD_BATCH_SIZE):
+            index.add(np.ascontiguousarray(vectors[start : start + ADD_BATCH_SIZE], dtype=np.float32))
+        _logger.info(f"Built {kind} index over {rows} rows")
+        return cls(index, kind, fingerprint(node_ids))
+
+    @classmethod
+    def load(cls, persist_dir: str, node_ids: List[str]) -> Optional["AnnIndex"]:
+        """
+        :return: ANN index persisted in persist_dir, None when there is none or it was built over other rows
+        """
+        info_path = os.path.join(persist_dir, ANN_INFO_FNAME)
+        if not os.path.exists(info_path):
+            return None
+        with open(info_path) as file:
+            info = json.load(file)
+        if info["fingerprint"] != fingerprint(node_ids):
+            _logger.warning(f"Ignoring the {info['kind']} index of {persist_dir}, its rows changed since")
+            return None
+        return cls(faiss.read_index(os.path.join(persist_dir, ANN_FNAME)), info["kind"], info["fingerprint"])
+
+    def save(self, persist_dir: str):
+        faiss.write_index(self.index, os.path.join(persist_dir, ANN_FNAME))
+        with open(os.path.join(persist_dir, ANN_INFO_FNAME), "w") as file:
+            json.dump({"kind": self.kind, "fingerprint": self.fingerprint}, file)
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        mask: Optional[np.ndarray] = None,
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param query: Normalized query
+        :param mask: Candidate rows, every row when None
+        :param ef_search: HNSW candidate list size, larger is slower with a higher recall
+        :param nprobe: IVF lists visited, larger is slower with a higher recall
+        :return: Rows and approximate scores, best first
+        """
+        params = {}
+        if mask is not None:
+            # The bitmap has to outlive the search, faiss only keeps a pointer to it
+            bitmap = np.packbits(mask, bitorder="little")
+            params["sel"] = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+        if self.kind == "hnsw":
+            search_params = faiss.SearchParametersHNSW(efSearch=max(ef_search or ANN_EF_SEARCH, k), **params)
+        else:
+            search_params = faiss.SearchParametersIVF(nprobe=nprobe or ANN_NPROBE, **params)
+
+        query = np.ascontiguousarray(query, dtype=np.float32)[None, :]
+        scores, rows = self.index.search(query, k, params=search_params)
+        found = rows[0] >= 0
+        return rows[0][found], scores[0][found]
+
+
+def build_ann_index(persist_dir: str, kind: str):
+    """
+    Builds an ANN index over the vectors persisted in persist_dir and saves it next to them
+    :param kind: One of ANN_TYPES
+    """
+    store = MmapVectorStore.from_persist_dir(persist_dir)
+    AnnIndex.build(store._vectors, store._node_ids, kind).save(persist_dir)
@@ -0,0 +1,89 @@
+"""
+Query latency of MmapVectorStore against llama_index's SimpleVectorStore on random embeddings, without and
+with a metadata filter on year.
+
+    python -m mmap_store.benchmark --sizes 10000 100000 1000000 --dim 1024 --queries 20
+
+SimpleVectorStore keeps every embedding as a list of Python floats, it is skipped above --baseline-max-size.
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+from llama_index.vector_stores import SimpleVectorStore
+from llama_index.vector_stores.simple import SimpleVectorStoreData
+from llama_index.vector_stores.types import ExactMatchFilter, MetadataFilters, VectorStoreQuery
+
+from .search import normalize
+from .vector_store import MmapVectorStore
+
+YEARS = [str(year) for year in range(2016, 2024)]
+NODES_PER_DOCUMENT = 50
+
+
+def synthetic_store(size: int, dim: int, seed: int = 0) -> MmapVectorStore:
+    rng = np.random.default_rng(seed)
+    vectors, norms = normalize(rng.standard_normal((size, dim), dtype=np.float32))
+    node_ids = [f"node-{row}" for row in range(size)]
+    ref_doc_ids = [f"document-{row // NODES_PER_DOCUMENT}" for row in range(size)]
+    metadata = [
+        {"year": YEARS[row % len(YEARS)], "document_id": ref_doc_ids[row]} for row in range(size)
+    ]
+    return MmapVectorStore(vectors, norms, node_ids, ref_doc_ids, metadata)
+
+
+def simple_store(store: MmapVectorStore) -> SimpleVectorStore:
+    data = SimpleVectorStoreData(
+        embedding_dict={node_id: store.get(node_id) for node_id in store._node_ids},
+        text_id_to_ref_doc_id=dict(zip(store._node_ids, store._ref_doc_ids)),
+        metadata_dict=dict(zip(store._node_ids, store._metadata)),
+    )
+    return SimpleVectorStore(data=data)
+
+
+def run(store, queries, top_k: int, filters=None):
+    latencies = []
+    for query_embedding in queries:
+        query = VectorStoreQuery(query_embedding=query_embedding, similarity_top_k=top_k, filters=filters)
+        start = time.perf_counter()
+        store.query(query)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50_ms": round(1000 * statistics.median(latencies), 2),
+        "p95_ms": round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--baseline-max-size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32).tolist()
+    year_filter = MetadataFilters(filters=[ExactMatchFilter(key="year", value=YEARS[-1])])
+
+    for size in args.sizes:
+        store = synthetic_store(size, args.dim)
+        # Builds the year column before measuring, like the first filtered query of a loaded index would
+        run(store, queries[:1], args.top_k, year_filter)
+        stores = {"mmap": store}
+        if size <= args.baseline_max_size:
+            stores["simple"] = simple_store(store)
+        for name, benchmarked in stores.items():
+            for filtered, filters in [("none", None), ("year", year_filter)]:
+                result = run(benchmarked, queries, args.top_k, filters)
+                print({"store": name, "nodes": size, "filter": filtered, **result})
+
+
+if __name__ == "__main__":
+    main()
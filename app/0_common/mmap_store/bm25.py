@@ -0,0 +1,182 @@
+import json
+import math
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from llama_index.schema import MetadataMode
+from llama_index.storage.docstore import BaseDocumentStore
+
+from .search import MetadataColumns, filter_mask, select_top
+from .variables import BM25_B, BM25_K1
+from .vector_store import _atomic_save
+
+BM25_POSTINGS_FNAME = "bm25.npz"
+BM25_TERMS_FNAME = "bm25.json"
+
+# Words, tickers and numbers, "1,234.5" is kept whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+STOPWORDS = set(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what which "
+    "who will with how did does do".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        token.replace(",", "") for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS
+    ]
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over the nodes of an index, for the exact terms (tickers, figures) dense
+    retrieval misses.
+
+    Postings are stored in CSR layout: the rows and term frequencies of term t are
+    rows[offsets[t]:offsets[t + 1]] and tfs[offsets[t]:offsets[t + 1]]. Rows are the positions of the nodes in
+    node_ids.
+    """
+
+    def __init__(
+        self,
+        terms: List[str],
+        offsets: np.ndarray,
+        rows: np.ndarray,
+        tfs: np.ndarray,
+        lengths: np.ndarray,
+        node_ids: List[str],
+        metadata: List[Dict],
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+    ) -> None:
+        self._terms = {term: term_id for term_id, term in enumerate(terms)}
+        self._offsets = offsets
+        self._rows = rows
+        self._tfs = tfs
+        self._lengths = lengths
+        self._node_ids = node_ids
+        self._metadata = metadata
+        self._columns = MetadataColumns(metadata)
+        self.k1 = k1
+        self.b = b
+        # Length normalization of every row, the only part of the BM25 denominator not depending on the term
+        average_length = float(lengths.mean()) if len(lengths) else 1.0
+        self._length_norm = k1 * (1 - b + b * lengths / max(average_length, 1e-12))
+
+    def __len__(self) -> int:
+        return len(self._node_ids)
+
+    @classmethod
+    def build(cls, node_ids: List[str], texts: Iterable[str], metadata: List[Dict]) -> "BM25Index":
+        terms: Dict[str, int] = {}
+        # Compact buffers, a corpus index has tens of millions of postings
+        term_ids, rows, tfs = array("q"), array("i"), array("f")
+        lengths = np.zeros(len(node_ids), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[row] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(terms.setdefault(term, len(terms)))
+                rows.append(row)
+                tfs.append(tf)
+
+        term_ids = np.frombuffer(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(terms)))
+        return cls(
+            terms=list(terms),
+            offsets=offsets,
+            rows=np.frombuffer(rows, dtype=np.int32)[order],
+            tfs=np.frombuffer(tfs, dtype=np.float32)[order],
+            lengths=lengths,
+            node_ids=node_ids,
+            metadata=metadata,
+        )
+
+    @classmethod
+    def from_docstore(cls, docstore: BaseDocumentStore) -> "BM25Index":
+        """
+        Indexes the nodes with the metadata they were embedded with, so that tickers and company names match
+        """
+        nodes = list(docstore.docs.values())
+        return cls.build(
+            node_ids=[node.node_id for node in nodes],
+            texts=(node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes),
+            metadata=[node.metadata for node in nodes],
+        )
+
+    @classmethod
+    def load(cls, persist_dir: str) -> Optional["BM25Index"]:
+        """
+        :return: BM25 index persisted in persist_dir, None when there is none
+        """
+        terms_path = os.path.join(persist_dir, BM25_TERMS_FNAME)
+        if not os.path.exists(terms_path):
+            return None
+        with open(terms_path) as file:
+            info = json.load(file)
+        with np.load(os.path.join(persist_dir, BM25_POSTINGS_FNAME)) as postings:
+            return cls(
+                terms=info["terms"],
+                offsets=postings["offsets"],
+                rows=postings["rows"],
+                tfs=postings["tfs"],
+                lengths=postings["lengths"],
+                node_ids=info["node_ids"],
+                metadata=info["metadata"],
+                k1=info["k1"],
+                b=info["b"],
+            )
+
+    def persist(self, persist_dir: str):
+        os.makedirs(persist_dir, exist_ok=True)
+
+        def save_postings(path: str):
+            with open(path, "wb") as file:
+                np.savez(file, offsets=self._offsets, rows=self._rows, tfs=self._tfs, lengths=self._lengths)
+
+        def save_terms(path: str):
+            info = {
+                "terms": list(self._terms),
+                "node_ids": self._node_ids,
+                "metadata": self._metadata,
+                "k1": self.k1,
+                "b": self.b,
+            }
+            with open(path, "w") as file:
+                json.dump(info, file)
+
+        _atomic_save(os.path.join(persist_dir, BM25_POSTINGS_FNAME), save_postings)
+        _atomic_save(os.path.join(persist_dir, BM25_TERMS_FNAME), save_terms)
+
+    def query(self, text: str, k: int, filters=None) -> List[Tuple[str, float]]:
+        """
+        :param filters: MetadataFilters, applied to the rows before ranking
+        :return: Node IDs and BM25 scores of the k best matching nodes, best first
+        """
+        scores = np.zeros(len(self._node_ids), dtype=np.float32)
+        for term_id in {self._terms[term] for term in tokenize(text) if term in self._terms}:
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            rows, tfs = self._rows[start:end], self._tfs[start:end]
+            idf = math.log(1 + (len(self._node_ids) - (end - start) + 0.5) / (end - start + 0.5))
+            # A term occurs once per row in its postings, so the rows don't repeat
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + self._length_norm[rows])
+
+        if filters is not None:
+            mask = self._columns.mask(filters)
+            scores[~(mask if mask is not None else filter_mask(filters, self._metadata))] = 0
+        matched = np.flatnonzero(scores)
+        top = matched[select_top(scores[matched], k)]
+        return [(self._node_ids[row], float(scores[row])) for row in top]
+
+
+def persist_bm25_index(docstore: BaseDocumentStore, persist_dir: str):
+    """
+    Builds the BM25 index of the nodes of an index and persists it next to the index
+    """
+    BM25Index.from_docstore(docstore).persist(persist_dir)
@@ -0,0 +1,80 @@
+"""
+Recall@k of the ANN index against exact search, with the query latency of both, over a persisted index or
+random embeddings. Queries are stored rows with gaussian noise.
+
+    python -m mmap_store.recall --persist-dir /tmp/storage/AAPL --kind hnsw --ef-search 32 64 128 256
+    python -m mmap_store.recall --size 300000 --dim 1024 --kind ivfpq --nprobe 4 8 16 32 64
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+from llama_index.vector_stores.types import VectorStoreQuery
+
+from .ann import ANN_TYPES, AnnIndex
+from .benchmark import synthetic_store
+from .search import normalize
+from .vector_store import MmapVectorStore
+
+
+def run(store: MmapVectorStore, queries, top_k: int, **query_kwargs):
+    ids, latencies = [], []
+    for query_embedding in queries:
+        query = VectorStoreQuery(query_embedding=query_embedding, similarity_top_k=top_k)
+        start = time.perf_counter()
+        result = store.query(query, **query_kwargs)
+        latencies.append(time.perf_counter() - start)
+        ids.append(result.ids)
+    return ids, round(1000 * statistics.median(latencies), 2)
+
+
+def recall(approximate, exact) -> float:
+    return statistics.mean(
+        len(set(found) & set(expected)) / len(expected) for found, expected in zip(approximate, exact)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--persist-dir", help="Persisted index, random embeddings when unset")
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--kind", choices=ANN_TYPES, default="hnsw")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=12)
+    parser.add_argument("--noise", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.persist_dir:
+        store = MmapVectorStore.from_persist_dir(args.persist_dir)
+    else:
+        store = synthetic_store(args.size, args.dim)
+    if store._ann is None or store._ann.kind != args.kind:
+        start = time.perf_counter()
+        store._ann = AnnIndex.build(store._vectors, store._node_ids, args.kind)
+        print({"kind": args.kind, "rows": len(store), "build_s": round(time.perf_counter() - start, 1)})
+
+    rng = np.random.default_rng(2)
+    rows = rng.choice(len(store._node_ids), args.queries)
+    dim = store._vectors.shape[1]
+    # Noise of norm ~args.noise around unit rows
+    noise = args.noise * rng.standard_normal((args.queries, dim), dtype=np.float32) / np.sqrt(dim)
+    queries = normalize(store._vectors[rows] + noise)[0].tolist()
+
+    exact, exact_ms = run(store, queries, args.top_k, exact=True)
+    print({"search": "exact", "p50_ms": exact_ms})
+    knob, values = ("ef_search", args.ef_search) if args.kind == "hnsw" else ("nprobe", args.nprobe)
+    for value in values:
+        approximate, approximate_ms = run(store, queries, args.top_k, **{knob: value})
+        score = round(recall(approximate, exact), 4)
+        print({"search": args.kind, knob: value, f"recall@{args.top_k}": score, "p50_ms": approximate_ms})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.vector_stores.simple import _build_metadata_filter_fn
+
+# Below this share of candidate rows, gathering them before scoring is cheaper than scoring the whole matrix
+GATHER_RATIO = 0.25
+
+
+def normalize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: Contiguous float32 rows scaled to unit length, and their original norms
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1).astype(np.float32)
+    return vectors / np.maximum(norms, 1e-12)[:, None], norms
+
+
+def top_k(
+    matrix: np.ndarray, query: np.ndarray, k: int, mask: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k rows of a normalized matrix by inner product with a normalized query, i.e. cosine similarity
+    :param mask: Candidate rows, every row when None
+    :return: Row indices and scores, best first
+    """
+    if not len(matrix):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    rows = None if mask is None else np.flatnonzero(mask)
+    if rows is None:
+        scores = matrix @ query
+    elif len(rows) < GATHER_RATIO * len(matrix):
+        scores = matrix[rows] @ query
+    else:
+        scores = (matrix @ query)[rows]
+
+    top = select_top(scores, k)
+    return (top if rows is None else rows[top]), scores[top]
+
+
+def select_top(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    :return: Indices of the k highest scores, best first
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def filter_mask(filters, metadata: List[Dict]) -> np.ndarray:
+    """
+    Rows matching the filters, one call per row for the filters MetadataColumns can't answer (OR conditions,
+    other operators, list values)
+    """
+    matches = _build_metadata_filter_fn(lambda row: metadata[row], filters)
+    return np.fromiter((matches(row) for row in range(len(metadata))), dtype=bool, count=len(metadata))
+
+
+class MetadataColumns:
+    """
+    Integer codes of a metadata key over every row, built on the first filter on that key. Exact match filters
+    such as year or document_id then become a vectorized comparison instead of a Python call per row.
+    """
+
+    def __init__(self, metadata: List[Dict]) -> None:
+        self._metadata = metadata
+        # key -> (code of every row, -1 when missing; code of every value), None when the key can't be encoded
+        self._columns: Dict[str, Optional[Tuple[np.ndarray, Dict]]] = {}
+        self._lock = threading.Lock()
+
+    def _column(self, key: str) -> Optional[Tuple[np.ndarray, Dict]]:
+        with self._lock:
+            if key not in self._columns:
+                self._columns[key] = self._encode(key)
+            return self._columns[key]
+
+    def _encode(self, key: str) -> Optional[Tuple[np.ndarray, Dict]]:
+        codes = np.full(len(self._metadata), -1, dtype=np.int32)
+        values: Dict = {}
+        for row, metadata in enumerate(self._metadata):
+            value = metadata.get(key)
+            if value is None:
+                continue
+            if isinstance(value, (list, dict)):
+                return None
+            codes[row] = values.setdefault(value, len(values))
+        return codes, values
+
+    def values(self, key: str, rows: Optional[np.ndarray] = None) -> List:
+        """
+        :param rows: Mask of the rows to read, every row when None
+        :return: Distinct values of the key over the rows, none when the key can't be encoded
+        """
+        column = self._column(key)
+        if column is None:
+            return []
+        codes, values = column
+        present = np.unique(codes if rows is None else codes[rows])
+        # Codes are assigned in insertion order
+        by_code = list(values)
+        return [by_code[code] for code in present if code >= 0]
+
+    def mask(self, filters) -> Optional[np.ndarray]:
+        """
+        :param filters: MetadataFilters of a VectorStoreQuery
+        :return: Rows matching every filter, None when a filter can't be answered from the columns
+        """
+        if getattr(filters, "condition", "and") != "and":
+            return None
+        mask = np.ones(len(self._metadata), dtype=bool)
+        for metadata_filter in filters.filters:
+            if getattr(metadata_filter, "operator", "==") != "==":
+                return None
+            column = self._column(metadata_filter.key)
+            if column is None or isinstance(metadata_filter.value, (list, dict)):
+                return None
+            codes, values = column
+            code = values.get(metadata_filter.value)
+            if code is None:
+                return np.zeros(len(self._metadata), dtype=bool)
+            mask &= codes == code
+        return mask
@@ -0,0 +1,64 @@
+import fcntl
+import glob
+import hashlib
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator
+
+from logger import create_logger
+
+_logger = create_logger("mmap_store:shared")
+
+
+def folder_version(files_metadata: Dict[str, Dict]) -> str:
+    """
+    Version of a persisted index folder, changes whenever one of its files does
+    :param files_metadata: Output of Storage.get_files_metadata for the folder
+    """
+    digest = hashlib.sha256()
+    for name, metadata in sorted(files_metadata.items()):
+        digest.update(name.rsplit("/", 1)[-1].encode())
+        digest.update(str(metadata["hash"]).encode())
+    return digest.hexdigest()
+
+
+@contextmanager
+def shared_persist_dir(local_path: str, version: str, download: Callable[[str], None]) -> Iterator[str]:
+    """
+    Yields a folder holding the given version of a persisted index, downloading it on first use. Folders are
+    keyed by version and never modified, so every process of the host loading the same version memory-maps
+    the same files and shares their pages. Installing a version removes the older ones: processes that
+    already mapped them keep reading the unlinked files.
+
+    The index must be loaded inside the context, which holds a host-wide lock on the index folders.
+    :param local_path: Base path of the index folders, `<local_path>@<version>`
+    :param download: Downloads the index to the folder it is given
+    """
+    key = version[:16]
+    persist_dir = f"{local_path}@{key}"
+    os.makedirs(os.path.dirname(persist_dir), exist_ok=True)
+    with open(f"{local_path}.lock", "a") as lock_file:
+        # Readers of an installed version share the lock, installing a version excludes them
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        try:
+            if os.path.isdir(persist_dir):
+                yield persist_dir
+                return
+
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not os.path.isdir(persist_dir):
+                tmp_dir = f"{persist_dir}.{uuid.uuid4().hex}.tmp"
+                try:
+                    download(tmp_dir)
+                    os.rename(tmp_dir, persist_dir)
+                finally:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                for stale_dir in glob.glob(f"{glob.escape(local_path)}@*"):
+                    if stale_dir != persist_dir:
+                        shutil.rmtree(stale_dir, ignore_errors=True)
+                _logger.info(f"Installed {persist_dir}")
+            yield persist_dir
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
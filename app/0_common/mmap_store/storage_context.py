@@ -0,0 +1,88 @@
+import copy
+import os
+from typing import Dict
+
+from llama_index import StorageContext
+from llama_index.storage.docstore import SimpleDocumentStore
+from llama_index.storage.docstore.types import DEFAULT_PERSIST_FNAME as DOCSTORE_FNAME
+from llama_index.storage.index_store import SimpleIndexStore
+from llama_index.storage.index_store.types import DEFAULT_PERSIST_FNAME as INDEX_STORE_FNAME
+from llama_index.vector_stores.simple import DEFAULT_PERSIST_FNAME as JSON_VECTOR_STORE_FNAME
+from llama_index.vector_stores.simple import DEFAULT_VECTOR_STORE, NAMESPACE_SEP, SimpleVectorStore
+
+from .bm25 import BM25Index
+from .variables import INDEX_FORMAT
+from .vector_store import VECTORS_FNAME, MmapVectorStore
+
+JSON_VECTOR_STORE_PATH = f"{DEFAULT_VECTOR_STORE}{NAMESPACE_SEP}{JSON_VECTOR_STORE_FNAME}"
+
+
+def load_storage_context(persist_dir: str) -> StorageContext:
+    """
+    Loads a persisted index, memory-mapping its vectors when it was persisted in the binary format. Vectors
+    persisted as JSON are converted to a matrix as well, so every index is queried the same vectorized way.
+    The BM25 index persisted next to the index, if any, is the sparse_index of the vector store.
+    """
+    if os.path.exists(os.path.join(persist_dir, VECTORS_FNAME)):
+        storage_context = StorageContext.from_defaults(
+            persist_dir=persist_dir, vector_store=MmapVectorStore.from_persist_dir(persist_dir)
+        )
+    else:
+        storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+        if isinstance(storage_context.vector_store, SimpleVectorStore):
+            storage_context.vector_stores[DEFAULT_VECTOR_STORE] = MmapVectorStore.from_dict(
+                storage_context.vector_store.to_dict()
+            )
+    if isinstance(storage_context.vector_store, MmapVectorStore):
+        storage_context.vector_store.sparse_index = BM25Index.load(persist_dir)
+    return storage_context
+
+
+def _copy_kvstore_data(data: Dict[str, Dict]) -> Dict[str, Dict]:
+    # Entries are replaced on write, except the node lists of the ref doc infos that are appended in place
+    return {
+        collection: {
+            key: copy.deepcopy(value) if collection.endswith("/ref_doc_info") else value
+            for key, value in entries.items()
+        }
+        for collection, entries in data.items()
+    }
+
+
+def copy_storage_context(storage_context: StorageContext) -> StorageContext:
+    """
+    Copies a loaded index so that nodes can be inserted without touching the original, which may be shared
+    by other requests. The persisted vectors are not copied, the copy overlays the rows of the original.
+    """
+    vector_store = storage_context.vector_store
+    if isinstance(vector_store, MmapVectorStore):
+        vector_store = vector_store.overlay()
+    else:
+        vector_store = MmapVectorStore.from_dict(vector_store.to_dict())
+    return StorageContext.from_defaults(
+        docstore=SimpleDocumentStore.from_dict(_copy_kvstore_data(storage_context.docstore.to_dict())),
+        index_store=SimpleIndexStore.from_dict(_copy_kvstore_data(storage_context.index_store.to_dict())),
+        vector_store=vector_store,
+    )
+
+
+def persist_storage_context(storage_context: StorageContext, persist_dir: str):
+    """
+    Persists an index in the format selected by INDEX_FORMAT, whichever vector store it was built with
+    """
+    if INDEX_FORMAT != "binary":
+        storage_context.persist(persist_dir=persist_dir)
+        return
+
+    vector_store = storage_context.vector_store
+    if not isinstance(vector_store, MmapVectorStore):
+        vector_store = MmapVectorStore.from_dict(vector_store.to_dict())
+
+    os.makedirs(persist_dir, exist_ok=True)
+    storage_context.docstore.persist(persist_path=os.path.join(persist_dir, DOCSTORE_FNAME))
+    storage_context.index_store.persist(persist_path=os.path.join(persist_dir, INDEX_STORE_FNAME))
+    vector_store.persist(persist_path=os.path.join(persist_dir, VECTORS_FNAME))
+    # An index loaded from JSON must not be loaded from its stale JSON vectors again
+    json_path = os.path.join(persist_dir, JSON_VECTOR_STORE_PATH)
+    if os.path.exists(json_path):
+        os.remove(json_path)
@@ -0,0 +1,22 @@
+import os
+
+# binary: persist vectors as a memory-mapped float32 matrix, json: llama_index's default__vector_store.json
+INDEX_FORMAT = os.environ.get("INDEX_FORMAT", "binary").lower()
+
+# Approximate nearest neighbour index (faiss, CPU only) built next to the vectors of large corpus indices.
+# HNSW graph: links per node and build effort. IVF-PQ: inverted lists (0: 4 * sqrt(rows)) and sub-quantizers.
+ANN_HNSW_M = int(os.environ.get("ANN_HNSW_M", 32))
+ANN_HNSW_EF_CONSTRUCTION = int(os.environ.get("ANN_HNSW_EF_CONSTRUCTION", 200))
+ANN_IVF_NLIST = int(os.environ.get("ANN_IVF_NLIST", 0))
+ANN_PQ_M = int(os.environ.get("ANN_PQ_M", 64))
+# Search effort when the query doesn't set one, queries pass ef_search (HNSW) and nprobe (IVF-PQ)
+ANN_EF_SEARCH = int(os.environ.get("ANN_EF_SEARCH", 128))
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", 16))
+# ANN candidates fetched per requested result, rescored exactly against the vectors
+ANN_RESCORE_FACTOR = int(os.environ.get("ANN_RESCORE_FACTOR", 4))
+# Filtered queries with at most this many candidate rows skip the ANN index and are scored exactly
+ANN_EXACT_MAX_ROWS = int(os.environ.get("ANN_EXACT_MAX_ROWS", 20_000))
+
+# BM25 term frequency saturation and length normalization of the sparse index
+BM25_K1 = float(os.environ.get("BM25_K1", 1.2))
+BM25_B = float(os.environ.get("BM25_B", 0.75))
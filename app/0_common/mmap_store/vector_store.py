@@ -0,0 +1,307 @@
+import copy
+import json
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+from llama_index.schema import BaseNode
+from llama_index.vector_stores.types import (
+    VectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.vector_stores.utils import node_to_metadata_dict
+
+from .search import MetadataColumns, filter_mask, normalize, top_k
+from .variables import ANN_EXACT_MAX_ROWS, ANN_RESCORE_FACTOR
+
+VECTORS_FNAME = "vectors.npy"
+NORMS_FNAME = "vector_norms.npy"
+IDS_FNAME = "vector_ids.json"
+ANN_FNAME = "ann.faiss"
+ANN_INFO_FNAME = "ann.json"
+
+
+def _atomic_save(path: str, write):
+    """
+    Writes through a temporary file, processes mapping the previous file keep reading it untouched
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Vector store persisted as a contiguous matrix of normalized float32 rows (vectors.npy) with their original
+    norms, and the node IDs, ref doc IDs and metadata of the rows (vector_ids.json).
+
+    The matrix is memory-mapped read-only on load, so nothing is parsed and the pages are shared by every
+    process mapping the same file. Queries are a single matrix-vector product with an argpartition top-k,
+    metadata filters are turned into boolean masks before scoring. When an ANN index was built over the rows
+    (ann.faiss), queries rescore its candidates instead of scanning the matrix. Added nodes are kept in memory
+    and deleted rows are masked until the store is persisted again.
+    """
+
+    stores_text: bool = False
+    is_embedding_query: bool = True
+
+    def __init__(
+        self,
+        vectors: Optional[np.ndarray] = None,
+        norms: Optional[np.ndarray] = None,
+        node_ids: Optional[List[str]] = None,
+        ref_doc_ids: Optional[List[Optional[str]]] = None,
+        metadata: Optional[List[Dict]] = None,
+    ) -> None:
+        """
+        :param vectors: Normalized rows
+        :param norms: Norms of the rows before normalization
+        """
+        self._vectors = vectors if vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        self._norms = norms if norms is not None else np.ones(len(self._vectors), dtype=np.float32)
+        self._node_ids = node_ids or []
+        self._ref_doc_ids = ref_doc_ids or [None] * len(self._node_ids)
+        self._metadata = metadata or [{} for _ in self._node_ids]
+        self._rows = {node_id: row for row, node_id in enumerate(self._node_ids)}
+        self._ref_doc_rows: Dict[Optional[str], List[int]] = {}
+        for row, ref_doc_id in enumerate(self._ref_doc_ids):
+            self._ref_doc_rows.setdefault(ref_doc_id, []).append(row)
+        self._columns = MetadataColumns(self._metadata)
+        self._deleted = np.zeros(len(self._node_ids), dtype=bool)
+        self._has_deleted = False
+        # node ID -> (embedding, ref doc ID, metadata) of the nodes added since the store was loaded
+        self._added: Dict[str, tuple] = {}
+        # AnnIndex over the persisted rows, set by from_persist_dir
+        self._ann = None
+        # BM25Index persisted next to the vectors, set by load_storage_context
+        self.sparse_index = None
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> "MmapVectorStore":
+        with open(os.path.join(persist_dir, IDS_FNAME)) as file:
+            ids = json.load(file)
+        if not ids["node_ids"]:
+            # Empty arrays can't be memory-mapped
+            return cls()
+        vectors = np.load(os.path.join(persist_dir, VECTORS_FNAME), mmap_mode="r")
+        norms = np.load(os.path.join(persist_dir, NORMS_FNAME), mmap_mode="r")
+        if not ids.get("normalized"):
+            # Persisted before the rows were stored normalized, normalized in memory until persisted again
+            vectors, norms = normalize(vectors)
+        store = cls(
+            vectors=vectors,
+            norms=norms,
+            node_ids=ids["node_ids"],
+            ref_doc_ids=ids["ref_doc_ids"],
+            metadata=ids["metadata"],
+        )
+        if ids.get("normalized") and os.path.exists(os.path.join(persist_dir, ANN_INFO_FNAME)):
+            # faiss is only needed by the services querying indices built with an ANN index
+            from .ann import AnnIndex
+
+            store._ann = AnnIndex.load(persist_dir, store._node_ids)
+        return store
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MmapVectorStore":
+        """
+        Converts the data of a SimpleVectorStore, as returned by its to_dict()
+        """
+        node_ids = list(data["embedding_dict"])
+        if not node_ids:
+            return cls()
+        vectors, norms = normalize([data["embedding_dict"][node_id] for node_id in node_ids])
+        return cls(
+            vectors=vectors,
+            norms=norms,
+            node_ids=node_ids,
+            ref_doc_ids=[data["text_id_to_ref_doc_id"].get(node_id) for node_id in node_ids],
+            metadata=[data.get("metadata_dict", {}).get(node_id, {}) for node_id in node_ids],
+        )
+
+    def overlay(self) -> "MmapVectorStore":
+        """
+        :return: A store over the same persisted rows whose added and deleted nodes are its own, so that a
+        request can insert into a shared store without the other users of the store seeing its nodes
+        """
+        store = copy.copy(self)
+        store._deleted = self._deleted.copy()
+        store._added = dict(self._added)
+        return store
+
+    @property
+    def client(self) -> None:
+        return None
+
+    def __len__(self) -> int:
+        return int(len(self._node_ids) - self._deleted.sum()) + len(self._added)
+
+    def get(self, node_id: str) -> List[float]:
+        if node_id in self._added:
+            return self._added[node_id][0].tolist()
+        row = self._rows.get(node_id)
+        if row is None or self._deleted[row]:
+            raise KeyError(f"Node {node_id} not found")
+        return (self._vectors[row] * self._norms[row]).tolist()
+
+    def metadata_values(self, key: str) -> Set:
+        """
+        :return: Distinct values of a metadata key over the nodes of the store, e.g. the years of its
+        documents
+        """
+        values = set(self._columns.values(key, ~self._deleted if self._has_deleted else None))
+        for _, _, metadata in self._added.values():
+            value = metadata.get(key)
+            if value is not None and not isinstance(value, (list, dict)):
+                values.add(value)
+        return values
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        for node in nodes:
+            metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+            metadata.pop("_node_content", None)
+            if node.node_id in self._rows:
+                self._deleted[self._rows[node.node_id]] = True
+                self._has_deleted = True
+            embedding = np.asarray(node.get_embedding(), dtype=np.float32)
+            self._added[node.node_id] = (embedding, node.ref_doc_id, metadata)
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        rows = self._ref_doc_rows.get(ref_doc_id, [])
+        self._deleted[rows] = True
+        self._has_deleted = self._has_deleted or bool(rows)
+        self._added = {
+            node_id: added for node_id, added in self._added.items() if added[1] != ref_doc_id
+        }
+
+    def _base_mask(self, query: VectorStoreQuery) -> Optional[np.ndarray]:
+        """
+        :return: Candidate rows of the persisted matrix, None when every row is a candidate
+        """
+        masks = []
+        if self._has_deleted:
+            masks.append(~self._deleted)
+        if query.node_ids is not None:
+            mask = np.zeros(len(self._node_ids), dtype=bool)
+            mask[[self._rows[node_id] for node_id in query.node_ids if node_id in self._rows]] = True
+            masks.append(mask)
+        if query.doc_ids is not None:
+            mask = np.zeros(len(self._node_ids), dtype=bool)
+            for ref_doc_id in query.doc_ids:
+                mask[self._ref_doc_rows.get(ref_doc_id, [])] = True
+            masks.append(mask)
+        if query.filters is not None:
+            mask = self._columns.mask(query.filters)
+            if mask is None:
+                mask = filter_mask(query.filters, self._metadata)
+            masks.append(mask)
+        return np.logical_and.reduce(masks) if masks else None
+
+    def _added_mask(self, query: VectorStoreQuery, node_ids, ref_doc_ids, metadata) -> np.ndarray:
+        # The overlay only holds the nodes added since the load, it is filtered row by row
+        mask = np.ones(len(node_ids), dtype=bool)
+        if query.node_ids is not None:
+            allowed = set(query.node_ids)
+            mask &= np.fromiter((node_id in allowed for node_id in node_ids), dtype=bool, count=len(node_ids))
+        if query.doc_ids is not None:
+            allowed = set(query.doc_ids)
+            mask &= np.fromiter((ref in allowed for ref in ref_doc_ids), dtype=bool, count=len(ref_doc_ids))
+        if query.filters is not None:
+            mask &= filter_mask(query.filters, metadata)
+        return mask
+
+    def _search(
+        self, query_embedding: np.ndarray, k: int, mask: Optional[np.ndarray], exact: bool, **ann_kwargs: Any
+    ):
+        # The ANN index only pays off when the mask leaves many candidates
+        candidates = None if mask is None else int(mask.sum())
+        if self._ann is None or exact or (candidates is not None and candidates <= ANN_EXACT_MAX_ROWS):
+            return top_k(self._vectors, query_embedding, k, mask)
+
+        rows, _ = self._ann.search(query_embedding, k * ANN_RESCORE_FACTOR, mask, **ann_kwargs)
+        rows = np.sort(rows)
+        top, scores = top_k(self._vectors[rows], query_embedding, k)
+        return rows[top], scores
+
+    def query(
+        self,
+        query: VectorStoreQuery,
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+        **kwargs: Any,
+    ) -> VectorStoreQueryResult:
+        """
+        :param ef_search: HNSW search effort, ANN_EF_SEARCH when None
+        :param nprobe: IVF lists visited, ANN_NPROBE when None
+        :param exact: Scan the matrix even when an ANN index is loaded
+        """
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Query mode {query.mode} is not supported by MmapVectorStore")
+
+        query_embedding = np.asarray(query.query_embedding, dtype=np.float32)
+        query_embedding = query_embedding / max(float(np.linalg.norm(query_embedding)), 1e-12)
+        k = query.similarity_top_k
+        rows, scores = self._search(
+            query_embedding, k, self._base_mask(query), exact, ef_search=ef_search, nprobe=nprobe
+        )
+        results = list(zip(scores.tolist(), [self._node_ids[row] for row in rows]))
+        if self._added:
+            added_ids = list(self._added)
+            embeddings, ref_doc_ids, metadata = zip(*self._added.values())
+            vectors, _ = normalize(np.stack(embeddings))
+            mask = self._added_mask(query, added_ids, ref_doc_ids, metadata)
+            rows, scores = top_k(vectors, query_embedding, k, mask)
+            results += zip(scores.tolist(), [added_ids[row] for row in rows])
+            results = sorted(results, key=lambda result: result[0], reverse=True)[:k]
+        return VectorStoreQueryResult(
+            similarities=[score for score, _ in results], ids=[node_id for _, node_id in results]
+        )
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """
+        Writes the store next to persist_path, merging the added nodes and dropping the deleted rows
+        :param persist_path: Any path in the persist directory, StorageContext passes the JSON store path
+        """
+        persist_dir = os.path.dirname(persist_path)
+        os.makedirs(persist_dir, exist_ok=True)
+        kept = np.flatnonzero(~self._deleted)
+        node_ids = [self._node_ids[row] for row in kept]
+        ref_doc_ids = [self._ref_doc_ids[row] for row in kept]
+        metadata = [self._metadata[row] for row in kept]
+        vectors, norms = self._vectors[kept], self._norms[kept]
+        if self._added:
+            embeddings, added_ref_doc_ids, added_metadata = zip(*self._added.values())
+            added_vectors, added_norms = normalize(np.stack(embeddings))
+            vectors = np.concatenate([vectors, added_vectors]) if len(kept) else added_vectors
+            norms = np.concatenate([norms, added_norms])
+            node_ids += list(self._added)
+            ref_doc_ids += list(added_ref_doc_ids)
+            metadata += list(added_metadata)
+
+        _atomic_save(os.path.join(persist_dir, VECTORS_FNAME), lambda path: _save_npy(path, vectors))
+        _atomic_save(os.path.join(persist_dir, NORMS_FNAME), lambda path: _save_npy(path, norms))
+        ids = {"node_ids": node_ids, "ref_doc_ids": ref_doc_ids, "metadata": metadata, "normalized": True}
+        _atomic_save(os.path.join(persist_dir, IDS_FNAME), lambda path: _save_json(path, ids))
+        # An ANN index of the previous rows is ignored on load, build_ann_index builds one for the new rows
+        for fname in [ANN_INFO_FNAME, ANN_FNAME]:
+            if os.path.exists(os.path.join(persist_dir, fname)):
+                os.remove(os.path.join(persist_dir, fname))
+
+
+def _save_npy(path: str, array: np.ndarray):
+    with open(path, "wb") as file:
+        np.save(file, np.ascontiguousarray(array, dtype=np.float32))
+
+
+def _save_json(path: str, data: Dict):
+    with open(path, "w") as file:
+        json.dump(data, file)
@@ -1,6 +1,9 @@
 import logging
 
+from .consumer import RabbitMQConsumer
 from .pubsub import PubSub
 from .rabbitmq import RabbitMQ
 
 logging.getLogger("pika").setLevel(logging.INFO)
+
+__all__ = ["PubSub", "RabbitMQ", "RabbitMQConsumer"]
@@ -0,0 +1,161 @@
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import pika
+from pika.spec import Basic, BasicProperties
+
+from . import variables as vars
+
+RETRY_COUNT_HEADER = "x-retry-count"
+RECONNECT_DELAY = 5
+
+
+class RabbitMQConsumer:
+    """
+    Consumes a queue with N workers, each with its own connection and channel.
+
+    Messages are acknowledged only once the callback returns. A failing message is acked and republished to
+    `<queue>.retry`, whose TTL dead-letters it back onto the queue, until it has failed `max_retries` times
+    and is parked on `<queue>.dead`. Both queues hang off the `<queue>.dlx` exchange, the main queue keeps
+    its existing arguments.
+    """
+
+    def __init__(
+        self,
+        queue_name: str,
+        callback: Callable,
+        workers: int = vars.RABBITMQ_WORKERS,
+        prefetch: int = vars.RABBITMQ_PREFETCH,
+        max_retries: int = vars.RABBITMQ_MAX_RETRIES,
+        retry_delay_ms: int = vars.RABBITMQ_RETRY_DELAY_MS,
+        on_dead_letter: Optional[Callable[[bytes, Exception], None]] = None,
+    ) -> None:
+        """
+        :param queue_name: Queue to consume
+        :param callback: Called as callback(channel, method, properties, body), raises to reject the message
+        :param workers: Number of concurrent workers
+        :param prefetch: Unacknowledged messages buffered by each worker
+        :param max_retries: Retries before a message is dead-lettered
+        :param retry_delay_ms: Delay before a failed message is redelivered
+        :param on_dead_letter: Called with the body and the last error when a message is dead-lettered
+        """
+        self.queue_name = queue_name
+        self.callback = callback
+        self.workers = workers
+        self.prefetch = prefetch
+        self.max_retries = max_retries
+        self.retry_delay_ms = retry_delay_ms
+        self.on_dead_letter = on_dead_letter
+        self.dlx_name = f"{queue_name}.dlx"
+        self.retry_queue = f"{queue_name}.retry"
+        self.dead_queue = f"{queue_name}.dead"
+
+    def _connect(self):
+        credentials = pika.PlainCredentials(vars.RABBITMQ_USERNAME, vars.RABBITMQ_PASSWORD)
+        connection = pika.BlockingConnection(
+            pika.ConnectionParameters(vars.RABBITMQ_HOST, vars.RABBITMQ_PORT, "/", credentials)
+        )
+        channel = connection.channel()
+        channel.queue_declare(queue=self.queue_name, durable=True)
+        channel.exchange_declare(exchange=self.dlx_name, exchange_type="direct", durable=True)
+        channel.queue_declare(
+            queue=self.retry_queue,
+            durable=True,
+            arguments={
+                "x-message-ttl": self.retry_delay_ms,
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": self.queue_name,
+            },
+        )
+        channel.queue_declare(queue=self.dead_queue, durable=True)
+        channel.queue_bind(queue=self.retry_queue, exchange=self.dlx_name, routing_key="retry")
+        channel.queue_bind(queue=self.dead_queue, exchange=self.dlx_name, routing_key="dead")
+        channel.basic_qos(prefetch_count=self.prefetch)
+        return connection, channel
+
+    def _settle(self, channel, method: Basic.Deliver, properties: BasicProperties, body: bytes, exc):
+        # Runs on the connection thread, pika channels must not be used from other threads
+        if exc is not None:
+            headers = dict(properties.headers or {})
+            retries = headers.get(RETRY_COUNT_HEADER, 0)
+            headers[RETRY_COUNT_HEADER] = retries + 1
+            routing_key = "retry" if retries < self.max_retries else "dead"
+            channel.basic_publish(
+                exchange=self.dlx_name,
+                routing_key=routing_key,
+                body=body,
+                properties=BasicProperties(headers=headers, delivery_mode=2),
+            )
+            print(
+                f"Message from {self.queue_name} failed ({retries + 1} attempts), "
+                f"sent to {routing_key}: {exc}"
+            )
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+    def _process(self, connection, channel, method, properties, body):
+        exc = None
+        try:
+            self.callback(channel, method, properties, body)
+        except Exception as error:
+            exc = error
+            retries = (properties.headers or {}).get(RETRY_COUNT_HEADER, 0)
+            if retries >= self.max_retries and self.on_dead_letter is not None:
+                try:
+                    self.on_dead_letter(body, exc)
+                except Exception as dead_letter_error:
+                    print(
+                        f"Dead letter callback failed for a message from {self.queue_name}: "
+                        f"{dead_letter_error!r}"
+                    )
+        finally:
+            # Every delivery is settled whatever the callbacks do, an unsettled one stalls the worker
+            try:
+                connection.add_callback_threadsafe(
+                    functools.partial(self._settle, channel, method, properties, body, exc)
+                )
+            except pika.exceptions.ConnectionWrongStateError:
+                # The connection dropped while processing, the broker redelivers the message
+                print(f"Connection closed before settling a message from {self.queue_name}")
+
+    def _work(self, worker_id: int):
+        # Messages are processed off the connection thread so that heartbeats keep flowing while a long
+        # message is being handled. The executor outlives the connections of the worker.
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.queue_name}-{worker_id}")
+        while True:
+            connection = None
+            try:
+                connection, channel = self._connect()
+
+                def on_message(channel, method, properties, body, connection=connection):
+                    executor.submit(self._process, connection, channel, method, properties, body)
+
+                channel.basic_consume(queue=self.queue_name, on_message_callback=on_message, auto_ack=False)
+                print(f"Worker {worker_id} listening for messages on queue {self.queue_name}")
+                channel.start_consuming()
+            except pika.exceptions.AMQPError as exc:
+                # Unacknowledged messages are redelivered by the broker
+                print(f"Worker {worker_id} lost its connection to {self.queue_name}: {exc!r}")
+                if connection is not None and connection.is_open:
+                    try:
+                        connection.close()
+                    except pika.exceptions.AMQPError:
+                        pass
+                time.sleep(RECONNECT_DELAY)
+
+    def start(self):
+        """
+        Starts the workers and blocks while they consume
+        """
+        threads = [
+            threading.Thread(
+                target=self._work, args=(worker_id,), name=f"{self.queue_name}-consumer-{worker_id}"
+            )
+            for worker_id in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
@@ -18,3 +18,9 @@ try:
     RABBITMQ_PASSWORD = os.environ.get("RABBITMQ_PASSWORD")
 except KeyError as exc:
     raise EnvironmentError(f"Missing environment variable: {exc}")
+
+# Worker mode of RabbitMQConsumer
+RABBITMQ_WORKERS = int(os.environ.get("RABBITMQ_WORKERS", 2))
+RABBITMQ_PREFETCH = int(os.environ.get("RABBITMQ_PREFETCH", 1))
+RABBITMQ_MAX_RETRIES = int(os.environ.get("RABBITMQ_MAX_RETRIES", 3))
+RABBITMQ_RETRY_DELAY_MS = int(os.environ.get("RABBITMQ_RETRY_DELAY_MS", 30000))
@@ -1,12 +1,20 @@
 import os
-from typing import Optional
+from functools import partial
+from typing import BinaryIO, Dict, Optional, Tuple
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import boto3.session
 
 from . import variables as vars
+from .blob_cache import get_blob_cache
 from .storage import Storage
+from .transfer import HashingReader, get_transfer_engine
+
+# Maximum number of keys accepted by a single DeleteObjects request
+DELETE_BATCH_SIZE = 1000
 
 
 class AWS(Storage):
@@ -16,9 +24,18 @@ class AWS(Storage):
             aws_access_key_id=vars.CREDENTIALS["ACCESS_KEY"],
             aws_secret_access_key=vars.CREDENTIALS["SECRET_KEY"]
             )
-        self.resource = self.session.resource('s3')
+        # The instance is shared by the whole process, size its pool for the concurrent transfers
+        config = Config(max_pool_connections=vars.TRANSFER_WORKERS)
+        self.resource = self.session.resource('s3', config=config)
         self.bucket_name = bucket
         self.bucket = self.resource.Bucket(self.bucket_name)
+        # Unlike resources, clients are thread safe and can be shared by the transfer workers
+        self.client = self.session.client('s3', config=config)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=vars.TRANSFER_CHUNK_SIZE, multipart_chunksize=vars.TRANSFER_CHUNK_SIZE
+        )
+        self.transfers = get_transfer_engine()
+        self.cache = get_blob_cache()
 
     def exists(self, remote_path: str):
         error = None
@@ -40,21 +57,52 @@ class AWS(Storage):
 
         return True
 
-    def download_file(self, remote_path: str, local_path: str):
-        assert self.exists_or_raise(remote_path)
+    def _download_object(self, remote_path: str, local_path: str, e_tag: Optional[str] = None):
+        def download(path):
+            self.client.download_file(self.bucket_name, remote_path, path, Config=self.transfer_config)
+
+        if self.cache is None:
+            download(local_path)
+            return os.path.getsize(local_path)
 
-        self.bucket.download_file(remote_path, local_path)
+        if e_tag is None:
+            # The ETag is needed to address the cache, a missing object fails here with a 404
+            e_tag = self.client.head_object(Bucket=self.bucket_name, Key=remote_path)["ETag"].strip('"')
+        return self.cache.fetch(e_tag, local_path, download)
+
+    def download_file(self, remote_path: str, local_path: str):
+        # Without the cache a missing object surfaces as a 404 on download, avoiding a HEAD request upfront
+        try:
+            return self._download_object(remote_path, local_path)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ("404", "NoSuchKey"):
+                raise FileNotFoundError(f"AWS Path: {remote_path} not found")
+            raise
 
     def upload_file(self, local_path: str, remote_path: str):
-        self.bucket.upload_file(local_path, remote_path)
+        self.client.upload_file(local_path, self.bucket_name, remote_path, Config=self.transfer_config)
+        return os.path.getsize(local_path)
+
+    def upload_file_from_stream(self, fileobj: BinaryIO, remote_path: str) -> Tuple[str, int]:
+        reader = HashingReader(fileobj)
+        # Non-seekable streams are read sequentially, one multipart chunk at a time
+        self.transfers.measure(
+            "upload",
+            remote_path,
+            lambda: self.client.upload_fileobj(
+                reader, self.bucket_name, remote_path, Config=self.transfer_config
+            )
+            or reader.size,
+        )
+        return reader.hexdigest(), reader.size
 
     def upload_file_from_memory(self, data: bytes, remote_path: str):
-        self.resource.Object(self.bucket_namebucket, remote_path).put(Body=data)
+        self.resource.Object(self.bucket_name, remote_path).put(Body=data)
 
 
     def delete_file(self, remote_path: str):
-        if self.exists(remote_path):
-             self.resource.Object(self.bucket_name, remote_path).delete()
+        # DeleteObject succeeds for missing keys
+        self.client.delete_object(Bucket=self.bucket_name, Key=remote_path)
 
     def list_files(self, prefix: Optional[str] = '', only_file_names=True):
         objects = self.bucket.objects.filter(Prefix=prefix)
@@ -68,24 +116,50 @@ class AWS(Storage):
 
         return blobs
 
+    def get_files_metadata(self, prefix: str) -> Dict[str, Dict]:
+        return {
+            obj.key: {"hash": obj.e_tag.strip('"'), "size": obj.size}
+            for obj in self.bucket.objects.filter(Prefix=prefix)
+            if not obj.key.endswith('/')
+        }
+
     def download_folder(self, remote_path: str, local_path: str):
-        blobs = self.list_files(prefix=remote_path, only_file_names=True)
+        objects = self.get_files_metadata(prefix=remote_path)
 
         if not os.path.exists(local_path):
             os.mkdir(local_path)
 
-        for blob in blobs:
-            file_path = os.path.join(local_path, os.path.basename(blob))
-            self.download_file(remote_path, file_path)
+        self.transfers.run(
+            "download",
+            {
+                # Listed objects carry their ETag, cached ones cost no further request
+                key: lambda key=key, e_tag=metadata["hash"]: self._download_object(
+                    key, os.path.join(local_path, os.path.basename(key)), e_tag
+                )
+                for key, metadata in objects.items()
+            },
+        )
 
     def upload_folder(self, local_path: str, remote_path: str):
+        uploads = {}
         for root, _, files in os.walk(local_path):
             for file in files:
                 local_file_path = os.path.join(root, file)
                 remote_file_path = os.path.join(remote_path, file)
-                self.upload_file(local_file_path, remote_file_path)
+                uploads[remote_file_path] = partial(self.upload_file, local_file_path, remote_file_path)
+        self.transfers.run("upload", uploads)
 
     def delete_folder(self, remote_path: str):
-        blobs = self.list_files(prefix=remote_path, only_file_names=False)
-        for blob in blobs:
-            self.delete_file(blob)
\ No newline at end of file
+        keys = self.list_files(prefix=remote_path, only_file_names=False)
+        self.transfers.run(
+            "delete",
+            {
+                keys[i]: lambda batch=keys[i : i + DELETE_BATCH_SIZE]: self._delete_batch(batch)
+                for i in range(0, len(keys), DELETE_BATCH_SIZE)
+            },
+        )
+
+    def _delete_batch(self, keys):
+        self.client.delete_objects(
+            Bucket=self.bucket_name, Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+        )
\ No newline at end of file
@@ -0,0 +1,150 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from logger import create_logger
+
+from . import variables as vars
+
+_logger = create_logger("storage:blob_cache")
+
+# Hex digits of the blob key naming its lock file, bounds the lock files to 16**3 whatever the blobs fetched
+LOCK_KEY_DIGITS = 3
+
+
+@contextmanager
+def _file_lock(path: str, blocking: bool = True):
+    """
+    Exclusive advisory lock shared by every process on the host, yields whether it was acquired
+    """
+    with open(path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class BlobCache:
+    """
+    On-disk read-through cache of downloaded blobs, addressed by their content version
+    (GCS md5 hash or generation, S3 ETag) and shared by every process on the host.
+
+    Blobs are downloaded to a temporary file and installed with an atomic rename, so a reader never sees
+    a partial blob. Per-blob file locks make concurrent processes wait for a single download, and the least
+    recently used blobs are evicted once the cache grows over `max_bytes`. Locks are striped over a bounded
+    number of lock files, so they don't pile up with every blob version ever fetched.
+    """
+
+    def __init__(self, root: str, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.blobs_dir = os.path.join(root, "blobs")
+        self.locks_dir = os.path.join(root, "locks")
+        self.tmp_dir = os.path.join(root, "tmp")
+        for directory in (self.blobs_dir, self.locks_dir, self.tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(version: str) -> str:
+        return hashlib.sha256(version.encode()).hexdigest()
+
+    def _blob_path(self, key: str) -> str:
+        return os.path.join(self.blobs_dir, key)
+
+    def _lock_path(self, key: str) -> str:
+        # Blobs sharing a bucket only wait for each other. Lock files are never removed, a process may be
+        # waiting on the one being removed while another creates and locks a new one.
+        return os.path.join(self.locks_dir, f"{key[:LOCK_KEY_DIGITS]}.lock")
+
+    def fetch(self, version: str, local_path: str, download: Callable[[str], None]) -> int:
+        """
+        Copies the blob with the given version to local_path, downloading it into the cache on a miss
+        :param version: Content version of the blob, e.g. its md5 hash or ETag
+        :param local_path: Destination path
+        :param download: Downloads the blob to the path it is given
+        :return: Size of the blob in bytes
+        """
+        key = self._key(version)
+        blob_path = self._blob_path(key)
+        downloaded = False
+        with _file_lock(self._lock_path(key)):
+            if os.path.exists(blob_path):
+                self.hits += 1
+                # Refreshes the access time used for LRU eviction, regardless of the mount options
+                os.utime(blob_path)
+            else:
+                self.misses += 1
+                tmp_path = os.path.join(self.tmp_dir, f"{key}.{uuid.uuid4().hex}")
+                try:
+                    download(tmp_path)
+                    os.replace(tmp_path, blob_path)
+                    downloaded = True
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            # Callers own and may modify local_path, it must not share an inode with the cached blob
+            shutil.copyfile(blob_path, local_path)
+            size = os.path.getsize(blob_path)
+
+        if downloaded:
+            self.evict()
+        return size
+
+    def evict(self):
+        """
+        Removes the least recently used blobs until the cache fits in max_bytes
+        """
+        with _file_lock(os.path.join(self.root, "evict.lock"), blocking=False) as acquired:
+            if not acquired:
+                return
+
+            entries = []
+            with os.scandir(self.blobs_dir) as blobs:
+                for entry in blobs:
+                    stat = entry.stat()
+                    entries.append((stat.st_atime, stat.st_size, entry.name))
+            total = sum(size for _, size, _ in entries)
+
+            for _, size, key in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                # Skips blobs that are being read or written
+                with _file_lock(self._lock_path(key), blocking=False) as acquired:
+                    if acquired and os.path.exists(self._blob_path(key)):
+                        os.remove(self._blob_path(key))
+                        total -= size
+                        self.evictions += 1
+            _logger.debug(f"Blob cache size after eviction: {total} bytes")
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+_cache: Optional[BlobCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_blob_cache() -> Optional[BlobCache]:
+    """
+    Returns the process-wide blob cache, or None when BLOB_CACHE_MAX_BYTES is 0
+    """
+    global _cache
+    if vars.BLOB_CACHE_MAX_BYTES <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = BlobCache(vars.BLOB_CACHE_DIR, vars.BLOB_CACHE_MAX_BYTES)
+        return _cache
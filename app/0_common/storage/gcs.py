@@ -1,17 +1,33 @@
 import os
-from typing import Optional
+import threading
+from functools import partial
+from typing import BinaryIO, Dict, Optional, Tuple
 
 from google.cloud import storage
+from requests.adapters import HTTPAdapter
+from google.cloud.exceptions import NotFound
 
 from . import variables as vars
+from .blob_cache import get_blob_cache
 from .storage import Storage
+from .transfer import HashingReader, get_transfer_engine
+
+# Maximum number of calls in a single GCS batch request
+DELETE_BATCH_SIZE = 100
 
 
 class GCS(Storage):
     def __init__(self, bucket) -> None:
         self.bucket_name = bucket
         self.client = storage.Client.from_service_account_info(vars.CREDENTIALS)
+        # The instance is shared by the whole process, size its pool for the concurrent transfers
+        adapter = HTTPAdapter(pool_connections=vars.TRANSFER_WORKERS, pool_maxsize=vars.TRANSFER_WORKERS)
+        self.client._http.mount("https://", adapter)
         self.bucket = storage.Client.bucket(self.client, self.bucket_name)
+        self.transfers = get_transfer_engine()
+        self.cache = get_blob_cache()
+        self._batch_client = None
+        self._batch_lock = threading.Lock()
 
     def exists(self, remote_path: str):
         return self.bucket.get_blob(remote_path) is not None
@@ -22,14 +38,41 @@ class GCS(Storage):
 
         return True
 
-    def download_file(self, remote_path: str, local_path: str):
-        assert self.exists_or_raise(remote_path)
+    def _download_blob(self, blob, local_path: str):
+        blob.chunk_size = vars.TRANSFER_CHUNK_SIZE
+        if self.cache is None:
+            blob.download_to_filename(local_path)
+            return os.path.getsize(local_path)
 
-        blob = self.bucket.blob(remote_path)
-        blob.download_to_filename(local_path)
+        # Composite objects have no md5 hash, their generation changes whenever they are rewritten
+        version = blob.md5_hash or f"{self.bucket_name}/{blob.name}#{blob.generation}"
+        return self.cache.fetch(version, local_path, blob.download_to_filename)
+
+    def download_file(self, remote_path: str, local_path: str):
+        if self.cache is not None:
+            # The metadata is needed to address the cache, and tells whether the blob exists
+            blob = self.bucket.get_blob(remote_path)
+            if blob is None:
+                raise FileNotFoundError(f"GCS Path: {remote_path} not found")
+            return self._download_blob(blob, local_path)
+
+        # A missing blob surfaces as NotFound on download, avoiding a metadata round trip upfront
+        try:
+            return self._download_blob(self.bucket.blob(remote_path), local_path)
+        except NotFound:
+            raise FileNotFoundError(f"GCS Path: {remote_path} not found")
 
     def upload_file(self, local_path: str, remote_path: str):
-        self.bucket.blob(remote_path).upload_from_filename(local_path)
+        # Files larger than the chunk size are sent as resumable uploads
+        self.bucket.blob(remote_path, chunk_size=vars.TRANSFER_CHUNK_SIZE).upload_from_filename(local_path)
+        return os.path.getsize(local_path)
+
+    def upload_file_from_stream(self, fileobj: BinaryIO, remote_path: str) -> Tuple[str, int]:
+        reader = HashingReader(fileobj)
+        # With a chunk size, streams of unknown size are sent as a resumable upload, one chunk at a time
+        blob = self.bucket.blob(remote_path, chunk_size=vars.TRANSFER_CHUNK_SIZE)
+        self.transfers.measure("upload", remote_path, lambda: blob.upload_from_file(reader) or reader.size)
+        return reader.hexdigest(), reader.size
 
     def upload_file_from_memory(self, data: bytes, remote_path: str):
         blob = self.bucket.blob(remote_path)
@@ -47,24 +90,51 @@ class GCS(Storage):
 
         return blobs
 
+    def get_files_metadata(self, prefix: str) -> Dict[str, Dict]:
+        return {
+            blob.name: {"hash": blob.md5_hash or blob.crc32c, "size": blob.size}
+            for blob in self.list_files(prefix=prefix, only_file_names=False)
+        }
+
     def download_folder(self, remote_path: str, local_path: str):
         blobs = self.list_files(prefix=remote_path, only_file_names=False)
 
         if not os.path.exists(local_path):
             os.mkdir(local_path)
 
-        for blob in blobs:
-            file_path = os.path.join(local_path, os.path.basename(blob.name))
-            blob.download_to_filename(file_path)
+        self.transfers.run(
+            "download",
+            {
+                # Listed blobs carry their metadata, cached ones cost no further request
+                blob.name: lambda blob=blob: self._download_blob(
+                    blob, os.path.join(local_path, os.path.basename(blob.name))
+                )
+                for blob in blobs
+            },
+        )
 
     def upload_folder(self, local_path: str, remote_path: str):
+        uploads = {}
         for root, _, files in os.walk(local_path):
             for file in files:
                 local_file_path = os.path.join(root, file)
                 remote_file_path = os.path.join(remote_path, file)
-                self.upload_file(local_file_path, remote_file_path)
+                uploads[remote_file_path] = partial(self.upload_file, local_file_path, remote_file_path)
+        self.transfers.run("upload", uploads)
 
     def delete_folder(self, remote_path: str):
-        blobs = self.list_files(prefix=remote_path, only_file_names=False)
-        for blob in blobs:
-            blob.delete()
+        names = self.list_files(prefix=remote_path)
+        # An active batch captures every call made through its client, whichever thread makes it.
+        # Batches therefore go through a dedicated client, one at a time.
+        with self._batch_lock:
+            if self._batch_client is None:
+                self._batch_client = storage.Client.from_service_account_info(vars.CREDENTIALS)
+            bucket = self._batch_client.bucket(self.bucket_name)
+            for i in range(0, len(names), DELETE_BATCH_SIZE):
+                batch = names[i : i + DELETE_BATCH_SIZE]
+                self.transfers.measure("delete", batch[0], lambda: self._delete_batch(bucket, batch))
+
+    def _delete_batch(self, bucket, names):
+        with self._batch_client.batch():
+            for name in names:
+                bucket.blob(name).delete()
@@ -1,7 +1,26 @@
-from abc import ABC, abstractmethod
+import threading
+from abc import ABCMeta, abstractmethod
+from typing import BinaryIO, Dict, Tuple
 
 
-class Storage(ABC):
+class StorageRegistry(ABCMeta):
+    """
+    Makes `Storage(bucket)` return one instance per backend and bucket for the whole process,
+    so that authentication and the HTTP connection pool are set up only once.
+    """
+
+    _instances: Dict[Tuple[type, str], "Storage"] = {}
+    _lock = threading.Lock()
+
+    def __call__(cls, bucket: str):
+        key = (cls, bucket)
+        with StorageRegistry._lock:
+            if key not in StorageRegistry._instances:
+                StorageRegistry._instances[key] = super().__call__(bucket)
+            return StorageRegistry._instances[key]
+
+
+class Storage(metaclass=StorageRegistry):
     @abstractmethod
     def download_file(self, remote_path: str, local_path: str):
         pass
@@ -14,6 +33,14 @@ class Storage(ABC):
     def upload_file(self, local_path: str, remote_path: str):
         pass
 
+    @abstractmethod
+    def upload_file_from_stream(self, fileobj: BinaryIO, remote_path: str) -> Tuple[str, int]:
+        """
+        Uploads the file object in chunks, without reading it into memory
+        :return: Hex SHA-256 and size of the uploaded contents
+        """
+        pass
+
     @abstractmethod
     def delete_file(self, remote_path: str):
         pass
@@ -22,6 +49,14 @@ class Storage(ABC):
     def list_files(self, prefix: str, only_file_names=True):
         pass
 
+    @abstractmethod
+    def get_files_metadata(self, prefix: str) -> Dict[str, Dict]:
+        """
+        Returns the content hash and size of every file under the prefix without downloading them
+        :return: {remote path: {"hash": str, "size": int}}
+        """
+        pass
+
     @abstractmethod
     def download_folder(self, remote_path: str, local_path: str):
         pass
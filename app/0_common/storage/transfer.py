@@ -0,0 +1,116 @@
+import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+from logger import create_logger
+
+from . import variables as vars
+
+_logger = create_logger("storage:transfer")
+
+
+@dataclass
+class TransferStats:
+    operation: str
+    path: str
+    bytes: int
+    seconds: float
+
+
+class HashingReader:
+    """
+    Read-only, non-seekable view of a file object computing the SHA-256 of the bytes read through it,
+    so that an upload can be hashed while it is streamed.
+    """
+
+    def __init__(self, fileobj: BinaryIO) -> None:
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
+
+    def tell(self) -> int:
+        return self.size
+
+    def hexdigest(self) -> str:
+        return self.digest.hexdigest()
+
+
+class TransferEngine:
+    """
+    Runs blob transfers of a folder concurrently on a shared worker pool and records their metrics.
+    """
+
+    def __init__(self, max_workers: int = vars.TRANSFER_WORKERS) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage-transfer")
+        self.recent: deque = deque(maxlen=256)
+        self.totals: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _record(self, stats: TransferStats):
+        with self._lock:
+            self.recent.append(stats)
+            totals = self.totals.setdefault(stats.operation, {"count": 0, "bytes": 0, "seconds": 0.0})
+            totals["count"] += 1
+            totals["bytes"] += stats.bytes
+            totals["seconds"] += stats.seconds
+
+    def measure(self, operation: str, path: str, transfer: Callable[[], Optional[int]]) -> TransferStats:
+        """
+        Runs a single transfer on the calling thread and records its metrics
+        """
+        start = time.perf_counter()
+        size = transfer() or 0
+        stats = TransferStats(operation, path, size, time.perf_counter() - start)
+        self._record(stats)
+        return stats
+
+    def run(self, operation: str, transfers: Dict[str, Callable[[], Optional[int]]]) -> List[TransferStats]:
+        """
+        Runs the transfers concurrently and waits for all of them
+        :param operation: Name of the operation, used to aggregate the metrics (e.g. "download")
+        :param transfers: Callables keyed by the path they transfer, returning the number of bytes moved
+        :return: Stats of every transfer, raises the first failure once all transfers are done
+        """
+        start = time.perf_counter()
+        futures = [self.executor.submit(self.measure, operation, path, fn) for path, fn in transfers.items()]
+        wait(futures)
+        for future in futures:
+            if future.exception() is not None:
+                raise future.exception()
+
+        results = [future.result() for future in futures]
+        if results:
+            _logger.debug(
+                f"{operation}: {len(results)} files, {sum(r.bytes for r in results)} bytes "
+                f"in {time.perf_counter() - start:.3f}s"
+            )
+        return results
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                operation: {**totals, "seconds": round(totals["seconds"], 3)}
+                for operation, totals in self.totals.items()
+            }
+
+
+_engine: Optional[TransferEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_transfer_engine() -> TransferEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = TransferEngine()
+        return _engine
@@ -33,3 +33,12 @@ try:
     CREDENTIALS = CREDENTIALS_OPTIONS[ENV]()
 except KeyError:
     raise EnvironmentError("Missing Storage variable", extra={"storage_service": ENV})
+
+# Transfer engine shared by every Storage instance of the process
+TRANSFER_WORKERS = int(os.environ.get("STORAGE_TRANSFER_WORKERS", 16))
+# Files larger than a chunk are transferred in resumable (GCS) / multipart (S3) chunks
+TRANSFER_CHUNK_SIZE = int(os.environ.get("STORAGE_TRANSFER_CHUNK_SIZE", 8 * 1024 * 1024))
+
+# On-disk cache of downloaded blobs shared by the processes of the host, 0 disables it
+BLOB_CACHE_DIR = os.environ.get("BLOB_CACHE_DIR", "/tmp/blob-cache")
+BLOB_CACHE_MAX_BYTES = int(os.environ.get("BLOB_CACHE_MAX_BYTES", 4 * 1024**3))
@@ -3,13 +3,13 @@ import json
 import os
 import time
 import uuid
-from concurrent.futures import ThreadPoolExecutor, wait
 from contextlib import asynccontextmanager
-from tempfile import SpooledTemporaryFile
 from typing import Annotated
 
 import variables as vars
 
+from attachment_proto.attachment_pb2 import Attachment
+from channel_pool import close_channel_pool, get_channel_pool, init_channel_pool
 from fastapi import (
     APIRouter,
     BackgroundTasks,
@@ -21,6 +21,7 @@ from fastapi import (
     UploadFile,
 )
 from fastapi.openapi.utils import get_openapi
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from index_builder import IndexBuilderService
 from query_engine import QueryEngineService
@@ -50,6 +51,7 @@ from response_synthesizer_api import ResponseSynthesizerService
 from starlette.background import BackgroundTask
 
 from sub_question_generator import SubQuestionGenerator
+from subquestion_pipeline import SubQuestionPipeline
 from utils import User, extract_user
 from logger import create_logger
 _logger = create_logger("backend:app")
@@ -63,7 +65,11 @@ _logger = create_logger("backend:app")
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     _logger.info("Hello")
+    # Downstream gRPC channels are created once per process and shared by all service wrappers
+    app.state.channel_pool = init_channel_pool()
+    app.state.subquestion_pipeline = SubQuestionPipeline()
     yield
+    await close_channel_pool()
 
 
 app = FastAPI(lifespan=lifespan, debug=True)
@@ -101,6 +107,11 @@ def healthcheck():
     return {"status": 200}
 
 
+@router.get("/health/channels")
+def channel_pool_metrics():
+    return get_channel_pool().metrics()
+
+
 @router.post(
     "/conversation",
     response_model=ConversationResponse,
@@ -378,25 +389,6 @@ async def post_message(
             # await prisma.message.update(where={"id": bot_message.id}, data={"text": "".join(tokens)})
             _logger.info(f"Updated message  with response from LLM: {''.join(tokens)}")
 
-    def handle_subquestion(sub_question, tool_name, record_id, attachments):
-        attachment_ids = {
-            attachment.id: attachment.document.name.rsplit(".", 1)[0] for attachment in attachments
-        }
-        index_builder.build_index(attachment_ids, tool_name, record_id)
-        answer, _citations, status = query_engine.get_answer_citations(
-            query=sub_question, params=qe_params, tool_name=tool_name, subquestion_id=record_id
-        )
-
-        if status == "SUCCESS":
-            source_nodes.extend([citation.node for citation in citations])
-            citations.extend(_citations)
-        else:
-            answer = "DISCARDED"
-
-        qa_pairs[sub_question] = answer
-        subquestion_responses[record_id] = answer
-        _logger.info(f"Sub-Question: {sub_question} ({status}) \nResponse: {answer}")
-
     # conversation = await prisma.conversation.find_unique(where={"id": id}, include={"messages": True})
     # if conversation.status == "BUSY":
     #     _logger.exception(f"Conversation: {id}|{user.username} is busy")
@@ -433,6 +425,7 @@ async def post_message(
         # Initialize services
         response_synthesizer = ResponseSynthesizerService(id=id)
         # qe_params = {k: v for k, v in conversation.parameters.items() if k.startswith("qe_")}
+        qe_params = {k: v for k, v in ParamsUpdateRequest().__dict__.items() if k.startswith("qe_")}
         rs_params = {
             "rs_k": 5,
             "rs_top_k": 5,
@@ -450,51 +443,54 @@ async def post_message(
         # Generate sub-questions
         subq_generator = SubQuestionGenerator(companies={})
         sub_questions = subq_generator.generate_subquestions(query=message.prompt)
-        sub_questions = ["Hello World"]
-        qa_pairs = {k:"" for k in sub_questions}
+        qa_pairs = {question: "" for question, _, _ in sub_questions}
         citations = []
         source_nodes = []
-        subquestion_responses = {}
-        # with ThreadPoolExecutor(max_workers=5) as executor:
-        #     results = []
-        #     for question, tool_name, record_id in sub_questions:
-        #         await prisma.subquestion.create(
+        attachments = {}
+        for question, tool_name, record_id in sub_questions:
+            # await prisma.subquestion.create(
+            #     {
+            #         "id": record_id,
+            #         "text": question,
+            #         "response": "",
+            #         "toolName": tool_name,
+            #         "messageId": bot_message.id,
+            #     }
+            # )
+            # attachments[tool_name] = await prisma.attachment.find_many(
+            #     where={"document": {"conversationId": id}, "company": {"toolName": tool_name}},
+            #     include={"document": True, "company": True},
+            # )
+            attachments.setdefault(tool_name, [])
+
+        # Each sub-question is merged as soon as its index build and answer complete
+        pipeline: SubQuestionPipeline = request.app.state.subquestion_pipeline
+        async for result in pipeline.run(id, qe_params, sub_questions, attachments, request=request):
+            if result.status == "SUCCESS":
+                source_nodes.extend([citation.node for citation in result.citations])
+                citations.extend(result.citations)
+            qa_pairs[result.question] = result.answer
+            # await prisma.subquestion.update(
+            #     where={"id": result.record_id}, data={"response": result.answer}
+            # )
+            _logger.info(f"Sub-Question: {result.question} ({result.status}) \nResponse: {result.answer}")
+
+        # try:
+        #     citations_length = await prisma.citation.create_many(
+        #         [
         #             {
-        #                 "id": record_id,
-        #                 "text": question,
-        #                 "response": "",
-        #                 "toolName": tool_name,
+        #                 "content": citation.text.replace("\x00", ""),
+        #                 "pageNumber": citation.pagenum,
+        #                 "fileName": citation.filename,
         #                 "messageId": bot_message.id,
+        #                 "documentId": citation.document_id,
         #             }
-        #         )
-        #         attachments = await prisma.attachment.find_many(
-        #             where={"document": {"conversationId": id}, "company": {"toolName": tool_name}},
-        #             include={"document": True, "company": True},
-        #         )
-        #         results.append(
-        #             executor.submit(handle_subquestion, question, tool_name, record_id, attachments)
-        #         )
-
-        #     wait(results)
-        #     try:
-        #         for record_id, answer in subquestion_responses.items():
-        #             await prisma.subquestion.update(where={"id": record_id}, data={"response": answer})
-
-        #         citations_length = await prisma.citation.create_many(
-        #             [
-        #                 {
-        #                     "content": citation.text.replace("\x00", ""),
-        #                     "pageNumber": citation.pagenum,
-        #                     "fileName": citation.filename,
-        #                     "messageId": bot_message.id,
-        #                     "documentId": citation.document_id,
-        #                 }
-        #                 for citation in citations
-        #             ]
-        #         )
-        #         _logger.info(f"Created {citations_length} citations for message {bot_message.id}")
-        #     except Exception as exc:
-        #         _logger.exception(f"Failed to store citations in the DB: {str(exc)}")
+        #             for citation in citations
+        #         ]
+        #     )
+        #     _logger.info(f"Created {citations_length} citations for message {bot_message.id}")
+        # except Exception as exc:
+        #     _logger.exception(f"Failed to store citations in the DB: {str(exc)}")
 
         final_answer = await response_synthesizer.get_final_answer(
             query=message.prompt,
@@ -556,11 +552,15 @@ async def upload_attachment(
 ):
     async def submit_attachment():
         rabbitmq = RabbitMQ(queue_name=vars.NEW_ATTACHMENT_QUEUE)
+        # Only a reference to the uploaded file is queued, the index builder streams it from storage
         message = Attachment(
             id=attachment.id,
             conversationId=id,
             fileName=file.filename,
-            fileContents=file_as_bytes,
+            bucket=vars.USER_FILES_BUCKET,
+            storagePath=remote_file_path,
+            sha256=file_hash,
+            size=file_size,
         )
 
         rabbitmq.send(message.SerializeToString())
@@ -574,7 +574,6 @@ async def upload_attachment(
 
     # Upload the file to the cloud storage
     storage = Storage(vars.USER_FILES_BUCKET)
-    file_as_bytes: SpooledTemporaryFile[bytes] = file.file.read()
     remote_file_path = f"{id}/{file.filename}"
 
     if not storage.exists(remote_path=remote_file_path):
@@ -604,7 +603,10 @@ async def upload_attachment(
             include={"document": True},
         )
 
-    storage.upload_file_from_memory(data=file_as_bytes, remote_path=remote_file_path)
+    # The spooled upload is streamed to storage in chunks and hashed on the way
+    file_hash, file_size = await run_in_threadpool(
+        storage.upload_file_from_stream, fileobj=file.file, remote_path=remote_file_path
+    )
     _logger.info(f"Uploaded attachment: {file.filename}|{attachment.id} successfully")
     # await prisma.attachment.update(where={"id": attachment.id}, data={"status": "UPLOADED"})
 
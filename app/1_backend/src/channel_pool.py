@@ -0,0 +1,276 @@
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional
+
+import grpc
+from logger import create_logger
+from variables import (
+    GRPC_CHANNEL_READY_TIMEOUT,
+    GRPC_KEEPALIVE_TIME_MS,
+    GRPC_KEEPALIVE_TIMEOUT_MS,
+)
+
+_logger = create_logger("backend:channel_pool")
+
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_TIME_MS),
+    ("grpc.keepalive_timeout_ms", GRPC_KEEPALIVE_TIMEOUT_MS),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    # Spreads calls across every address a single DNS name resolves to (e.g. headless services)
+    ("grpc.lb_policy_name", "round_robin"),
+]
+
+UNHEALTHY_STATES = (grpc.ChannelConnectivity.TRANSIENT_FAILURE, grpc.ChannelConnectivity.SHUTDOWN)
+
+
+class _MetricsInterceptor(grpc.UnaryUnaryClientInterceptor, grpc.UnaryStreamClientInterceptor):
+    """
+    Tracks the number of in-flight calls on a pooled channel.
+    """
+
+    def __init__(self, pooled_channel: "PooledChannel") -> None:
+        self.pooled_channel = pooled_channel
+
+    def _track(self, continuation, client_call_details, request):
+        self.pooled_channel.call_started()
+        try:
+            response = continuation(client_call_details, request)
+        except Exception:
+            self.pooled_channel.call_finished()
+            raise
+        response.add_done_callback(lambda _: self.pooled_channel.call_finished())
+        return response
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        return self._track(continuation, client_call_details, request)
+
+    def intercept_unary_stream(self, continuation, client_call_details, request):
+        return self._track(continuation, client_call_details, request)
+
+
+class _AioMetricsInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+    """
+    Tracks the number of in-flight calls on a pooled asyncio channel.
+    """
+
+    def __init__(self, pooled_channel: "PooledChannel") -> None:
+        self.pooled_channel = pooled_channel
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        self.pooled_channel.call_started()
+        try:
+            call = await continuation(client_call_details, request)
+        except Exception:
+            self.pooled_channel.call_finished()
+            raise
+        call.add_done_callback(lambda _: self.pooled_channel.call_finished())
+        return call
+
+
+class PooledChannel:
+    """
+    A long-lived channel to a single replica along with its connection metrics.
+    """
+
+    def __init__(self, address: str, credentials: Optional[grpc.ChannelCredentials]) -> None:
+        self.address = address
+        self.credentials = credentials
+        self.aio_channel: Optional[grpc.aio.Channel] = None
+        self.in_flight = 0
+        self.reconnects = 0
+        self.handshake_latency: Optional[float] = None
+        self.state = grpc.ChannelConnectivity.IDLE
+        self._was_ready = False
+        self._lock = threading.Lock()
+
+        if credentials is None:
+            self._raw_channel = grpc.insecure_channel(address, options=CHANNEL_OPTIONS)
+        else:
+            self._raw_channel = grpc.secure_channel(address, credentials, options=CHANNEL_OPTIONS)
+        self.channel = grpc.intercept_channel(self._raw_channel, _MetricsInterceptor(self))
+        self._raw_channel.subscribe(self._on_state_change, try_to_connect=False)
+
+    def _on_state_change(self, state: grpc.ChannelConnectivity):
+        with self._lock:
+            if state == grpc.ChannelConnectivity.READY:
+                if self._was_ready and self.state != grpc.ChannelConnectivity.READY:
+                    self.reconnects += 1
+                    _logger.info(f"Channel to {self.address} reconnected")
+                self._was_ready = True
+            self.state = state
+
+    def get_aio_channel(self) -> grpc.aio.Channel:
+        """
+        Returns the asyncio channel to this replica, creating it on first use.
+        Must be called from within the running event loop.
+        """
+        if self.aio_channel is None:
+            interceptors = [_AioMetricsInterceptor(self)]
+            if self.credentials is None:
+                self.aio_channel = grpc.aio.insecure_channel(
+                    self.address, options=CHANNEL_OPTIONS, interceptors=interceptors
+                )
+            else:
+                self.aio_channel = grpc.aio.secure_channel(
+                    self.address, self.credentials, options=CHANNEL_OPTIONS, interceptors=interceptors
+                )
+        return self.aio_channel
+
+    def call_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def call_finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    @property
+    def healthy(self) -> bool:
+        return self.state not in UNHEALTHY_STATES
+
+    def wait_until_ready(self, timeout: float):
+        """
+        Blocks until the channel is connected, recording the handshake latency of the first connection
+        :param timeout: Seconds to wait before raising grpc.FutureTimeoutError
+        """
+        if self.state == grpc.ChannelConnectivity.READY:
+            return
+
+        start = time.perf_counter()
+        grpc.channel_ready_future(self._raw_channel).result(timeout=timeout)
+        if self.handshake_latency is None:
+            self.handshake_latency = time.perf_counter() - start
+
+    def metrics(self) -> Dict:
+        return {
+            "address": self.address,
+            "state": self.state.name,
+            "in_flight": self.in_flight,
+            "reconnects": self.reconnects,
+            "handshake_latency_ms": (
+                round(self.handshake_latency * 1000, 2) if self.handshake_latency is not None else None
+            ),
+        }
+
+    async def close(self):
+        if self.aio_channel is not None:
+            await self.aio_channel.close()
+        self._raw_channel.unsubscribe(self._on_state_change)
+        self._raw_channel.close()
+
+
+class ChannelPool:
+    """
+    ChannelPool keeps one persistent channel per downstream replica and hands them out round-robin.
+
+    A target is either a single host:port or a comma separated list of replicas.
+    """
+
+    def __init__(self, ready_timeout: float = GRPC_CHANNEL_READY_TIMEOUT) -> None:
+        self.ready_timeout = ready_timeout
+        self._replicas: Dict[str, List[PooledChannel]] = {}
+        self._cycles: Dict[str, itertools.cycle] = {}
+        self._credentials: Optional[grpc.ChannelCredentials] = None
+        self._lock = threading.Lock()
+
+    def _load_credentials(self) -> grpc.ChannelCredentials:
+        if self._credentials is None:
+            with open("/root/ca.crt", "rb") as ca, open("/root/client.key", "rb") as key, open(
+                "/root/client.crt", "rb"
+            ) as chain:
+                self._credentials = grpc.ssl_channel_credentials(
+                    root_certificates=ca.read(),
+                    private_key=key.read(),
+                    certificate_chain=chain.read(),
+                )
+        return self._credentials
+
+    def _register(self, target: str, secure: bool) -> List[PooledChannel]:
+        with self._lock:
+            if target not in self._replicas:
+                credentials = self._load_credentials() if secure else None
+                addresses = [address.strip() for address in target.split(",") if address.strip()]
+                self._replicas[target] = [PooledChannel(address, credentials) for address in addresses]
+                self._cycles[target] = itertools.cycle(range(len(addresses)))
+                _logger.info(f"Registered {len(addresses)} replica(s) for target {target}")
+            return self._replicas[target]
+
+    def _next_replica(self, target: str, replicas: List[PooledChannel]) -> PooledChannel:
+        with self._lock:
+            # Skip replicas in TRANSIENT_FAILURE unless all of them are failing
+            for _ in range(len(replicas)):
+                replica = replicas[next(self._cycles[target])]
+                if replica.healthy:
+                    return replica
+            return replicas[next(self._cycles[target])]
+
+    def get_channel(self, target: str, secure: bool = False) -> grpc.Channel:
+        """
+        Returns a ready channel to one of the replicas of the given target
+        :param target: host:port, or comma separated list of host:port replicas
+        :param secure: Whether to use mTLS credentials
+        :return: gRPC channel
+        """
+        replicas = self._register(target, secure)
+        replica = self._next_replica(target, replicas)
+        replica.wait_until_ready(self.ready_timeout)
+        return replica.channel
+
+    def get_aio_channel(self, target: str, secure: bool = False) -> grpc.aio.Channel:
+        """
+        Returns a grpc.aio channel to one of the replicas of the given target.
+        Unlike get_channel this does not block on readiness, calls should pass `wait_for_ready=True`.
+        :param target: host:port, or comma separated list of host:port replicas
+        :param secure: Whether to use mTLS credentials
+        :return: gRPC asyncio channel
+        """
+        replicas = self._register(target, secure)
+        return self._next_replica(target, replicas).get_aio_channel()
+
+    def metrics(self) -> Dict:
+        """
+        Returns pool-level metrics aggregated over every replica
+        """
+        replicas = [replica for channels in self._replicas.values() for replica in channels]
+        latencies = [replica.handshake_latency for replica in replicas if replica.handshake_latency]
+        return {
+            "in_flight": sum(replica.in_flight for replica in replicas),
+            "reconnects": sum(replica.reconnects for replica in replicas),
+            "handshake_latency_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+            "targets": {
+                target: [replica.metrics() for replica in channels]
+                for target, channels in self._replicas.items()
+            },
+        }
+
+    async def close(self):
+        with self._lock:
+            replicas = [replica for channels in self._replicas.values() for replica in channels]
+            self._replicas.clear()
+            self._cycles.clear()
+        for replica in replicas:
+            await replica.close()
+
+
+_channel_pool: Optional[ChannelPool] = None
+
+
+def init_channel_pool() -> ChannelPool:
+    global _channel_pool
+    if _channel_pool is None:
+        _channel_pool = ChannelPool()
+    return _channel_pool
+
+
+def get_channel_pool() -> ChannelPool:
+    # Falls back to lazy creation for code paths that run outside of the FastAPI lifespan (scripts, tests)
+    return init_channel_pool()
+
+
+async def close_channel_pool():
+    global _channel_pool
+    if _channel_pool is not None:
+        await _channel_pool.close()
+        _channel_pool = None
@@ -1,9 +1,11 @@
-from typing import Dict
+from typing import Dict, Optional
 
 import grpc
+from channel_pool import get_channel_pool
 from fastapi import HTTPException
 from index_builder_proto.index_builder_pb2 import (
     buildIndexRequest,
+    buildIndexResponse,
     deleteBuildIndexRequest,
     deleteBuildIndexResponse,
     getBuildIndexRequest,
@@ -24,12 +26,16 @@ class IndexBuilderService:
     ConversationIndexService is a class that handles the gRPC calls to the server which hosts the conversational indices.
     """
 
-    def __init__(self, id: str) -> None:
+    def __init__(self, id: str, aio: bool = False) -> None:
         self.id = id
 
+        if aio:
+            # Readiness is awaited per call through wait_for_ready instead of blocking the event loop
+            self.aio_client = IndexBuilderStub(get_channel_pool().get_aio_channel(INDEX_BUILDER_SERVICE_HOST))
+            return
+
         try:
-            channel = grpc.insecure_channel(INDEX_BUILDER_SERVICE_HOST)
-            grpc.channel_ready_future(channel).result(timeout=3)
+            channel = get_channel_pool().get_channel(INDEX_BUILDER_SERVICE_HOST)
             self.client = IndexBuilderStub(channel)
         except grpc.FutureTimeoutError:
             _logger.exception(f"Index Builder service is unavailable: {INDEX_BUILDER_SERVICE_HOST}")
@@ -58,6 +64,23 @@ class IndexBuilderService:
             "index_store": response.indexStore,
         }
 
+    async def build_index_async(
+        self, index_attachments: Dict, toolname: str, subquestion_id: str, timeout: Optional[float] = None
+    ):
+        """
+        Async variant of build_index, requires the service to be created with aio=True
+        :param timeout: Deadline of the call in seconds
+        :return: Index build status
+        """
+        request = buildIndexRequest(
+            conversationId=self.id,
+            indexAttachments=index_attachments,
+            toolName=toolname,
+            subQuestionId=subquestion_id,
+        )
+        response = await self.aio_client.buildIndex(request, timeout=timeout, wait_for_ready=True)
+        return buildIndexResponse.IndexStatus.Name(response.status)
+
     def get_index_status(self, filename, toolname):
         request = getBuildIndexRequest(conversationId=self.id, fileName=filename, toolName=toolname)
         response = self.client.getIndex(request)
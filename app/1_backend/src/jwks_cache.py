@@ -0,0 +1,140 @@
+import asyncio
+import base64
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import httpx
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+from logger import create_logger
+from variables import JWKS_CACHE_TTL, JWKS_MIN_REFRESH_INTERVAL, VERIFIED_TOKEN_CACHE_SIZE
+
+_logger = create_logger("backend:jwks_cache")
+
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+def _decode_public_key(key: Dict) -> rsa.RSAPublicKey:
+    e_value = int.from_bytes(base64.urlsafe_b64decode(key["e"] + "==="), "big")
+    n_value = int.from_bytes(base64.urlsafe_b64decode(key["n"] + "==="), "big")
+    return rsa.RSAPublicNumbers(e_value, n_value).public_key(default_backend())
+
+
+def _parse_max_age(cache_control: Optional[str], default: float) -> float:
+    if not cache_control:
+        return default
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = MAX_AGE_PATTERN.search(cache_control)
+    return float(match.group(1)) if match else default
+
+
+class JWKSCache:
+    """
+    JWKSCache holds the decoded public keys of the JWKS endpoint keyed by `kid`.
+
+    Keys are served from memory until the TTL advertised through Cache-Control (or JWKS_CACHE_TTL) expires.
+    Expired keys keep being served while a background task refreshes them, and an unknown `kid` triggers
+    an immediate refetch so that key rotations are picked up.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str,
+        default_ttl: float = JWKS_CACHE_TTL,
+        min_refresh_interval: float = JWKS_MIN_REFRESH_INTERVAL,
+    ) -> None:
+        self.jwks_url = jwks_url
+        self.default_ttl = default_ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.keys: Dict[str, rsa.RSAPublicKey] = {}
+        self.expires_at = 0.0
+        # time.monotonic() starts at an arbitrary point, possibly less than min_refresh_interval ago
+        self.last_fetched_at = float("-inf")
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def _fetch(self) -> Tuple[Dict, float]:
+        async with httpx.AsyncClient(timeout=5) as client:
+            response = await client.get(self.jwks_url)
+            response.raise_for_status()
+            ttl = _parse_max_age(response.headers.get("Cache-Control"), self.default_ttl)
+            return response.json(), ttl
+
+    async def refresh(self, force: bool = False):
+        async with self._lock:
+            # Another coroutine may have refreshed the keys while this one was waiting on the lock
+            if not force and time.monotonic() < self.expires_at:
+                return
+            if time.monotonic() - self.last_fetched_at < self.min_refresh_interval:
+                return
+
+            jwks_data, ttl = await self._fetch()
+            self.keys = {key["kid"]: _decode_public_key(key) for key in jwks_data["keys"]}
+            self.last_fetched_at = time.monotonic()
+            self.expires_at = self.last_fetched_at + ttl
+            _logger.info(f"Refreshed JWKS with {len(self.keys)} keys (ttl: {ttl}s)")
+
+    def _refresh_in_background(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
+            self._refresh_task.add_done_callback(self._log_refresh_failure)
+
+    @staticmethod
+    def _log_refresh_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            _logger.error(f"Background JWKS refresh failed: {task.exception()}")
+
+    async def get_key(self, kid: str) -> rsa.RSAPublicKey:
+        """
+        Returns the public key for the given key ID
+        :param kid: Key ID from the JWT header
+        :return: RSA public key
+        """
+        if kid not in self.keys:
+            await self.refresh(force=True)
+        elif time.monotonic() >= self.expires_at:
+            self._refresh_in_background()
+
+        try:
+            return self.keys[kid]
+        except KeyError:
+            raise Exception("Matching public key not found in JWKS.")
+
+
+class VerifiedTokenCache:
+    """
+    LRU of decoded claims of already verified tokens, keyed by the token hash and valid until `exp`.
+    """
+
+    def __init__(self, max_size: int = VERIFIED_TOKEN_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[str, Dict] = OrderedDict()
+
+    @staticmethod
+    def _key(jwt_token: str) -> str:
+        return hashlib.sha256(jwt_token.encode()).hexdigest()
+
+    def get(self, jwt_token: str) -> Optional[Dict]:
+        key = self._key(jwt_token)
+        claims = self._entries.get(key)
+        if claims is None:
+            return None
+        if claims.get("exp", 0) <= time.time():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return claims
+
+    def put(self, jwt_token: str, claims: Dict):
+        if "exp" not in claims:
+            return
+        key = self._key(jwt_token)
+        self._entries[key] = claims
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -1,4 +1,6 @@
-import grpc
+from typing import List, Optional
+
+from channel_pool import get_channel_pool
 from fastapi import HTTPException
 from grpc import FutureTimeoutError
 import logging
@@ -14,31 +16,32 @@ class QueryEngineService:
     ConversationIndexService is a class that handles the gRPC calls to the server which hosts the conversational indices.
     """
 
-    def __init__(self, id: str) -> None:
+    def __init__(self, id: str, aio: bool = False) -> None:
         self.id = id
 
+        if aio:
+            # Readiness is awaited per call through wait_for_ready instead of blocking the event loop
+            self.aio_client = QueryEngineStub(
+                get_channel_pool().get_aio_channel(QUERY_ENGINE_SERVICE_HOST, secure=not USE_INSECURE_CHANNEL)
+            )
+            return
+
         try:
-            if USE_INSECURE_CHANNEL:
-                channel = grpc.insecure_channel(QUERY_ENGINE_SERVICE_HOST)
-            else:
-                channel = grpc.secure_channel(
-                    QUERY_ENGINE_SERVICE_HOST,
-                    grpc.ssl_channel_credentials(
-                        root_certificates=open("/root/ca.crt", "rb").read(),
-                        private_key=open("/root/client.key", "rb").read(),
-                        certificate_chain=open("/root/client.crt", "rb").read(),
-                    ),
-                )
-            grpc.channel_ready_future(channel).result(timeout=3)
+            channel = get_channel_pool().get_channel(
+                QUERY_ENGINE_SERVICE_HOST, secure=not USE_INSECURE_CHANNEL
+            )
             self.client = QueryEngineStub(channel)
         except FutureTimeoutError:
             _logger.exception(f"Query Engine server is unavailable: {QUERY_ENGINE_SERVICE_HOST}")
             raise HTTPException(500, "INTERNAL SERVER ERROR: DOWNSTREAM CONNECTION ERROR")
 
-    def get_answer_citations(self, query: str, params: dict, tool_name: str, subquestion_id: str):
+    def get_answer_citations(
+        self, query: str, params: dict, tool_name: str, subquestion_id: str, years: Optional[List[int]] = None
+    ):
         """
         Sends a prompt to the model server and returns the response
         :param prompt: Prompt string
+        :param years: Years of the attachments of the company, the year filter when the query has none
         :return: Response string
         """
 
@@ -48,11 +51,38 @@ class QueryEngineService:
             params=params,
             toolName=tool_name,
             subQuestionId=subquestion_id,
+            years=years or [],
         )
 
         response = self.client.getAnswerCitations(request)
         return response.Answer, response.citations, response.status
 
+    async def get_answer_citations_async(
+        self,
+        query: str,
+        params: dict,
+        tool_name: str,
+        subquestion_id: str,
+        timeout: Optional[float] = None,
+        years: Optional[List[int]] = None,
+    ):
+        """
+        Async variant of get_answer_citations, requires the service to be created with aio=True
+        :param timeout: Deadline of the call in seconds
+        :return: Answer, citations and status
+        """
+        request = getAnswerCitationsRequest(
+            conversationId=self.id,
+            subQuestion=query,
+            params=params,
+            toolName=tool_name,
+            subQuestionId=subquestion_id,
+            years=years or [],
+        )
+
+        response = await self.aio_client.getAnswerCitations(request, timeout=timeout, wait_for_ready=True)
+        return response.Answer, response.citations, response.status
+
     def get_params(self):
         """
         Returns the current model parameters
@@ -14,6 +14,8 @@ class ParamsUpdateRequest(BaseModel):
     qe_repetition_penalty: float = Field(default=1.2, ge=0, le=2.0, description="")
     qe_reranker_top_n: int = Field(default=4, ge=0, le=10, description="")
     qe_similarity_top_k: int = Field(default=12, ge=0, le=20, description="")
+    qe_ann_ef_search: int = Field(default=128, ge=1, le=1024, description="")
+    qe_ann_nprobe: int = Field(default=16, ge=1, le=1024, description="")
 
     rs_k: int = Field(default=3, ge=1, le=15, description="")
     rs_top_k: int = Field(default=5, ge=1, le=25, description="")
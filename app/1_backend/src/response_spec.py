@@ -58,6 +58,8 @@ class ParamsResponse(BaseModel):
     qe_repetition_penalty: float
     qe_reranker_top_n: int
     qe_similarity_top_k: int
+    qe_ann_ef_search: int
+    qe_ann_nprobe: int
     rs_k: int
     rs_top_k: int
     rs_temperature: float
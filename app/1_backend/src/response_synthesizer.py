@@ -1,11 +1,15 @@
-import pickle
 from typing import List
 
-import grpc
+from channel_pool import get_channel_pool
 from fastapi import HTTPException
 from grpc import FutureTimeoutError
 import logging
-from response_synthesizer_proto.response_synthesizer_pb2 import FinalEmpty, getFinalAnswerRequest
+from query_engine_proto.query_engine_pb2 import SourceNode
+from response_synthesizer_proto.response_synthesizer_pb2 import (
+    FinalEmpty,
+    FinalSourceNode,
+    getFinalAnswerRequest,
+)
 from response_synthesizer_proto.response_synthesizer_pb2_grpc import ResponseSynthesizerStub
 from variables import RESPONSE_SYNTHESIZER_SERVICE_HOST, USE_INSECURE_CHANNEL
 
@@ -21,18 +25,9 @@ class ResponseSynthesizerService:
         self.id = id
 
         try:
-            if USE_INSECURE_CHANNEL:
-                channel = grpc.insecure_channel(RESPONSE_SYNTHESIZER_SERVICE_HOST)
-            else:
-                channel = grpc.secure_channel(
-                    RESPONSE_SYNTHESIZER_SERVICE_HOST,
-                    grpc.ssl_channel_credentials(
-                        root_certificates=open("/root/ca.crt", "rb").read(),
-                        private_key=open("/root/client.key", "rb").read(),
-                        certificate_chain=open("/root/client.crt", "rb").read(),
-                    ),
-                )
-            grpc.channel_ready_future(channel).result(timeout=3)
+            channel = get_channel_pool().get_channel(
+                RESPONSE_SYNTHESIZER_SERVICE_HOST, secure=not USE_INSECURE_CHANNEL
+            )
             self.client = ResponseSynthesizerStub(channel)
         except FutureTimeoutError:
             _logger.exception(f"Model server is unavailable: {RESPONSE_SYNTHESIZER_SERVICE_HOST}")
@@ -43,7 +38,7 @@ class ResponseSynthesizerService:
         query: str,
         params: dict,
         qa_pairs: dict,
-        sources: List[bytes],
+        sources: List[SourceNode],
     ):
         """
         Sends a prompt to the model server and returns the response
@@ -54,7 +49,18 @@ class ResponseSynthesizerService:
             query=query,
             params=params,
             qaPairs=qa_pairs,
-            Sources=pickle.dumps([pickle.loads(node)["node"] for node in sources]),
+            sources=[
+                FinalSourceNode(
+                    node_id=node.node_id,
+                    text=node.text,
+                    score=node.score,
+                    document_id=node.document_id,
+                    page=node.page,
+                    file_name=node.file_name,
+                    embedding=node.embedding,
+                )
+                for node in sources
+            ],
         )
         response = self.client.summarizeResponse(request)
 
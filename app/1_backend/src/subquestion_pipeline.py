@@ -0,0 +1,144 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from index_builder import IndexBuilderService
+from logger import create_logger
+from query_engine import QueryEngineService
+from variables import (
+    INDEX_BUILDER_MAX_CONCURRENCY,
+    QUERY_ENGINE_MAX_CONCURRENCY,
+    SUBQUESTION_TIMEOUT,
+)
+
+_logger = create_logger("backend:subquestion_pipeline")
+
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+@dataclass
+class SubQuestionResult:
+    record_id: str
+    question: str
+    tool_name: str
+    answer: str
+    status: str
+    citations: List = field(default_factory=list)
+
+
+class SubQuestionPipeline:
+    """
+    SubQuestionPipeline answers sub-questions concurrently over grpc.aio.
+
+    Every sub-question builds its index and then queries it as soon as a slot on the respective downstream
+    service frees up, so a slow sub-question never holds back the others. Results are yielded in completion
+    order from a single coroutine, which makes merging them safe without locks.
+    """
+
+    def __init__(
+        self,
+        index_builder_concurrency: int = INDEX_BUILDER_MAX_CONCURRENCY,
+        query_engine_concurrency: int = QUERY_ENGINE_MAX_CONCURRENCY,
+        timeout: float = SUBQUESTION_TIMEOUT,
+    ) -> None:
+        self.index_builder_slots = asyncio.Semaphore(index_builder_concurrency)
+        self.query_engine_slots = asyncio.Semaphore(query_engine_concurrency)
+        self.timeout = timeout
+
+    async def _answer(
+        self,
+        conversation_id: str,
+        params: Dict,
+        question: str,
+        tool_name: str,
+        record_id: str,
+        attachments: List,
+    ) -> SubQuestionResult:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        attachment_ids = {
+            attachment.id: attachment.document.name.rsplit(".", 1)[0] for attachment in attachments
+        }
+
+        async with self.index_builder_slots:
+            await IndexBuilderService(id=conversation_id, aio=True).build_index_async(
+                attachment_ids, tool_name, record_id, timeout=deadline - loop.time()
+            )
+
+        async with self.query_engine_slots:
+            answer, citations, status = await QueryEngineService(
+                id=conversation_id, aio=True
+            ).get_answer_citations_async(
+                query=question,
+                params=params,
+                tool_name=tool_name,
+                subquestion_id=record_id,
+                timeout=deadline - loop.time(),
+                years=sorted({attachment.year for attachment in attachments}),
+            )
+
+        if status != "SUCCESS":
+            return SubQuestionResult(record_id, question, tool_name, "DISCARDED", status)
+        return SubQuestionResult(record_id, question, tool_name, answer, status, list(citations))
+
+    async def _answer_within_deadline(
+        self, conversation_id, params, question, tool_name, record_id, attachments
+    ):
+        try:
+            return await asyncio.wait_for(
+                self._answer(conversation_id, params, question, tool_name, record_id, attachments),
+                timeout=self.timeout,
+            )
+        except asyncio.TimeoutError:
+            _logger.warning(f"Sub-Question: {question} timed out after {self.timeout}s")
+            return SubQuestionResult(record_id, question, tool_name, "DISCARDED", "TIMEOUT")
+        except Exception as exc:
+            _logger.exception(f"Sub-Question: {question} failed: {exc}")
+            return SubQuestionResult(record_id, question, tool_name, "DISCARDED", "FAIL")
+
+    @staticmethod
+    async def _cancel_on_disconnect(request: Request, tasks: List[asyncio.Task]):
+        while not all(task.done() for task in tasks):
+            if await request.is_disconnected():
+                _logger.info("Client disconnected, cancelling pending sub-questions")
+                for task in tasks:
+                    task.cancel()
+                return
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+    async def run(
+        self,
+        conversation_id: str,
+        params: Dict,
+        sub_questions: List[Tuple[str, str, str]],
+        attachments: Optional[Dict[str, List]] = None,
+        request: Optional[Request] = None,
+    ) -> AsyncIterator[SubQuestionResult]:
+        """
+        Answers the sub-questions concurrently, yielding each result as soon as it completes
+        :param conversation_id: Conversation ID
+        :param params: Query engine parameters
+        :param sub_questions: List of (question, tool name, record ID)
+        :param attachments: Attachments of the conversation keyed by tool name
+        :param request: Incoming request, used to cancel the pending sub-questions when the client disconnects
+        """
+        attachments = attachments or {}
+        tasks = [
+            asyncio.create_task(
+                self._answer_within_deadline(
+                    conversation_id, params, question, tool_name, record_id, attachments.get(tool_name, [])
+                )
+            )
+            for question, tool_name, record_id in sub_questions
+        ]
+        watcher = asyncio.create_task(self._cancel_on_disconnect(request, tasks)) if request else None
+
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()
+            if watcher is not None:
+                watcher.cancel()
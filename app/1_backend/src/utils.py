@@ -1,16 +1,13 @@
-import base64
 import dataclasses
 import json
 from dataclasses import dataclass
 
-import httpx
 import jwt
 from httpx import Response as HttpxResponse
 from httpx import TimeoutException
 from requests import Response
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.asymmetric import rsa
 from fastapi import HTTPException, Request
+from jwks_cache import JWKSCache, VerifiedTokenCache
 from variables import AUTH_0_CLIENT_ID, AUTH_0_JWKS_URL, DEBUG
 from json import JSONDecodeError
 from typing import Union
@@ -30,22 +27,13 @@ class User:
         return json.dumps(dataclasses.asdict(this))
 
 
-def fetch_jwks(jwks_url):
-    with httpx.Client() as client:
-        response = client.get(jwks_url)
-        response.raise_for_status()
-        return response.json()
+_jwks_cache = JWKSCache(AUTH_0_JWKS_URL)
+_verified_tokens = VerifiedTokenCache()
 
 
-def get_public_key(jwks_data, jwt_token) -> str:
+async def get_public_key(jwt_token):
     header = jwt.get_unverified_header(jwt_token)
-    for key in jwks_data["keys"]:
-        if key["kid"] == header["kid"]:
-            e_value = int.from_bytes(base64.urlsafe_b64decode(key["e"] + "==="), "big")
-            n_value = int.from_bytes(base64.urlsafe_b64decode(key["n"] + "==="), "big")
-            return rsa.RSAPublicNumbers(e_value, n_value).public_key(default_backend())
-    else:
-        raise Exception("Matching public key not found in JWKS.")
+    return await _jwks_cache.get_key(header["kid"])
 
 
 def jwt_decode(jwt_token, public_key):
@@ -53,7 +41,7 @@ def jwt_decode(jwt_token, public_key):
     return decoded_token
 
 
-def extract_user(request: Request):
+async def extract_user(request: Request):
     if DEBUG is True:
         return User(
             username="Krishna",
@@ -68,12 +56,13 @@ def extract_user(request: Request):
     if authorization_header.startswith("Bearer "):
         # production mode
         jwt_token = authorization_header.split(" ")[1]
-        jwks_url = AUTH_0_JWKS_URL
-        jwks_data = fetch_jwks(jwks_url)
-        public_key = get_public_key(jwks_data, jwt_token)
+        res = _verified_tokens.get(jwt_token)
+        if res is None:
+            public_key = await get_public_key(jwt_token)
 
-        # jwt validation
-        res = jwt_decode(jwt_token, public_key)
+            # jwt validation
+            res = jwt_decode(jwt_token, public_key)
+            _verified_tokens.put(jwt_token, res)
         return User(username=res["name"], email=res["email"], sub=res["sub"])
     else:
         raise HTTPException(status_code=401, detail="Unauthorized")
@@ -46,5 +46,14 @@ try:
     INDEX_DELETION_QUEUE = os.environ.get("INDEX_DELETION_QUEUE")
     USE_INSECURE_CHANNEL = os.environ.get("USE_INSECURE_CHANNEL", "True").lower() == "true"
     SUB_QUESTION_MODEL_NAME = os.environ.get("SUB_QUESTION_MODEL_NAME", "gpt-4-1106-preview")
+    JWKS_CACHE_TTL = float(os.environ.get("JWKS_CACHE_TTL", 3600))
+    JWKS_MIN_REFRESH_INTERVAL = float(os.environ.get("JWKS_MIN_REFRESH_INTERVAL", 30))
+    VERIFIED_TOKEN_CACHE_SIZE = int(os.environ.get("VERIFIED_TOKEN_CACHE_SIZE", 1024))
+    INDEX_BUILDER_MAX_CONCURRENCY = int(os.environ.get("INDEX_BUILDER_MAX_CONCURRENCY", 5))
+    QUERY_ENGINE_MAX_CONCURRENCY = int(os.environ.get("QUERY_ENGINE_MAX_CONCURRENCY", 5))
+    SUBQUESTION_TIMEOUT = float(os.environ.get("SUBQUESTION_TIMEOUT", 60))
+    GRPC_CHANNEL_READY_TIMEOUT = float(os.environ.get("GRPC_CHANNEL_READY_TIMEOUT", 3))
+    GRPC_KEEPALIVE_TIME_MS = int(os.environ.get("GRPC_KEEPALIVE_TIME_MS", 30000))
+    GRPC_KEEPALIVE_TIMEOUT_MS = int(os.environ.get("GRPC_KEEPALIVE_TIMEOUT_MS", 10000))
 except KeyError as exc:
     raise EnvironmentError(f"Required environment variable: {exc} not found")
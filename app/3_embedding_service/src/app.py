@@ -0,0 +1,69 @@
+import asyncio
+
+import grpc
+import variables as vars
+from embedder import Embedder
+from embedding_proto import embedding_pb2, embedding_pb2_grpc
+from logger import create_logger
+
+_logger = create_logger("embedding:app")
+
+
+class EmbeddingService(embedding_pb2_grpc.EmbeddingServicer):
+    def __init__(self):
+        self.embedder = Embedder()
+
+    async def embed(
+        self, request: embedding_pb2.EmbedRequest, context
+    ) -> embedding_pb2.EmbedResponse:
+        if request.model and request.model != self.embedder.model_name:
+            await context.abort(
+                grpc.StatusCode.INVALID_ARGUMENT,
+                f"Service embeds with {self.embedder.model_name}, not {request.model}",
+            )
+
+        # Formatted like llama_index's format_query and format_text: the instruction and the text are joined
+        # by a space and stripped
+        if request.type == embedding_pb2.EmbedRequest.QUERY:
+            texts = [f"{vars.QUERY_INSTRUCTION} {text}".strip() for text in request.texts]
+        else:
+            texts = [text.strip() for text in request.texts]
+
+        # Concurrent requests are merged into the same batches by the embedder
+        embeddings = await asyncio.wrap_future(self.embedder.submit(texts))
+        return embedding_pb2.EmbedResponse(
+            embeddings=[embedding_pb2.EmbedVector(values=vector) for vector in embeddings]
+        )
+
+    async def getEmbeddingInfo(
+        self, request: embedding_pb2.EmbedEmpty, context
+    ) -> embedding_pb2.EmbeddingInfo:
+        return embedding_pb2.EmbeddingInfo(
+            model=self.embedder.model_name,
+            dimension=self.embedder.dimension,
+            precision=self.embedder.precision,
+        )
+
+
+## BOILERPLATE
+# Below is boilerplate code to start the server.
+async def serve():
+    """Start the server"""
+    server = grpc.aio.server(
+        options=[
+            ("grpc.max_send_message_length", 64 * 1024 * 1024),
+            ("grpc.max_receive_message_length", 64 * 1024 * 1024),
+        ]
+    )
+    embedding_pb2_grpc.add_EmbeddingServicer_to_server(EmbeddingService(), server)
+    listen_addr = f"[::]:{vars.PORT}"
+    server.add_insecure_port(listen_addr)
+    await server.start()
+    _logger.info(f"Started server on {listen_addr}")
+    await server.wait_for_termination()
+    _logger.info(f"Server terminated on {listen_addr}")
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
+## END BOILERPLATE
@@ -0,0 +1,118 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import List
+
+import torch
+import variables as vars
+from logger import create_logger
+from transformers import AutoModel, AutoTokenizer
+
+_logger = create_logger("embedding:embedder")
+
+
+@dataclass
+class EmbedJob:
+    texts: List[str]
+    future: Future = field(default_factory=Future)
+
+
+class Embedder:
+    """
+    Embeds texts with CLS pooling and L2 normalization, like llama_index's HuggingFaceEmbedding.
+
+    Concurrent jobs are merged into dynamic batches. The texts of a batch are sorted by token length and split
+    into forward passes of similar lengths, so that little compute is spent on padding.
+    """
+
+    def __init__(
+        self,
+        model_name: str = vars.EMBED_MODEL_NAME,
+        precision: str = vars.EMBED_PRECISION,
+        max_batch_size: int = vars.MAX_BATCH_SIZE,
+        max_wait_ms: float = vars.BATCH_MAX_WAIT_MS,
+    ) -> None:
+        self.model_name = model_name
+        self.precision = precision
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = self._load_model(model_name, precision)
+        self.dimension = self.model.config.hidden_size
+        self._queue: "queue.Queue[EmbedJob]" = queue.Queue()
+        threading.Thread(target=self._run, name="embedder", daemon=True).start()
+        _logger.info(f"Embedder loaded: {model_name} ({precision}, {self.device})")
+
+    def _load_model(self, model_name: str, precision: str):
+        model = AutoModel.from_pretrained(model_name).eval()
+        if precision == "fp16":
+            return model.half().to(self.device)
+        if precision == "int8":
+            # Dynamic quantization only targets CPU kernels
+            self.device = "cpu"
+            return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model.to(self.device)
+
+    def submit(self, texts: List[str]) -> Future:
+        job = EmbedJob(texts)
+        self._queue.put(job)
+        return job.future
+
+    def _collect(self) -> List[EmbedJob]:
+        jobs = [self._queue.get()]
+        size = len(jobs[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            jobs.append(job)
+            size += len(job.texts)
+        return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._collect()
+            try:
+                embeddings = self.embed([text for job in jobs for text in job.texts])
+            except Exception as exc:
+                _logger.exception(f"Embedding batch failed: {exc}")
+                for job in jobs:
+                    job.future.set_exception(exc)
+                continue
+
+            offset = 0
+            for job in jobs:
+                job.future.set_result(embeddings[offset : offset + len(job.texts)])
+                offset += len(job.texts)
+
+    @torch.inference_mode()
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds the texts in length-bucketed forward passes
+        :return: Embeddings in the order of the texts
+        """
+        input_ids = self.tokenizer(texts, truncation=True, max_length=vars.MAX_LENGTH)["input_ids"]
+        lengths = [len(ids) for ids in input_ids]
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+        embeddings: List[List[float]] = [None] * len(texts)
+
+        for start in range(0, len(order), self.max_batch_size):
+            bucket = order[start : start + self.max_batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in bucket],
+                padding=True,
+                truncation=True,
+                max_length=vars.MAX_LENGTH,
+                return_tensors="pt",
+            ).to(self.device)
+            cls = self.model(**encoded).last_hidden_state[:, 0]
+            vectors = torch.nn.functional.normalize(cls.float(), p=2, dim=1).tolist()
+            for i, vector in zip(bucket, vectors):
+                embeddings[i] = vector
+        return embeddings
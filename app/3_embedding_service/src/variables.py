@@ -0,0 +1,29 @@
+import os
+
+PORT = os.environ.get("PORT", 5007)
+DEBUG = os.environ.get("DEBUG", "false").lower() == "true"
+
+EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "BAAI/bge-large-en")
+# fp32, fp16 (GPU) or int8 (dynamically quantized linear layers, CPU)
+EMBED_PRECISION = os.getenv("EMBED_PRECISION", "fp32").lower()
+MAX_LENGTH = int(os.getenv("EMBED_MAX_LENGTH", 512))
+
+# Requests arriving within the wait window are embedded together, in forward passes of at most
+# MAX_BATCH_SIZE texts of similar length
+MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", 64))
+BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", 5))
+
+# Query instruction of llama_index's HuggingFaceEmbedding (embeddings/huggingface_utils.py) for the English
+# BGE models, so that service and in process query vectors are identical
+BGE_QUERY_INSTRUCTION = "Represent this question for searching relevant passages: "
+BGE_MODELS = (
+    "BAAI/bge-small-en",
+    "BAAI/bge-small-en-v1.5",
+    "BAAI/bge-base-en",
+    "BAAI/bge-base-en-v1.5",
+    "BAAI/bge-large-en",
+    "BAAI/bge-large-en-v1.5",
+)
+QUERY_INSTRUCTION = os.getenv(
+    "EMBED_QUERY_INSTRUCTION", BGE_QUERY_INSTRUCTION if EMBED_MODEL_NAME in BGE_MODELS else ""
+)
@@ -1,14 +1,17 @@
 import asyncio
+import json
 import os
 import shutil
 import time
 
 import grpc
 import variables as vars
+from company_indices import CompanyIndexLoader
+from content_registry import ContentIndexRegistry
+from embedding import get_embed_model
 from index_builder_proto import index_builder_pb2, index_builder_pb2_grpc
 from llama_index import (
     ServiceContext,
-    StorageContext,
     load_index_from_storage,
 )
 from llama_index.callbacks import (
@@ -16,15 +19,18 @@ from llama_index.callbacks import (
     LlamaDebugHandler,
     OpenInferenceCallbackHandler,
 )
-from llama_index.embeddings import HuggingFaceEmbedding
 from llama_index.llms import OpenAI
 from logger import configure_logging, create_logger
+from mmap_store import (
+    copy_storage_context,
+    load_storage_context,
+    persist_bm25_index,
+    persist_storage_context,
+)
 from storage import Storage
 
 _logger = create_logger("index_builder:app")
 
-storage_context_dict = {}
-
 
 def _init_service_context():
     # callback manager
@@ -34,7 +40,7 @@ def _init_service_context():
     callback_manager = CallbackManager([llama_debug, callback_handler])
     # service context
 
-    embed_model = HuggingFaceEmbedding(model_name=vars.EMBED_MODEL_NAME)
+    embed_model = get_embed_model(vars.EMBED_MODEL_NAME)
     llm_model = OpenAI(model=vars.LLM_MODEL_NAME, temperature=0)
 
     service_context = ServiceContext.from_defaults(
@@ -46,6 +52,9 @@ def _init_service_context():
 
 
 index_service_context = _init_service_context()
+company_indices = CompanyIndexLoader(
+    Storage(vars.GCS_INDEX_BUILDER_BUCKET), vars.GLOBAL_INDICES_DIR, vars.COMPANY_INDEX_CACHE_MAX_BYTES
+)
 
 
 class IndexBuilderService(index_builder_pb2_grpc.IndexBuilderServicer):
@@ -87,6 +96,32 @@ class IndexBuilderService(index_builder_pb2_grpc.IndexBuilderServicer):
             status="NOT_FOUND",
         )
 
+    def _build_overlay_index(
+        self, conversation_id, index_attachments, tool_name, subquestion_id
+    ) -> index_builder_pb2.buildIndexResponse:
+        """
+        Publishes the overlay manifest for a sub-question instead of a merged copy of the company index
+        """
+        manifest = {
+            "toolName": tool_name,
+            "attachments": [
+                f"{conversation_id}/{file_name}" for file_name in index_attachments
+            ],
+        }
+        merged_storage = Storage(vars.MERGED_INDICES_BUCKET_NAME)
+        merged_storage.upload_file_from_memory(
+            json.dumps(manifest),
+            f"{conversation_id}/{subquestion_id}/{vars.OVERLAY_MANIFEST_FILENAME}",
+        )
+        _logger.info(
+            f"Overlay manifest for {conversation_id}/{subquestion_id} published "
+            f"({tool_name} + {len(index_attachments)} attachment(s))"
+        )
+        return index_builder_pb2.buildIndexResponse(
+            conversationId=conversation_id,
+            status="INDEXED",
+        )
+
     def buildIndex(
         self, request: index_builder_pb2.buildIndexRequest, context
     ) -> index_builder_pb2.buildIndexResponse:
@@ -96,6 +131,11 @@ class IndexBuilderService(index_builder_pb2_grpc.IndexBuilderServicer):
         subquestion_id = request.subQuestionId
 
         try:
+            if vars.INDEX_MODE == "overlay":
+                return self._build_overlay_index(
+                    conversation_id, index_attachments, tool_name, subquestion_id
+                )
+
             attachments_path = os.path.join(vars.CREATED_INDICES_DIR, conversation_id)
             merge_index_path = os.path.join(
                 vars.TEMP_INDICES_DIR, f"{conversation_id}-{subquestion_id}"
@@ -103,7 +143,8 @@ class IndexBuilderService(index_builder_pb2_grpc.IndexBuilderServicer):
             if os.path.exists(attachments_path):
                 shutil.rmtree(attachments_path)
             os.mkdir(attachments_path)
-            storage_context = storage_context_dict[tool_name]
+            # The cached company index is shared by every request, the attachments go into a copy of it
+            storage_context = copy_storage_context(company_indices.get(tool_name))
             index = load_index_from_storage(
                 storage_context,
                 service_context=index_service_context,
@@ -117,8 +158,8 @@ class IndexBuilderService(index_builder_pb2_grpc.IndexBuilderServicer):
                     f"{conversation_id}/{file_name}",
                     f"{attachments_path}/{attachment_id}-{subquestion_id}",
                 )
-                attachment_storage_context = StorageContext.from_defaults(
-                    persist_dir=f"{attachments_path}/{attachment_id}-{subquestion_id}"
+                attachment_storage_context = load_storage_context(
+                    f"{attachments_path}/{attachment_id}-{subquestion_id}"
                 )
                 attachment_index = load_index_from_storage(
                     attachment_storage_context,
@@ -140,7 +181,9 @@ class IndexBuilderService(index_builder_pb2_grpc.IndexBuilderServicer):
                     f"Merged {attachment_id}-{subquestion_id} with {tool_name} global index"
                 )
 
-            index.storage_context.persist(persist_dir=merge_index_path)
+            persist_storage_context(index.storage_context, merge_index_path)
+            if vars.SPARSE_INDEX:
+                persist_bm25_index(index.docstore, merge_index_path)
             merged_storage = Storage(vars.MERGED_INDICES_BUCKET_NAME)
             merged_storage.upload_folder(
                 merge_index_path, f"{conversation_id}/{subquestion_id}"
@@ -169,6 +212,8 @@ class IndexBuilderService(index_builder_pb2_grpc.IndexBuilderServicer):
             folder_path = f"{conversation_id}/{extracted_filename}"
             file_name_path = f"{folder_path}/{vars.VECTOR_INDEX_FILENAMES[0]}"
             if storage.exists(file_name_path):
+                registry = ContentIndexRegistry(storage, vars.CONTENT_INDEX_PREFIX, vars.TEMP_INDICES_DIR)
+                registry.release(folder_path)
                 storage.delete_folder(f"{conversation_id}/{extracted_filename}")
                 _logger.info(f"Folder for {folder_path} deleted")
                 return index_builder_pb2.deleteBuildIndexResponse(
@@ -187,29 +232,6 @@ class IndexBuilderService(index_builder_pb2_grpc.IndexBuilderServicer):
             )
 
 
-def download_company_storage():
-    """Start with company indices loaded"""
-    storage = Storage(vars.GCS_INDEX_BUILDER_BUCKET)
-
-    blobs = storage.bucket.list_blobs()
-    companies = []
-    for blob in blobs:
-        if blob.name.split("/")[0] not in companies:
-            company = blob.name.split("/")[0]
-            storage.download_folder(
-                f"{company}",
-                f"{vars.GLOBAL_INDICES_DIR}/{company}",
-            )
-            companies.append(company)
-            company_index_dir = os.path.join(vars.GLOBAL_INDICES_DIR, company)
-
-            storage_context_dict.update(
-                {company: StorageContext.from_defaults(persist_dir=company_index_dir)}
-            )
-            _logger.info(f"Company {company} downloaded to {vars.GLOBAL_INDICES_DIR}")
-    _logger.info(f"Company indices downloaded to {vars.GLOBAL_INDICES_DIR}")
-
-
 ## BOILERPLATE
 # Below is boilerplate code to start the server.
 async def serve():
@@ -236,7 +258,7 @@ if __name__ == "__main__":
     ]:
         if not os.path.exists(directory):
             os.mkdir(directory)
-    download_company_storage()
+    company_indices.prefetch(vars.COMPANY_INDEX_PREFETCH)
     _logger.debug("Creating directories on filesystem...")
 
     asyncio.run(serve())
@@ -0,0 +1,115 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import partial
+from typing import Dict, Iterable, Tuple
+
+from llama_index import StorageContext
+from logger import create_logger
+from mmap_store import folder_version, load_storage_context, shared_persist_dir
+from storage import Storage
+
+_logger = create_logger("index_builder:company_indices")
+
+
+class CompanyIndexLoader:
+    """
+    Loads company indices on first use instead of downloading every company at startup.
+
+    Concurrent requests for a company that is not loaded yet share a single download (singleflight). Loaded
+    storage contexts are kept in a memory bounded LRU, whose size is approximated by the size of the persisted
+    files. Indices are downloaded to folders keyed by their version, which the processes of the host share:
+    they memory-map the same vectors. The returned storage contexts are shared and must not be modified, see
+    copy_storage_context.
+    """
+
+    def __init__(self, storage: Storage, local_dir: str, max_bytes: int) -> None:
+        self.storage = storage
+        self.local_dir = local_dir
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, Tuple[StorageContext, int]] = OrderedDict()
+        self._loading: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, company: str) -> StorageContext:
+        """
+        Returns the storage context of the company index, loading it if needed
+        :param company: Company folder in the company indices bucket, i.e. the tool name
+        """
+        with self._lock:
+            entry = self._entries.get(company)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(company)
+                return entry[0]
+
+            future = self._loading.get(company)
+            leader = future is None
+            if leader:
+                self.misses += 1
+                future = self._loading[company] = Future()
+
+        if leader:
+            try:
+                storage_context, size = self._load(company)
+                self._put(company, storage_context, size)
+                future.set_result(storage_context)
+            except Exception as exc:
+                future.set_exception(exc)
+            finally:
+                with self._lock:
+                    self._loading.pop(company, None)
+        return future.result()
+
+    def _load(self, company: str) -> Tuple[StorageContext, int]:
+        files_metadata = self.storage.get_files_metadata(f"{company}/")
+        if not files_metadata:
+            raise FileNotFoundError(f"No index for company {company}")
+
+        download = partial(self.storage.download_folder, f"{company}/")
+        local_path = os.path.join(self.local_dir, company)
+        with shared_persist_dir(local_path, folder_version(files_metadata), download) as company_index_dir:
+            storage_context = load_storage_context(company_index_dir)
+        _logger.info(f"Company {company} loaded")
+        return storage_context, sum(metadata["size"] or 0 for metadata in files_metadata.values())
+
+    def _put(self, company: str, storage_context: StorageContext, size: int):
+        with self._lock:
+            self._entries[company] = (storage_context, size)
+            self.current_bytes += size
+            # The company just loaded stays, even when it is larger than the cache on its own
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                name, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+                _logger.info(f"Company {name} evicted")
+
+    def prefetch(self, companies: Iterable[str]) -> threading.Thread:
+        """
+        Loads the given companies in the background, requests for them wait for the load in progress
+        """
+
+        def run():
+            for company in companies:
+                try:
+                    self.get(company)
+                except Exception:
+                    _logger.exception(f"Failed to prefetch company {company}")
+
+        thread = threading.Thread(target=run, name="company-prefetch", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
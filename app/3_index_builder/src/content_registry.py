@@ -0,0 +1,125 @@
+import os
+import shutil
+import uuid
+from typing import Dict, List, Optional
+
+from llama_index import ServiceContext, load_index_from_storage
+from llama_index.schema import BaseNode, RelatedNodeInfo
+from logger import create_logger
+from mmap_store import load_storage_context
+from storage import Storage
+
+_logger = create_logger("index_builder:content_registry")
+
+CONTENT_HASH_FNAME = "content_hash"
+
+
+def _with_fresh_ids(nodes: List[BaseNode]) -> List[BaseNode]:
+    """
+    Gives the nodes and their source documents new IDs, so that indices reusing the same content never share a
+    node or ref doc ID. Relationships between the nodes are remapped to the new IDs.
+    """
+    new_ids: Dict[str, str] = {}
+
+    def new_id(node_id: str) -> str:
+        return new_ids.setdefault(node_id, str(uuid.uuid4()))
+
+    def remap(related: RelatedNodeInfo) -> RelatedNodeInfo:
+        return related.copy(update={"node_id": new_id(related.node_id)})
+
+    for node in nodes:
+        node.id_ = new_id(node.node_id)
+        node.relationships = {
+            relationship: [remap(item) for item in related] if isinstance(related, list) else remap(related)
+            for relationship, related in node.relationships.items()
+        }
+    return nodes
+
+
+class ContentIndexRegistry:
+    """
+    Maps the SHA-256 of an uploaded file to the index built from it, so that the same document is parsed
+    and embedded once for the whole fleet. Artifacts live in storage under `<prefix>/<hash>/`.
+
+    Every conversation index built from an artifact holds a reference `<prefix>/_refs/<hash>/<index path>` and
+    records the hash in its own folder. The artifact is deleted with its last reference. Only attachments
+    are registered, corpus documents are indexed per company and never looked up here.
+    """
+
+    def __init__(self, storage: Storage, prefix: str, local_dir: str) -> None:
+        self.storage = storage
+        self.prefix = prefix
+        self.local_dir = local_dir
+
+    def _remote_path(self, content_hash: str) -> str:
+        return f"{self.prefix}/{content_hash}"
+
+    def _refs_path(self, content_hash: str) -> str:
+        return f"{self.prefix}/_refs/{content_hash}"
+
+    def acquire(self, content_hash: str, index_path: str):
+        """
+        Records that the index uploaded to index_path uses the artifact of the given content
+        :param index_path: Storage folder of a conversation index, `<conversation ID>/<file name>`
+        """
+        self.storage.upload_file_from_memory(content_hash.encode(), f"{index_path}/{CONTENT_HASH_FNAME}")
+        self.storage.upload_file_from_memory(b"", f"{self._refs_path(content_hash)}/{index_path}")
+
+    def release(self, index_path: str):
+        """
+        Drops the reference of a conversation index about to be deleted, and the artifact it used when no
+        other index uses it
+        """
+        hash_path = f"{index_path}/{CONTENT_HASH_FNAME}"
+        # exists() differs between the storage backends, listing the exact path doesn't
+        if hash_path not in self.storage.list_files(prefix=hash_path):
+            return
+
+        os.makedirs(self.local_dir, exist_ok=True)
+        local_path = os.path.join(self.local_dir, f"{uuid.uuid4()}.{CONTENT_HASH_FNAME}")
+        try:
+            self.storage.download_file(hash_path, local_path)
+            with open(local_path) as file:
+                content_hash = file.read().strip()
+        finally:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+
+        refs_path = self._refs_path(content_hash)
+        self.storage.delete_file(f"{refs_path}/{index_path}")
+        if not self.storage.list_files(prefix=f"{refs_path}/"):
+            # An index being built from this content meanwhile already holds its nodes, and acquires after
+            self.storage.delete_folder(self._remote_path(content_hash))
+            _logger.info(f"Deleted index for content {content_hash}, no conversation index uses it anymore")
+
+    def lookup(self, content_hash: str, service_context: ServiceContext) -> Optional[List[BaseNode]]:
+        """
+        Returns the embedded nodes of an already indexed document under new IDs, or None if the content is new
+        :param content_hash: Hex SHA-256 of the file
+        :param service_context: Service context used to load the registered index
+        """
+        remote_path = self._remote_path(content_hash)
+        if not self.storage.list_files(prefix=f"{remote_path}/"):
+            return None
+
+        # Concurrent uploads of the same content each load their own copy
+        local_path = os.path.join(self.local_dir, f"{content_hash}-{uuid.uuid4().hex}")
+        try:
+            self.storage.download_folder(remote_path, local_path)
+            index = load_index_from_storage(load_storage_context(local_path), service_context=service_context)
+            nodes = list(index.docstore.docs.values())
+            # The embeddings live in the vector store, nodes carrying them are not embedded again
+            for node in nodes:
+                node.embedding = index.vector_store.get(node.node_id)
+        finally:
+            shutil.rmtree(local_path, ignore_errors=True)
+
+        _logger.info(f"Reusing {len(nodes)} embedded nodes for content {content_hash}")
+        return _with_fresh_ids(nodes)
+
+    def register(self, content_hash: str, persist_dir: str):
+        """
+        Publishes a freshly persisted index as the artifact of the given content
+        """
+        self.storage.upload_folder(persist_dir, self._remote_path(content_hash))
+        _logger.info(f"Registered index for content {content_hash}")
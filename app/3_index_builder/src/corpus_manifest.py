@@ -0,0 +1,95 @@
+import json
+import os
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
+from logger import create_logger
+from storage import Storage
+
+_logger = create_logger("index_builder:corpus_manifest")
+
+# Namespace of the document IDs derived from the corpus file paths
+DOCUMENT_ID_NAMESPACE = uuid.UUID("5b0d4c3e-8f1a-4c6e-9a57-2d8e6f1b3c90")
+
+
+@dataclass
+class CorpusChanges:
+    # Corpus file paths ("<company>/<file name>")
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+    @property
+    def to_index(self) -> List[str]:
+        return self.added + self.changed
+
+    @property
+    def companies(self) -> Set[str]:
+        return {file.split("/")[0] for file in self.added + self.changed + self.removed}
+
+
+class CorpusManifest:
+    """
+    Record of the corpus files indexed into the company indices: their document ID, the version (GCS md5 hash
+    or S3 ETag) they were indexed at and the IDs of the documents they were parsed into.
+
+    Comparing it with the corpus bucket tells which files have to be indexed again, and which documents to
+    remove from the company indices.
+    """
+
+    def __init__(self, files: Dict[str, Dict]) -> None:
+        self.files = files
+
+    @classmethod
+    def load(cls, storage: Storage, remote_path: str) -> "CorpusManifest":
+        if not storage.exists(remote_path):
+            _logger.info(f"No corpus manifest at {remote_path}, starting from an empty one")
+            return cls({})
+
+        local_path = f"/tmp/corpus-manifest-{uuid.uuid4().hex}.json"
+        try:
+            storage.download_file(remote_path, local_path)
+            with open(local_path) as file:
+                return cls(json.load(file)["files"])
+        finally:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+
+    def save(self, storage: Storage, remote_path: str):
+        storage.upload_file_from_memory(json.dumps({"files": self.files}), remote_path)
+
+    def diff(self, listing: Dict[str, Dict]) -> CorpusChanges:
+        """
+        Compares the manifest with the corpus bucket
+        :param listing: Output of Storage.get_files_metadata for the corpus bucket
+        """
+        changes = CorpusChanges()
+        for file, metadata in listing.items():
+            if file not in self.files:
+                changes.added.append(file)
+            elif self.files[file]["version"] != str(metadata["hash"]):
+                changes.changed.append(file)
+        changes.removed = [file for file in self.files if file not in listing]
+        return changes
+
+    def companies(self) -> Set[str]:
+        return {file.split("/")[0] for file in self.files}
+
+    def document_id(self, file: str) -> str:
+        """
+        Returns the ID of an indexed file, which is kept when the file changes, or the ID derived from its
+        path, so that a run interrupted before saving the manifest gives the file the same ID again
+        """
+        if file in self.files:
+            return self.files[file]["document_id"]
+        return str(uuid.uuid5(DOCUMENT_ID_NAMESPACE, file))
+
+    def ref_doc_ids(self, file: str) -> List[str]:
+        return self.files.get(file, {}).get("ref_doc_ids", [])
+
+    def record(self, file: str, document_id: str, version: str, ref_doc_ids: List[str]):
+        self.files[file] = {"document_id": document_id, "version": version, "ref_doc_ids": ref_doc_ids}
+
+    def remove(self, file: str):
+        self.files.pop(file, None)
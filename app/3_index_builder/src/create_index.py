@@ -1,21 +1,33 @@
 import asyncio
 import logging
+import multiprocessing
 import os
+import shutil
 import sys
-import uuid
+import threading
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Callable, Dict, List
 
 import openai
 import variables as vars
+from corpus_manifest import CorpusChanges, CorpusManifest
 from db.client.client import Prisma
+from embedding import get_embed_model
 from llama_index import (
     ServiceContext,
     SimpleDirectoryReader,
     VectorStoreIndex,
+    load_index_from_storage,
 )
-from llama_index.embeddings import HuggingFaceEmbedding
 from llama_index.llms import OpenAI
 from llama_index.node_parser import SimpleNodeParser
+from llama_index.schema import BaseNode, Document, MetadataMode
+from mmap_store import load_storage_context, persist_bm25_index, persist_storage_context
+from mmap_store.variables import INDEX_FORMAT
 from storage import Storage
+from storage.transfer import get_transfer_engine
 
 openai.api_key = vars.OPENAI_KEY
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -33,8 +45,8 @@ def setup():
     logging.basicConfig(stream=sys.stdout, level=logging.INFO)
     logging.getLogger().addHandler(logging.StreamHandler(stream=sys.stdout))
 
-    # loads hf embedding model
-    embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-large-en")
+    # loads hf embedding model, corpus nodes are embedded in large batches
+    embed_model = get_embed_model("BAAI/bge-large-en", embed_batch_size=vars.CORPUS_EMBED_BATCH_SIZE)
 
     # set service context so llama index knows what models to use
     node_parser = SimpleNodeParser.from_defaults(chunk_size=256, chunk_overlap=20)
@@ -57,69 +69,260 @@ def metadata(filename, files_ids, company):
     }
 
 
+def load_file(file_path: str, file_metadata: Dict) -> List[Document]:
+    """
+    Parses a corpus file, runs in the parsing process pool
+    """
+    return SimpleDirectoryReader(input_files=[file_path], file_metadata=lambda _: file_metadata).load_data()
+
+
+def embed_nodes(nodes: List[BaseNode], service_context: ServiceContext):
+    """
+    Embeds the nodes in batches of CORPUS_EMBED_BATCH_SIZE, the index reuses these embeddings
+    """
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    embeddings = service_context.embed_model.get_text_embedding_batch(texts, show_progress=True)
+    for node, embedding in zip(nodes, embeddings):
+        node.embedding = embedding
+
+
+def build_ann_index_enabled(nodes: int) -> bool:
+    # The ANN index is built over the binary vectors
+    return vars.CORPUS_ANN_INDEX != "none" and INDEX_FORMAT == "binary" and nodes >= vars.CORPUS_ANN_MIN_NODES
+
+
+def update_company_index(
+    company: str,
+    nodes: List[BaseNode],
+    stale_ref_doc_ids: List[str],
+    exists: bool,
+    service_context: ServiceContext,
+    corpus_indices_client,
+):
+    """
+    Applies the changes of a company to its index: the documents of changed and removed files are deleted and
+    the new nodes inserted. Companies without an index yet get a new one, companies left without documents
+    have their index removed.
+    """
+    vector_path = os.path.join(VECTOR_STORAGE, company)
+    shutil.rmtree(vector_path, ignore_errors=True)
+    if exists:
+        corpus_indices_client.download_folder(f"{company}/", vector_path)
+        index = load_index_from_storage(load_storage_context(vector_path), service_context=service_context)
+        for ref_doc_id in stale_ref_doc_ids:
+            index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+        index.insert_nodes(nodes)
+    else:
+        index = VectorStoreIndex(nodes, service_context=service_context)
+        index.set_index_id(f"{company}_index")
+
+    if not index.docstore.docs:
+        corpus_indices_client.delete_folder(f"{company}/")
+        print(f"Removed index: {company}")
+        return
+
+    persist_storage_context(index.storage_context, vector_path)
+    if build_ann_index_enabled(len(index.docstore.docs)):
+        # Imported here, faiss is only required when the ANN index is enabled
+        from mmap_store.ann import build_ann_index
+
+        build_ann_index(vector_path, vars.CORPUS_ANN_INDEX)
+    if vars.SPARSE_INDEX:
+        persist_bm25_index(index.docstore, vector_path)
+    corpus_indices_client.upload_folder(vector_path, company)
+    print(f"Uploaded index: {company} (+{len(nodes)} nodes, -{len(stale_ref_doc_ids)} documents)")
+
+
+def build_corpus_indices(
+    changes: CorpusChanges,
+    files_ids,
+    manifest: CorpusManifest,
+    corpus_files_client,
+    corpus_indices_client,
+    service_context,
+    on_uploaded: Callable[[str, Dict[str, List[str]]], None],
+):
+    """
+    Updates the company indices in a staged pipeline. Files are downloaded concurrently and parsed in a
+    process pool as soon as they land. Once every file of a company is parsed, its nodes are embedded on this
+    thread while the indices of the previous companies are updated and uploaded by a bounded pool.
+    :param on_uploaded: Called on the build thread once the index of a company is uploaded, with the IDs of
+        the documents each of its indexed files was parsed into
+    """
+    remaining = {company: 0 for company in changes.companies}
+    for file in changes.to_index:
+        remaining[file.split("/")[0]] += 1
+    stale_ref_doc_ids = defaultdict(list)
+    for file in changes.changed + changes.removed:
+        stale_ref_doc_ids[file.split("/")[0]].extend(manifest.ref_doc_ids(file))
+    existing_companies = manifest.companies()
+    documents = defaultdict(list)
+    ref_doc_ids = {}
+
+    engine = get_transfer_engine()
+    # Parsers are spawned rather than forked from this process, which already runs the model and I/O threads
+    parse_pool = ProcessPoolExecutor(
+        max_workers=vars.CORPUS_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+    build_pool = ThreadPoolExecutor(max_workers=vars.CORPUS_BUILD_WORKERS, thread_name_prefix="corpus-build")
+    with parse_pool, build_pool:
+        builds = []
+
+        def build(company: str, nodes: List[BaseNode], company_ref_doc_ids: Dict[str, List[str]]):
+            update_company_index(
+                company,
+                nodes,
+                stale_ref_doc_ids[company],
+                company in existing_companies,
+                service_context,
+                corpus_indices_client,
+            )
+            on_uploaded(company, company_ref_doc_ids)
+
+        def update(company: str):
+            print(f"Updating index: {company}")
+            nodes = service_context.node_parser.get_nodes_from_documents(documents.pop(company, []))
+            embed_nodes(nodes, service_context)
+            company_ref_doc_ids = {
+                file: ref_doc_ids.pop(file) for file in list(ref_doc_ids) if file.split("/")[0] == company
+            }
+            builds.append(build_pool.submit(build, company, nodes, company_ref_doc_ids))
+
+        # Companies that only lost files have nothing to parse
+        for company in [company for company, count in remaining.items() if count == 0]:
+            update(company)
+
+        pending = {}
+        for file in changes.to_index:
+            download = partial(corpus_files_client.download_file, file, f"{FILES_FOLDER}/{file}")
+            pending[engine.executor.submit(engine.measure, "download", file, download)] = ("download", file)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, file = pending.pop(future)
+                company, file_name = file.split("/")
+                if stage == "download":
+                    future.result()
+                    file_metadata = metadata(file, files_ids, company)
+                    parse = parse_pool.submit(load_file, f"{FILES_FOLDER}/{file}", file_metadata)
+                    pending[parse] = ("parse", file)
+                    continue
+
+                file_documents = future.result()
+                # Stable IDs let the next incremental run delete exactly the documents of this file
+                for page, document in enumerate(file_documents):
+                    document.id_ = f"{files_ids[company][file_name]}_{page}"
+                ref_doc_ids[file] = [document.id_ for document in file_documents]
+                documents[company].extend(file_documents)
+                remaining[company] -= 1
+                if remaining[company] == 0:
+                    update(company)
+
+        for future in builds:
+            future.result()
+
+
 async def is_documents_table_empty():
     result = await prisma.document.find_first()
     return result is None
 
 
 async def create_documents_build_index(
-    corpus_files_bucket_name, corpus_indices_bucket_name, service_context
+    corpus_files_bucket_name, corpus_indices_bucket_name, service_context, mode=vars.CORPUS_BUILD_MODE
 ):
-    if not await is_documents_table_empty():
-        try:
-            await prisma.document.delete_many(where={"source": "CORPUS"})
-        except Exception as e:
-            print(f"Something happened deleting db records: {e}")
-    else:
-        print("Skipping deletion step because documents table is empty!")
-
     gcs_corpus_files_client = Storage(corpus_files_bucket_name)
     gcs_corpus_indices_client = Storage(corpus_indices_bucket_name)
 
-    files = gcs_corpus_files_client.list_files()
-    downloaded_companies = []
-    files_ids = {}
-    for file in files:
+    manifest = CorpusManifest.load(gcs_corpus_indices_client, vars.CORPUS_MANIFEST_PATH)
+    if not manifest.files:
+        # Without a manifest the existing records and indices can't be matched to the corpus files
+        mode = "full"
+
+    if mode == "full":
+        if not await is_documents_table_empty():
+            try:
+                await prisma.document.delete_many(where={"source": "CORPUS"})
+            except Exception as e:
+                print(f"Something happened deleting db records: {e}")
+        else:
+            print("Skipping deletion step because documents table is empty!")
+        manifest = CorpusManifest({})
+        # A run interrupted before its first company is uploaded starts over in full mode
+        manifest.save(gcs_corpus_indices_client, vars.CORPUS_MANIFEST_PATH)
+
+    listing = gcs_corpus_files_client.get_files_metadata("")
+    changes = manifest.diff(listing)
+    print(
+        f"Corpus changes ({mode}): {len(changes.added)} added, {len(changes.changed)} changed, "
+        f"{len(changes.removed)} removed"
+    )
+    if not changes.companies:
+        return
+
+    files_ids = defaultdict(dict)
+    documents = defaultdict(list)
+    added = set(changes.added)
+    for file in changes.to_index:
         company, file_name = file.split("/")
-        if company not in set(downloaded_companies):
-            files_ids[company] = {}
-            downloaded_companies.append(company)
-            print(f"Creating directory: {company}")
-            os.mkdir(f"{FILES_FOLDER}/{company}")
-        gcs_corpus_files_client.download_file(file, f"{FILES_FOLDER}/{file}")
-
-        document_id = uuid.uuid4()
-        files_ids[company][file_name] = str(document_id)
-        await prisma.document.create(
-            data={
-                "id": str(document_id),
-                "name": file_name,
-                "source": "CORPUS",
-                "link": f"gs://{corpus_files_bucket_name}/{file}",
-                "credentials": "CLOUD_STORAGE_CREDENTIALS",  # This is the env var that contains credentials
-            }
-        )
-        print(f"Created file in documents table: {file_name}")
-
-    companies = os.listdir(FILES_FOLDER)
-    print(f"Downloaded folders: {companies}")
-    for company in companies:
-        vector_path = os.path.join(VECTOR_STORAGE, company)
-        docs_path = os.path.join(FILES_FOLDER, company)
-
-        print("Creating index...")
-        docs = SimpleDirectoryReader(
-            docs_path,
-            file_metadata=lambda filename: metadata(filename, files_ids, company),
-        ).load_data()
-
-        index = VectorStoreIndex.from_documents(
-            docs,
-            service_context=service_context,
+        document_id = manifest.document_id(file)
+        files_ids[company][file_name] = document_id
+        if file in added:
+            documents[company].append(
+                {
+                    "id": document_id,
+                    "name": file_name,
+                    "source": "CORPUS",
+                    "link": f"gs://{corpus_files_bucket_name}/{file}",
+                    # This is the env var that contains credentials
+                    "credentials": "CLOUD_STORAGE_CREDENTIALS",
+                }
+            )
+        os.makedirs(f"{FILES_FOLDER}/{company}", exist_ok=True)
+    removed = defaultdict(list)
+    for file in changes.removed:
+        removed[file.split("/")[0]].append(file)
+
+    loop = asyncio.get_running_loop()
+    manifest_lock = threading.Lock()
+
+    async def write_records(company: str):
+        # Document IDs are derived from the file paths, records of a run interrupted after this point are
+        # skipped when the company is indexed again
+        if documents[company]:
+            await prisma.document.create_many(data=documents[company], skip_duplicates=True)
+        removed_ids = [manifest.document_id(file) for file in removed[company]]
+        if removed_ids:
+            await prisma.document.delete_many(where={"id": {"in": removed_ids}})
+        print(
+            f"Created {len(documents[company])} and removed {len(removed_ids)} files of {company} in "
+            "documents table"
         )
-        index.set_index_id(f"{company}_index")
-        index.storage_context.persist(persist_dir=vector_path)
-        gcs_corpus_indices_client.upload_folder(vector_path, company)
+
+    def commit(company: str, company_ref_doc_ids: Dict[str, List[str]]):
+        """
+        Writes the document records of a company once its index is uploaded, then records its files in the
+        manifest. A failure of another company leaves the companies committed so far indexed.
+        """
+        asyncio.run_coroutine_threadsafe(write_records(company), loop).result()
+        with manifest_lock:
+            for file in removed[company]:
+                manifest.remove(file)
+            for file, file_ref_doc_ids in company_ref_doc_ids.items():
+                document_id = files_ids[company][file.split("/")[1]]
+                manifest.record(file, document_id, str(listing[file]["hash"]), file_ref_doc_ids)
+            manifest.save(gcs_corpus_indices_client, vars.CORPUS_MANIFEST_PATH)
+
+    await asyncio.to_thread(
+        build_corpus_indices,
+        changes,
+        files_ids,
+        manifest,
+        gcs_corpus_files_client,
+        gcs_corpus_indices_client,
+        service_context,
+        commit,
+    )
 
 
 async def main():
@@ -127,8 +330,9 @@ async def main():
     corpus_files_bucket_name = vars.CORPUS_FILE_BUCKET
     corpus_indices_bucket_name = vars.CORPUS_INDICES_BUCKET
     service_context = setup()
+    mode = "full" if "--full" in sys.argv else vars.CORPUS_BUILD_MODE
     await create_documents_build_index(
-        corpus_files_bucket_name, corpus_indices_bucket_name, service_context
+        corpus_files_bucket_name, corpus_indices_bucket_name, service_context, mode
     )
     await prisma.disconnect()
 
@@ -2,6 +2,7 @@ import json
 
 import variables as vars
 from attachment_proto.attachment_pb2 import AttachmentDeletionMessage
+from content_registry import ContentIndexRegistry
 from logger import create_logger
 from pika.spec import Basic, BasicProperties
 from rabbitmq import PubSub, RabbitMQ
@@ -34,6 +35,8 @@ def delete_index(channel, method: Basic.Deliver, properties: BasicProperties, bo
     try:
         # Upload the index to GCS
         storage = Storage(vars.CONV_INDICES_BUCKET_NAME)
+        registry = ContentIndexRegistry(storage, vars.CONTENT_INDEX_PREFIX, vars.TEMP_INDICES_DIR)
+        registry.release(f"{conversation_id}/{filename}")
         storage.delete_folder(remote_path=f"{conversation_id}/{filename}")
 
         status = "DELETED"
@@ -1,19 +1,23 @@
+import hashlib
 import json
 import os
+import shutil
 
 import variables as vars
 from attachment_proto.attachment_pb2 import Attachment
+from content_registry import ContentIndexRegistry
+from embedding import get_embed_model
 from llama_index import ServiceContext, SimpleDirectoryReader, VectorStoreIndex
 from llama_index.callbacks import (
     CallbackManager,
     LlamaDebugHandler,
     OpenInferenceCallbackHandler,
 )
-from llama_index.embeddings import HuggingFaceEmbedding
 from llama_index.llms import OpenAI
 from logger import create_logger
+from mmap_store import persist_bm25_index, persist_storage_context
 from pika.spec import Basic, BasicProperties
-from rabbitmq import PubSub, RabbitMQ
+from rabbitmq import PubSub, RabbitMQConsumer
 from storage import Storage
 
 _logger = create_logger("index_builder: indexing_task")
@@ -38,7 +42,7 @@ def _init_service_context():
     callback_manager = CallbackManager([llama_debug, callback_handler])
     # service context
 
-    embed_model = HuggingFaceEmbedding(model_name=vars.EMBED_MODEL_NAME)
+    embed_model = get_embed_model(vars.EMBED_MODEL_NAME)
     llm_model = OpenAI(model=vars.LLM_MODEL_NAME, temperature=0)
 
     service_context = ServiceContext.from_defaults(
@@ -52,6 +56,34 @@ def _init_service_context():
 tool_service_context = _init_service_context()
 
 
+def _sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fetch_attachment(attachment: Attachment, file_path: str) -> str:
+    """
+    Streams the uploaded file from storage to file_path and verifies its hash
+    :param attachment: Queued attachment message
+    :param file_path: Local destination
+    :return: Hex SHA-256 of the file
+    """
+    if not attachment.storagePath:
+        # Messages queued before uploads were streamed carry the file inline
+        with open(file_path, "wb") as file:
+            file.write(attachment.fileContents)
+        return _sha256(file_path)
+
+    Storage(attachment.bucket).download_file(attachment.storagePath, file_path)
+    content_hash = _sha256(file_path)
+    if attachment.sha256 and content_hash != attachment.sha256:
+        raise ValueError(f"Hash mismatch for {attachment.bucket}/{attachment.storagePath}")
+    return content_hash
+
+
 def create_index(channel, method: Basic.Deliver, properties: BasicProperties, body):
     _logger.debug(
         f"Message Properties: {method.delivery_tag} | {method.redelivered} | {method.routing_key}"
@@ -67,62 +99,91 @@ def create_index(channel, method: Basic.Deliver, properties: BasicProperties, bo
     attachment_id = attachment.id
     filename = attachment.fileName.rsplit(".", 1)[0]
 
-    # Path where the file will be downloaded
-    file_path = os.path.join(vars.TEMP_INDICES_DIR, filename)
-    with open(file_path, "wb") as file_type:
-        file_type.write(attachment.fileContents)
-
+    # Path where the file will be downloaded, unique per attachment as several workers run concurrently
+    file_dir = os.path.join(vars.TEMP_INDICES_DIR, attachment_id)
+    os.makedirs(file_dir, exist_ok=True)
+    file_path = os.path.join(file_dir, filename)
     folder_path = os.path.join(vars.CREATED_INDICES_DIR, attachment_id)
 
     # Create an index for the file
     # TODO: Check if PyPDFLoader can use a in-memory file stream
     try:
+        content_hash = _fetch_attachment(attachment, file_path)
+
         # Upload the index to GCS
         storage = Storage(vars.CONV_INDICES_BUCKET_NAME)
+        registry = ContentIndexRegistry(storage, vars.CONTENT_INDEX_PREFIX, vars.TEMP_INDICES_DIR)
 
         metadata = lambda filename: {  # noqa: E731
             "conversation_id": conversation_id,
             "document_id": attachment_id,
         }
-        doc = SimpleDirectoryReader(
-            input_files=[file_path], file_metadata=metadata
-        ).load_data()
-
-        index = VectorStoreIndex.from_documents(
-            doc, service_context=tool_service_context
-        )
+        nodes = registry.lookup(content_hash, tool_service_context)
+        if nodes is not None:
+            # Same document already indexed elsewhere: the conversation metadata and the file name cited in
+            # answers change, the pages are the same
+            for node in nodes:
+                node.metadata.update({**metadata(filename), "file_name": filename})
+            index = VectorStoreIndex(nodes, service_context=tool_service_context)
+        else:
+            doc = SimpleDirectoryReader(
+                input_files=[file_path], file_metadata=metadata
+            ).load_data()
+
+            index = VectorStoreIndex.from_documents(
+                doc, service_context=tool_service_context
+            )
 
         index.set_index_id(f"{conversation_id}_index")
         # rebuild storage context
-        index.storage_context.persist(persist_dir=folder_path)
+        persist_storage_context(index.storage_context, folder_path)
+        if vars.SPARSE_INDEX:
+            persist_bm25_index(index.docstore, folder_path)
+        if nodes is None:
+            registry.register(content_hash, folder_path)
         storage_path = f"{conversation_id}/{filename}"
         storage.upload_folder(folder_path, storage_path)
+        registry.acquire(content_hash, storage_path)
         _logger.info(f"File stored in: {storage_path}")
 
-        status = "INDEXED"
         _logger.info(
             f"Successfully indexed file: {filename} ({attachment_id}) | {conversation_id}"
         )
     except Exception as exc:
-        status = "ERRORED"
-
+        # Raising rejects the message: it is retried, and reported as ERRORED once dead-lettered
         _logger.exception(
             f"Unable to index file: {filename} ({attachment_id}) | {conversation_id} | {exc}"
         )
+        raise
     finally:
-        # TODO: Check if the channel needs to be closed
+        shutil.rmtree(file_dir, ignore_errors=True)
+
+    _publish_status(attachment_id, filename, "INDEXED")
 
-        # Send the INDEXED status message to the pubsub topic
-        pubsub = PubSub(vars.ATTACHMENT_STATUS_EXCHANGE)
-        pubsub.publish(
-            json.dumps({"id": attachment_id, "filename": filename, "status": status})
-        )
-        _logger.info(f"Message sent to pubsub: {filename} | {status}")
+
+def _publish_status(attachment_id: str, filename: str, status: str):
+    # Send the status message to the pubsub topic
+    pubsub = PubSub(vars.ATTACHMENT_STATUS_EXCHANGE)
+    pubsub.publish(
+        json.dumps({"id": attachment_id, "filename": filename, "status": status})
+    )
+    _logger.info(f"Message sent to pubsub: {filename} | {status}")
+
+
+def on_dead_letter(body: bytes, exc: Exception):
+    attachment = Attachment()
+    attachment.ParseFromString(body)
+    _publish_status(attachment.id, attachment.fileName.rsplit(".", 1)[0], "ERRORED")
 
 
 def index_builder():
-    rabbitmq = RabbitMQ(vars.NEW_ATTACHMENT_QUEUE)
-    rabbitmq.receive(callback=create_index)
+    consumer = RabbitMQConsumer(
+        vars.NEW_ATTACHMENT_QUEUE,
+        callback=create_index,
+        workers=vars.INDEXING_WORKERS,
+        on_dead_letter=on_dead_letter,
+    )
+    consumer.start()
 
 
 if __name__ == "__main__":
@@ -16,6 +16,8 @@ NO_OF_WORKERS = os.getenv(
 
 ATTACHMENT_STATUS_EXCHANGE = os.environ["ATTACHMENT_STATUS_EXCHANGE"]
 NEW_ATTACHMENT_QUEUE = os.environ["NEW_ATTACHMENT_QUEUE"]
+# Concurrent indexing workers per process, prefetch and retries are set through the RABBITMQ_* variables
+INDEXING_WORKERS = int(os.environ.get("INDEXING_WORKERS", 2))
 INDEX_DELETION_QUEUE = os.environ["INDEX_DELETION_QUEUE"]
 
 CONV_INDICES_BUCKET_NAME = os.environ["CONV_INDICES_BUCKET_NAME"]
@@ -24,5 +26,41 @@ CORPUS_INDICES_BUCKET = os.environ["CORPUS_INDICES_BUCKET"]
 GCS_INDEX_BUILDER_BUCKET = os.environ["GCS_INDEX_BUILDER_BUCKET"]
 MERGED_INDICES_BUCKET_NAME = os.environ["MERGED_INDICES_BUCKET_NAME"]
 
+# Files every persisted index has, whether its vectors are stored as JSON or as a binary matrix
+VECTOR_INDEX_FILENAMES = ["docstore.json", "index_store.json"]
+
+# merged: persist a full copy of the company index with the attachments for every sub-question
+# overlay: only publish a manifest, the query engine keeps the company index resident and queries the
+#          attachment indices alongside it
+INDEX_MODE = os.environ.get("INDEX_MODE", "merged").lower()
+OVERLAY_MANIFEST_FILENAME = "overlay.json"
+
+# Corpus rebuild (create_index.py): PDF parsing processes, texts per embedding batch and concurrent
+# per-company index builds and uploads
+CORPUS_PARSE_WORKERS = int(os.environ.get("CORPUS_PARSE_WORKERS", os.cpu_count() or 1))
+CORPUS_EMBED_BATCH_SIZE = int(os.environ.get("CORPUS_EMBED_BATCH_SIZE", 256))
+CORPUS_BUILD_WORKERS = int(os.environ.get("CORPUS_BUILD_WORKERS", 4))
+# incremental: only index the corpus files added, changed or removed since the manifest was written
+# full: delete every corpus document and rebuild all company indices
+CORPUS_BUILD_MODE = os.environ.get("CORPUS_BUILD_MODE", "incremental").lower()
+# Path of the corpus manifest in CORPUS_INDICES_BUCKET, prefixed paths are not company indices
+CORPUS_MANIFEST_PATH = os.environ.get("CORPUS_MANIFEST_PATH", "_corpus/manifest.json")
+# ANN index persisted next to the vectors of company indices with at least CORPUS_ANN_MIN_NODES nodes:
+# none, hnsw or ivfpq. Its build and search parameters are the ANN_* variables of mmap_store.
+CORPUS_ANN_INDEX = os.environ.get("CORPUS_ANN_INDEX", "none").lower()
+CORPUS_ANN_MIN_NODES = int(os.environ.get("CORPUS_ANN_MIN_NODES", 200_000))
+# Persist a BM25 inverted index next to the corpus and attachment indices, for hybrid retrieval
+SPARSE_INDEX = os.environ.get("SPARSE_INDEX", "true").lower() == "true"
+
+# Company indices are loaded on their first buildIndex and kept in an LRU bounded by their persisted size.
+# The comma separated hot set is loaded in the background at startup.
+COMPANY_INDEX_CACHE_MAX_BYTES = int(os.environ.get("COMPANY_INDEX_CACHE_MAX_BYTES", 8 * 1024**3))
+COMPANY_INDEX_PREFETCH = [
+    company for company in os.environ.get("COMPANY_INDEX_PREFETCH", "").split(",") if company
+]
+
+# Prefix of the content hash -> index registry in CONV_INDICES_BUCKET_NAME
+CONTENT_INDEX_PREFIX = os.environ.get("CONTENT_INDEX_PREFIX", "_content")
+
 LLM_MODEL_NAME = "gpt-4-1106-preview"
 EMBED_MODEL_NAME = "BAAI/bge-large-en"
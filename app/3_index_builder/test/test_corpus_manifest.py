@@ -0,0 +1,58 @@
+import uuid
+
+from corpus_manifest import CorpusManifest
+
+
+def record(document_id: str) -> dict:
+    return {"document_id": document_id, "version": "v1", "ref_doc_ids": [f"{document_id}_0"]}
+
+
+def manifest():
+    return CorpusManifest(
+        {
+            "AAPL/10K_2022.pdf": record("aapl-2022"),
+            "AAPL/10K_2021.pdf": record("aapl-2021"),
+            "MSFT/10K_2022.pdf": record("msft-2022"),
+        }
+    )
+
+
+def test_diff():
+    listing = {
+        "AAPL/10K_2022.pdf": {"hash": "v1"},
+        "AAPL/10K_2021.pdf": {"hash": "v2"},
+        "NVDA/10K_2022.pdf": {"hash": "v1"},
+    }
+    changes = manifest().diff(listing)
+    assert changes.added == ["NVDA/10K_2022.pdf"]
+    assert changes.changed == ["AAPL/10K_2021.pdf"]
+    assert changes.removed == ["MSFT/10K_2022.pdf"]
+    assert changes.to_index == ["NVDA/10K_2022.pdf", "AAPL/10K_2021.pdf"]
+    assert changes.companies == {"AAPL", "MSFT", "NVDA"}
+
+
+def test_diff_unchanged():
+    listing = {file: {"hash": record["version"]} for file, record in manifest().files.items()}
+    changes = manifest().diff(listing)
+    assert not changes.to_index and not changes.removed and not changes.companies
+
+
+def test_diff_empty_manifest():
+    changes = CorpusManifest({}).diff({"AAPL/10K_2022.pdf": {"hash": 1234}})
+    assert changes.added == ["AAPL/10K_2022.pdf"]
+
+
+def test_diff_compares_versions_as_strings():
+    # GCS hashes are strings, S3 ETags may be listed as other types
+    changes = CorpusManifest({"AAPL/10K_2022.pdf": {"document_id": "a", "version": "1234"}}).diff(
+        {"AAPL/10K_2022.pdf": {"hash": 1234}}
+    )
+    assert not changes.changed
+
+
+def test_document_id():
+    assert manifest().document_id("AAPL/10K_2022.pdf") == "aapl-2022"
+    new_id = manifest().document_id("NVDA/10K_2022.pdf")
+    assert new_id == CorpusManifest({}).document_id("NVDA/10K_2022.pdf")
+    assert new_id != manifest().document_id("NVDA/10K_2023.pdf")
+    assert uuid.UUID(new_id).version == 5
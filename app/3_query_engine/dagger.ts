@@ -14,7 +14,7 @@ const container = async (client: Client): Promise<Container> => {
     .withExposedPort(5005)
     .withExec(["useradd", "-m", "app", "-u", "1001"])
     .withUser("1001")
-    .withEnvVariable("PYTHONPATH", "/module/gen_deps:/module/src:/module/gen_deps/query_engine_proto:/module/gen_deps/attachment_proto:/module/gen_deps/storage:/module/gen_deps/rabbitmq")
+    .withEnvVariable("PYTHONPATH", "/module/gen_deps:/module/src:/module/gen_deps/query_engine_proto:/module/gen_deps/embedding_proto:/module/gen_deps/attachment_proto:/module/gen_deps/storage:/module/gen_deps/rabbitmq")
     .withWorkdir("/module/src")
     .withEntrypoint(["python", "-u", "app.py"])
 }
@@ -1,16 +1,17 @@
 import asyncio
+import json
 import os
-import pickle
 import shutil
+import uuid
+from functools import partial
 
 import grpc
 import numpy as np
 import variables as vars
-from llama_index import (
-    StorageContext,
-    load_index_from_storage,
-)
+from llama_index import load_index_from_storage
+from index_cache import IndexCache, content_key
 from logger import configure_logging, create_logger
+from mmap_store import load_storage_context, shared_persist_dir
 from query_engine import Config
 from query_engine_proto import query_engine_pb2, query_engine_pb2_grpc
 from storage import Storage
@@ -27,9 +28,91 @@ else:
     from query_engine_mock import QueryEngineMock as QueryEngine
 
 
+def to_source_node(source: dict) -> query_engine_pb2.SourceNode:
+    """
+    Converts a citation into the typed SourceNode sent to the backend and the response synthesizer
+    :param source: Citation as returned by QueryEngine.generate
+    """
+    node = source["node"]
+    embedding = node.node.embedding if vars.CITATION_EMBEDDINGS else None
+    return query_engine_pb2.SourceNode(
+        node_id=node.node.node_id,
+        text=source["text"],
+        score=node.score or 0.0,
+        document_id=source["document_id"],
+        page=str(source["page"]),
+        file_name=source["filename"] or "",
+        embedding=embedding or [],
+    )
+
+
 class QueryEngineService(query_engine_pb2_grpc.QueryEngineServicer):
     def __init__(self):
         self.query_engine = QueryEngine()
+        if vars.WARMUP:
+            self.query_engine.warmup()
+        # Loaded indices are shared across requests: a retry, or a follow-up sub-question against the
+        # same index content, skips both the download and the JSON deserialization
+        self.index_cache = IndexCache(max_bytes=vars.INDEX_CACHE_MAX_BYTES)
+
+    def _load_index(self, persist_dir):
+        return load_index_from_storage(
+            load_storage_context(persist_dir),
+            service_context=self.query_engine.index_service_context,
+        )
+
+    def _load_cached_index(self, storage, remote_path, local_path, files_metadata=None, shared=False):
+        """
+        Returns the index persisted under remote_path, downloading it only on a cache miss
+        :param shared: Keep the downloaded files in a folder shared by the worker processes, which then map
+            the same vectors. Meant for the large, long-lived company indices.
+        """
+
+        def download_and_load():
+            if shared:
+                download = partial(storage.download_folder, remote_path)
+                with shared_persist_dir(local_path, content_key(files_metadata), download) as persist_dir:
+                    return self._load_index(persist_dir)
+
+            # A fresh folder per load: downloading over the files of a cached, memory-mapped index would
+            # modify it in place. Once loaded, the files can go, mapped vectors stay readable until unmapped.
+            download_path = f"{local_path}-{uuid.uuid4().hex}"
+            try:
+                storage.download_folder(remote_path, download_path)
+                return self._load_index(download_path)
+            finally:
+                shutil.rmtree(download_path, ignore_errors=True)
+
+        if files_metadata is None:
+            files_metadata = storage.get_files_metadata(remote_path)
+        if not files_metadata:
+            raise FileNotFoundError(f"No index found at: {remote_path}")
+        return self.index_cache.get_or_load(files_metadata, download_and_load)
+
+    def _load_overlay_indices(self, manifest_path, conversation_index_path):
+        """
+        Loads the resident company index and the attachment side indices listed in the overlay manifest
+        :return: Company index and list of side indices
+        """
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+
+        storage = Storage(vars.CONV_INDICES_BUCKET)
+        side_indices = [
+            self._load_cached_index(
+                storage,
+                attachment_path,
+                os.path.join(conversation_index_path, os.path.basename(attachment_path)),
+            )
+            for attachment_path in manifest["attachments"]
+        ]
+        company_index = self._load_cached_index(
+            Storage(vars.COMPANY_INDICES_BUCKET),
+            manifest["toolName"],
+            os.path.join(vars.COMPANY_INDICES_DIR, manifest["toolName"]),
+            shared=True,
+        )
+        return company_index, side_indices
 
     def getSubContextLength(
         self, request: query_engine_pb2.SubEmpty, context
@@ -53,24 +136,34 @@ class QueryEngineService(query_engine_pb2_grpc.QueryEngineServicer):
             conversation_index_path = (
                 f"{vars.TEMP_DIR}/{conversation_id}-{subquestion_id}"
             )
-            # download files from bucket
             merged_storage = Storage(vars.MERGED_INDICES_BUCKET)
-            merged_storage.download_folder(
-                f"{conversation_id}/{subquestion_id}", conversation_index_path
-            )
-
-            # Load the index from the downloaded files
-            conversation_index = load_index_from_storage(
-                StorageContext.from_defaults(persist_dir=conversation_index_path),
-                service_context=self.query_engine.index_service_context,
-            )
-            _logger.info(f"Merged index loaded from GCS: {conversation_index_path}")
+            remote_path = f"{conversation_id}/{subquestion_id}"
+            manifest_remote_path = f"{remote_path}/{vars.OVERLAY_MANIFEST_FILENAME}"
+            files_metadata = merged_storage.get_files_metadata(remote_path)
+
+            if manifest_remote_path in files_metadata:
+                manifest_path = os.path.join(conversation_index_path, vars.OVERLAY_MANIFEST_FILENAME)
+                os.makedirs(conversation_index_path, exist_ok=True)
+                merged_storage.download_file(manifest_remote_path, manifest_path)
+                conversation_index, side_indices = self._load_overlay_indices(
+                    manifest_path, conversation_index_path
+                )
+                _logger.info(f"Overlay indices loaded: {tool_name} + {len(side_indices)} attachment(s)")
+            else:
+                conversation_index = self._load_cached_index(
+                    merged_storage, remote_path, conversation_index_path, files_metadata
+                )
+                side_indices = None
+                _logger.info(f"Merged index loaded: {remote_path}")
+            _logger.info(f"Index cache: {self.index_cache.stats()}")
 
             response = self.query_engine.generate(
                 query,
                 tool_name,
                 conversation_index,
                 params,
+                side_indices,
+                list(request.years),
             )
             citations = [
                 query_engine_pb2.SubConvCitation(
@@ -78,7 +171,7 @@ class QueryEngineService(query_engine_pb2_grpc.QueryEngineServicer):
                     pagenum=int(source["page"]),
                     document_id=source["document_id"],
                     text=source["text"],
-                    node=pickle.dumps(source),
+                    node=to_source_node(source),
                 )
                 for source in response["citations"]
             ]
@@ -96,8 +189,8 @@ class QueryEngineService(query_engine_pb2_grpc.QueryEngineServicer):
                 status="FAIL",
             )
         finally:
-            if os.path.exists(f"{conversation_id}"):
-                shutil.rmtree(f"{conversation_id}")
+            if os.path.exists(conversation_index_path):
+                shutil.rmtree(conversation_index_path)
 
     def getSubDefaultParams(
         self, request: query_engine_pb2.SubEmpty, context
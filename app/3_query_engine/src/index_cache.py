@@ -0,0 +1,86 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from llama_index.indices.base import BaseIndex
+from logger import create_logger
+
+_logger = create_logger("query_engine:index_cache")
+
+
+def content_key(files_metadata: Dict[str, Dict]) -> str:
+    """
+    Content hash of a persisted index folder, independent of where the folder is stored
+    :param files_metadata: Output of Storage.get_files_metadata for the folder
+    """
+    digest = hashlib.sha256()
+    for name, metadata in sorted(files_metadata.items(), key=lambda item: item[0].rsplit("/", 1)[-1]):
+        digest.update(name.rsplit("/", 1)[-1].encode())
+        digest.update(str(metadata["hash"]).encode())
+    return digest.hexdigest()
+
+
+class IndexCache:
+    """
+    Memory bounded LRU of loaded indices keyed by the content hash of their persisted files.
+
+    The size of an entry is approximated by the size of its persisted JSON stores.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, Tuple[BaseIndex, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[BaseIndex]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, index: BaseIndex, size: int):
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                _logger.warning(f"Index {key} ({size} bytes) is larger than the cache, not caching it")
+                return
+
+            self._entries[key] = (index, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_load(self, files_metadata: Dict[str, Dict], loader: Callable[[], BaseIndex]) -> BaseIndex:
+        """
+        Returns the cached index for the given files, or loads and caches it
+        :param files_metadata: Output of Storage.get_files_metadata for the persisted index
+        :param loader: Downloads and loads the index on a miss
+        """
+        key = content_key(files_metadata)
+        index = self.get(key)
+        if index is None:
+            index = loader()
+            self.put(key, index, sum(metadata["size"] or 0 for metadata in files_metadata.values()))
+        return index
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
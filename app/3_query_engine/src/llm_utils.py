@@ -1,5 +1,6 @@
+from contextvars import ContextVar
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Dict
 
 from llama_index.llms import (
     CompletionResponse,
@@ -10,6 +11,10 @@ from llama_index.llms import (
 from llama_index.llms.base import llm_completion_callback
 from transformers import Pipeline
 
+# Sampling parameters of the request being served. The pipeline is shared by every request,
+# so the parameters are passed on each generation call instead of being baked into the pipeline.
+generation_params: ContextVar[Dict] = ContextVar("generation_params", default={})
+
 
 @dataclass
 class Config:
@@ -25,6 +30,9 @@ class Config:
     qe_repetition_penalty: float = 1.2
     qe_reranker_top_n: int = 4
     qe_similarity_top_k: int = 12
+    # ANN search effort: HNSW candidate list size and IVF lists visited, higher is slower with a higher recall
+    qe_ann_ef_search: int = 128
+    qe_ann_nprobe: int = 16
 
     @classmethod
     def from_dict(cls, config):
@@ -42,6 +50,8 @@ class Config:
         qe_similarity_top_k = int(
             config.get("qe_similarity_top_k", cls.qe_similarity_top_k)
         )
+        qe_ann_ef_search = int(config.get("qe_ann_ef_search", cls.qe_ann_ef_search))
+        qe_ann_nprobe = int(config.get("qe_ann_nprobe", cls.qe_ann_nprobe))
 
         obj = cls(
             qe_k,
@@ -52,6 +62,8 @@ class Config:
             qe_repetition_penalty,
             qe_reranker_top_n,
             qe_similarity_top_k,
+            qe_ann_ef_search,
+            qe_ann_nprobe,
         )
         return obj
 
@@ -66,6 +78,9 @@ class Config:
             "qe_repetition_penalty": config.qe_repetition_penalty,
             "qe_reranker_top_n": config.qe_reranker_top_n,
             "qe_similarity_top_k": config.qe_similarity_top_k,
+            # Unset by clients predating the ANN parameters
+            "qe_ann_ef_search": config.qe_ann_ef_search or cls.qe_ann_ef_search,
+            "qe_ann_nprobe": config.qe_ann_nprobe or cls.qe_ann_nprobe,
         }
 
         return cls.from_dict(extracted_config)
@@ -73,6 +88,17 @@ class Config:
     def to_dict(self):
         return self.__dict__
 
+    def to_vector_store_kwargs(self) -> Dict:
+        return {"ef_search": self.qe_ann_ef_search, "nprobe": self.qe_ann_nprobe}
+
+    def to_generation_kwargs(self) -> Dict:
+        return {
+            "top_k": self.qe_top_k,
+            "temperature": self.qe_temperature,
+            "repetition_penalty": self.qe_repetition_penalty,
+            "max_new_tokens": self.qe_max_new_tokens,
+        }
+
     def __post_init__(self) -> None:
         if not (1 <= self.qe_k <= 15):
             raise ValueError("k should belong to [1, 15]")
@@ -95,9 +121,17 @@ class Config:
         if not (0 <= self.qe_similarity_top_k <= 20):
             raise ValueError("similarity_top_k should belong to [0, 20]")
 
+        if not (1 <= self.qe_ann_ef_search <= 1024):
+            raise ValueError("ann_ef_search should belong to [1, 1024]")
+
+        if not (1 <= self.qe_ann_nprobe <= 1024):
+            raise ValueError("ann_nprobe should belong to [1, 1024]")
+
 
 class Responder(CustomLLM):
     model: Pipeline = None
+    # BatchScheduler sharing the model with concurrent requests, the pipeline is used when unset
+    scheduler: Any = None
     max_tokens: int = 356
     context_window: int = 2048
     model_name: str = ""
@@ -114,12 +148,14 @@ class Responder(CustomLLM):
     @llm_completion_callback()
     def complete(self, prompt: str, **kwargs: Any) -> CompletionResponse:
         prompt_length = len(prompt)
-        response = self.model(prompt, max_new_tokens=self.max_tokens, max_length=100)[
-            0
-        ]["generated_text"]
-
-        # only return newly generated tokens
-        text = response[prompt_length:]
+        kwargs = {"max_new_tokens": self.max_tokens, **generation_params.get()}
+        if self.scheduler is not None:
+            text = self.scheduler.generate(prompt, **kwargs)
+        else:
+            response = self.model(prompt, **kwargs)[0]["generated_text"]
+
+            # only return newly generated tokens
+            text = response[prompt_length:]
         return CompletionResponse(text=text)
 
     @llm_completion_callback()
@@ -1,6 +1,8 @@
 from typing import List, Optional
 
 import variables as vars
+from embedding import get_embed_model
+from generation import BATCHING_ENABLED, BatchScheduler
 from llama_index import (
     ServiceContext,
     get_response_synthesizer,
@@ -11,7 +13,6 @@ from llama_index.callbacks import (
     LlamaDebugHandler,
     OpenInferenceCallbackHandler,
 )
-from llama_index.embeddings import HuggingFaceEmbedding
 from llama_index.indices.postprocessor import SentenceTransformerRerank
 from llama_index.indices.vector_store.retrievers import (
     VectorIndexAutoRetriever,
@@ -25,8 +26,9 @@ from llama_index.query_engine.retriever_query_engine import (
 from llama_index.question_gen.types import SubQuestion
 from llama_index.schema import NodeWithScore
 from llama_index.vector_stores.types import MetadataInfo, VectorStoreInfo
-from llm_utils import Config, Responder
+from llm_utils import Config, Responder, generation_params
 from logger import create_logger
+from retrievers import HybridRetriever, OverlayRetriever, YearFilterRetriever
 from peft import PeftModel
 from transformers import (
     AutoModelForCausalLM,
@@ -62,7 +64,7 @@ class QueryEngine(object):
         llama_debug = LlamaDebugHandler(print_trace_on_end=True)  # callback_manager
         callback_handler = OpenInferenceCallbackHandler()
         self.callback_manager = CallbackManager([llama_debug, callback_handler])
-        self.embed_model = HuggingFaceEmbedding(model_name=vars.EMBEDDING_MODEL)
+        self.embed_model = get_embed_model(vars.EMBEDDING_MODEL)
         self.tokenizer = AutoTokenizer.from_pretrained(vars.MODEL_ID)
         self.index_llm_model = OpenAI(
             model=vars.INDEXING_EMBEDDING_MODEL,
@@ -93,72 +95,130 @@ class QueryEngine(object):
                 MetadataInfo(
                     name="year",
                     type="str",
-                    description="Year is the only filter.\nYear of the financial document as a string.\nOne of ['2018', '2019', '2020', '2021', '2022', '2023'].\nUse '2023' if asked for most recent or current information.",
+                    description=(
+                        "Year is the only filter.\nYear of the financial document as a string.\n"
+                        f"One of {vars.DOCUMENT_YEARS}.\n"
+                        f"Use '{max(vars.DOCUMENT_YEARS)}' if asked for most recent or current information."
+                    ),
                 ),
             ],
         )
+        self._create_pipeline()
         _logger.info("QueryEngine initialized")
 
-    def _create_instance(self, index):
-        # pipeline
+    def _create_pipeline(self):
+        """
+        Builds the text generation pipeline and the response synthesizer once per process.
+        Sampling parameters are passed per request through `generation_params`.
+        """
         llm_pipeline = pipeline(
             "text-generation",
             model=self.llm,
             tokenizer=self.tokenizer,
             use_cache=True,
             device_map="auto",
-            top_k=self.params.qe_top_k,
-            repetition_penalty=self.params.qe_repetition_penalty,
-            max_new_tokens=self.params.qe_max_new_tokens,
             do_sample=True,
-            temperature=self.params.qe_temperature,
             num_return_sequences=1,
             eos_token_id=self.tokenizer("###")["input_ids"],
             pad_token_id=self.tokenizer.eos_token_id,
         )
 
+        scheduler = None
+        if BATCHING_ENABLED:
+            # Sub-questions answered concurrently by the worker pool are decoded together
+            scheduler = BatchScheduler(
+                self.llm, self.tokenizer, eos_token_ids=self.tokenizer("###")["input_ids"]
+            )
+
         # Custom LLM Class which will be used for response generation
         responder = Responder(
             model=llm_pipeline,
+            scheduler=scheduler,
             model_name=vars.MODEL_ID,
             max_tokens=self.params.qe_max_new_tokens,
             context_window=self.context_length,
         )
 
         # Configure model and embedding model
-        tool_service_context = ServiceContext.from_defaults(
+        self.tool_service_context = ServiceContext.from_defaults(
             embed_model=self.embed_model,
             llm=responder,
             callback_manager=self.callback_manager,
         )
 
         # Response Generator: Generates response for the sub-question
-        response_synthesizer = get_response_synthesizer(
+        self.response_synthesizer = get_response_synthesizer(
             response_mode="simple_summarize",
             text_qa_template=self.prompt_template,
-            service_context=tool_service_context,
+            service_context=self.tool_service_context,
         )
+        self.responder = responder
+        _logger.info("Query Engine pipeline initialized")
 
+    def warmup(self):
+        """
+        Runs a minimal generation so that the first request does not pay for lazy initialization
+        """
+        token = generation_params.set({**self.params.to_generation_kwargs(), "max_new_tokens": 1})
+        try:
+            self.responder.complete("###")
+        finally:
+            generation_params.reset(token)
+        _logger.info("Query Engine warmed up")
+
+    def _create_instance(self, index, params, side_indices=None, years=None):
+        # Retrievers only bind the (cached) index, the pipeline and synthesizer are shared
         vector_retriever = VectorIndexAutoRetriever(
             index,
             vector_store_info=self.vector_store_info,
-            service_context=tool_service_context,
-            similarity_top_k=self.params.qe_similarity_top_k,
+            service_context=self.tool_service_context,
+            similarity_top_k=params.qe_similarity_top_k,
+            vector_store_kwargs=params.to_vector_store_kwargs(),
         )
+        if vars.RETRIEVER_MODE == "structured":
+            # The LLM only infers the filters of the sub-questions whose year can't be parsed
+            vector_retriever = YearFilterRetriever(
+                index,
+                fallback=vector_retriever,
+                similarity_top_k=params.qe_similarity_top_k,
+                hint_years=years or [],
+                vector_store_kwargs=params.to_vector_store_kwargs(),
+                # The filters the LLM infers aren't known here, only parsed filters are applied to BM25
+                rrf_k=vars.RRF_K if vars.HYBRID_SEARCH else None,
+            )
+        if side_indices:
+            # Overlay mode: attachment nodes live in side indices next to the resident company index
+            vector_retriever = OverlayRetriever(
+                [vector_retriever]
+                + [self._side_retriever(side_index, params) for side_index in side_indices],
+                similarity_top_k=params.qe_similarity_top_k,
+                rrf_k=vars.RRF_K,
+            )
 
         vector_query_engine = RetrieverQueryEngine(
             retriever=vector_retriever,
-            response_synthesizer=response_synthesizer,
+            response_synthesizer=self.response_synthesizer,
             node_postprocessors=[self.reranker],
         )
-
-        _logger.info("Query Engine pipeline initialized")
         return vector_query_engine
 
-    def _generate_answer(self, subquestion, tool_name, index, params):
-        self.params = Config().from_proto(params)
-        query_engine = self._create_instance(index)
-        answer = query_engine.query(subquestion)
+    def _side_retriever(self, side_index, params):
+        retriever = side_index.as_retriever(
+            similarity_top_k=params.qe_similarity_top_k,
+            vector_store_kwargs=params.to_vector_store_kwargs(),
+        )
+        if vars.HYBRID_SEARCH:
+            retriever = HybridRetriever(side_index, retriever, params.qe_similarity_top_k, vars.RRF_K)
+        return retriever
+
+    def _generate_answer(self, subquestion, tool_name, index, params, side_indices=None, years=None):
+        params = Config().from_proto(params)
+        query_engine = self._create_instance(index, params, side_indices, years)
+        token = generation_params.set(params.to_generation_kwargs())
+        try:
+            answer = query_engine.query(subquestion)
+        finally:
+            generation_params.reset(token)
         qa_pair = SubQuestionAnswerPair(
             sub_q=SubQuestion(sub_question=subquestion, tool_name=tool_name),
             answer=answer.response,
@@ -166,8 +226,12 @@ class QueryEngine(object):
         )
         return qa_pair
 
-    def generate(self, subquestion: str, tool_name, index, params):
-        qa_pair = self._generate_answer(subquestion, tool_name, index, params)
+    def generate(self, subquestion: str, tool_name, index, params, side_indices=None, years=None):
+        """
+        :param years: Years of the attachments of the sub-question's company, the year filter when the
+            sub-question has none
+        """
+        qa_pair = self._generate_answer(subquestion, tool_name, index, params, side_indices, years)
         citations = [
             {
                 "filename": source_node.node.metadata["file_name"],
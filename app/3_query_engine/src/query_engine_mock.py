@@ -10,7 +10,7 @@ class QueryEngineMock(QueryEngine):
     def __call__(self, *args: Any, **kwds: Any) -> Any:
         return super().__call__(*args, **kwds)
 
-    def generate(self, subquestion: str, tool_name, index: BaseIndex, params):
+    def generate(self, subquestion: str, tool_name, index: BaseIndex, params, side_indices=None, years=None):
         node_id = [
             values["node_ids"]
             for key, values in index.docstore.to_dict()["docstore/ref_doc_info"].items()
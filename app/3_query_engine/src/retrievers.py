@@ -0,0 +1,146 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from llama_index.indices.vector_store import VectorStoreIndex
+from llama_index.indices.vector_store.retrievers import VectorIndexRetriever
+from llama_index.retrievers import BaseRetriever
+from llama_index.schema import NodeWithScore, QueryBundle
+from llama_index.vector_stores.types import ExactMatchFilter, MetadataFilters
+from logger import create_logger
+from year_filter import parse_year_filter
+
+_logger = create_logger("query_engine:retrievers")
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[List[NodeWithScore]], rrf_k: int, top_k: int
+) -> List[NodeWithScore]:
+    """
+    Merges rankings by the sum of 1 / (rrf_k + rank) of every node, so that rankings scored on different
+    scales (cosine similarity, BM25, earlier fusions) can be combined
+    :return: The top_k fused nodes, scored by their fused score
+    """
+    nodes = {}
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, node in enumerate(ranking):
+            node_id = node.node.node_id
+            nodes.setdefault(node_id, node.node)
+            scores[node_id] += 1 / (rrf_k + rank + 1)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [NodeWithScore(node=nodes[node_id], score=scores[node_id]) for node_id in ranked]
+
+
+class OverlayRetriever(BaseRetriever):
+    """
+    Retrieves from the resident company index and the small per-conversation side indices, merging the
+    candidates by reciprocal rank fusion as their retrievers score on different scales.
+    """
+
+    def __init__(self, retrievers: List[BaseRetriever], similarity_top_k: int, rrf_k: int) -> None:
+        self.retrievers = retrievers
+        self.similarity_top_k = similarity_top_k
+        self.rrf_k = rrf_k
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        rankings = [retriever.retrieve(query_bundle) for retriever in self.retrievers]
+        return reciprocal_rank_fusion(rankings, self.rrf_k, self.similarity_top_k)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses the vector results with the BM25 results of the index's sparse index by reciprocal rank fusion,
+    so that tickers and figures missed by the embeddings are still retrieved. Indices persisted without a
+    sparse index are only searched by vector.
+    """
+
+    def __init__(
+        self,
+        index: VectorStoreIndex,
+        vector_retriever: BaseRetriever,
+        similarity_top_k: int,
+        rrf_k: int,
+        filters: Optional[MetadataFilters] = None,
+    ) -> None:
+        """
+        :param filters: Filters of the vector retriever, applied to the BM25 results as well
+        """
+        self.index = index
+        self.vector_retriever = vector_retriever
+        self.similarity_top_k = similarity_top_k
+        self.rrf_k = rrf_k
+        self.filters = filters
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        vector_nodes = self.vector_retriever.retrieve(query_bundle)
+        sparse_index = getattr(self.index.vector_store, "sparse_index", None)
+        if sparse_index is None:
+            return vector_nodes
+
+        retrieved = {node.node.node_id: node.node for node in vector_nodes}
+        sparse_nodes = []
+        for node_id, score in sparse_index.query(query_bundle.query_str, self.similarity_top_k, self.filters):
+            node = retrieved.get(node_id) or self.index.docstore.get_node(node_id, raise_error=False)
+            # Nodes deleted from the index since the sparse index was built are skipped
+            if node is not None:
+                sparse_nodes.append(NodeWithScore(node=node, score=score))
+        return reciprocal_rank_fusion([vector_nodes, sparse_nodes], self.rrf_k, self.similarity_top_k)
+
+
+class YearFilterRetriever(BaseRetriever):
+    """
+    Retrieves with the year filter parsed from the sub-question, or taken from the attachments of its company,
+    saving the LLM call of the auto-retriever. Questions whose period can't be parsed go through the fallback
+    retriever, which has the LLM infer the filters.
+    """
+
+    def __init__(
+        self,
+        index: VectorStoreIndex,
+        fallback: BaseRetriever,
+        similarity_top_k: int,
+        hint_years: Iterable[int] = (),
+        vector_store_kwargs: Optional[Dict] = None,
+        rrf_k: Optional[int] = None,
+    ) -> None:
+        """
+        :param rrf_k: Fuse the vector results with BM25 with this rank fusion constant, vector only when None
+        """
+        self.index = index
+        self.fallback = fallback
+        self.similarity_top_k = similarity_top_k
+        self.hint_years = list(hint_years)
+        self.vector_store_kwargs = vector_store_kwargs or {}
+        self.rrf_k = rrf_k
+        super().__init__()
+
+    def _index_years(self) -> List[str]:
+        """
+        :return: Years of the indexed documents, read from their year metadata
+        """
+        metadata_values = getattr(self.index.vector_store, "metadata_values", None)
+        if metadata_values is None:
+            return []
+        return sorted(str(year) for year in metadata_values("year"))
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        year_filter = parse_year_filter(query_bundle.query_str, self._index_years(), self.hint_years)
+        if year_filter.ambiguous:
+            _logger.info(f"Ambiguous period, inferring the filters with the LLM: {query_bundle.query_str}")
+            return self.fallback.retrieve(query_bundle)
+
+        filters = None
+        if year_filter.year is not None:
+            filters = MetadataFilters(filters=[ExactMatchFilter(key="year", value=year_filter.year)])
+        retriever = VectorIndexRetriever(
+            self.index,
+            similarity_top_k=self.similarity_top_k,
+            filters=filters,
+            vector_store_kwargs=self.vector_store_kwargs,
+        )
+        if self.rrf_k is not None:
+            retriever = HybridRetriever(self.index, retriever, self.similarity_top_k, self.rrf_k, filters)
+        return retriever.retrieve(query_bundle)
@@ -12,10 +12,30 @@ USE_GPU = os.getenv("USE_GPU", "false").lower() == "true"
 DEBUG = os.environ.get("DEBUG", "false").lower() == "true"
 USE_INSECURE_CHANNEL = os.getenv("USE_INSECURE_CHANNEL", "false") == "true"
 NO_OF_WORKERS = os.getenv("NO_OF_WORKERS", 2 if DEBUG else 4)
+WARMUP = os.getenv("WARMUP", "true").lower() == "true"
 
 PEFT_MODEL_BUCKET = os.environ["PEFT_MODEL_BUCKET"]
 PEFT_MODEL_FOLDER = os.environ["PEFT_MODEL_FOLDER"]
 MERGED_INDICES_BUCKET = os.environ["MERGED_INDICES_BUCKET_NAME"]
+# Only required when the index builder runs with INDEX_MODE=overlay
+COMPANY_INDICES_BUCKET = os.environ.get("GCS_INDEX_BUILDER_BUCKET")
+CONV_INDICES_BUCKET = os.environ.get("CONV_INDICES_BUCKET_NAME")
+COMPANY_INDICES_DIR = os.path.join(TEMP_DIR, "storage")
+OVERLAY_MANIFEST_FILENAME = "overlay.json"
+# Attach node embeddings to the citations sent downstream
+CITATION_EMBEDDINGS = os.getenv("CITATION_EMBEDDINGS", "false").lower() == "true"
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", 2 * 1024**3))
+# structured: year filters are parsed from the sub-question, the LLM only infers them when the parse is
+#             ambiguous
+# auto: the LLM infers the filters of every sub-question
+RETRIEVER_MODE = os.getenv("RETRIEVER_MODE", "structured").lower()
+# Years of the corpus documents offered to the LLM when it infers the filters, the parser reads the years
+# of each index from its metadata
+DOCUMENT_YEARS = os.getenv("DOCUMENT_YEARS", "2018,2019,2020,2021,2022,2023").split(",")
+# Fuse the vector results with BM25 over the sparse index persisted next to the index, when there is one
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+# Reciprocal rank fusion constant, larger values flatten the weight of the top ranks
+RRF_K = int(os.getenv("RRF_K", 60))
 
 INDEXING_EMBEDDING_MODEL = "gpt-4-1106-preview"
 RERANK_MODEL = os.getenv("RERANK_MODEL", "BAAI/bge-reranker-large")
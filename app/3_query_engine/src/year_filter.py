@@ -0,0 +1,67 @@
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Set
+
+# 2022, FY2022, FY 2022, FY'2022
+YEAR_PATTERN = re.compile(r"\b(FY\s?'?)?((?:19|20)\d{2})\b", re.IGNORECASE)
+# Words ending the text before a year, other four-digit numbers outside the indexed years are figures
+YEAR_CONTEXT_PATTERN = re.compile(
+    r"\b(in|for|of|during|fiscal|year|since|from|to|by|until|through|before|after|and|or|vs|versus)\W*$",
+    re.IGNORECASE,
+)
+# FY22, FY'22
+FISCAL_YEAR_PATTERN = re.compile(r"\bFY\s?'?(\d{2})\b", re.IGNORECASE)
+# Periods around an explicit year, e.g. "since 2020"
+RANGE_PATTERN = re.compile(
+    r"\b(between|since|through|until|before|after|versus|vs|compared)\b", re.IGNORECASE
+)
+# The most recent documents, "current" alone is left out as in current assets or current ratio
+LATEST_PATTERN = re.compile(
+    r"\b(most recent|recent|recently|latest|currently|current year|current fiscal year|this year|"
+    r"year to date|ytd)\b",
+    re.IGNORECASE,
+)
+# Periods relative to an unknown reference, e.g. "last year" or "two years ago"
+RELATIVE_PATTERN = re.compile(r"\b(last|previous|prior|past|next|ago|earlier)\b", re.IGNORECASE)
+
+
+@dataclass
+class YearFilter:
+    # Year to filter the documents on, None to search every year
+    year: Optional[str] = None
+    # The question refers to a period the parser can't resolve, the LLM has to infer the filters
+    ambiguous: bool = False
+
+
+def _explicit_years(question: str, years: List[str]) -> Set[str]:
+    explicit = set()
+    for match in YEAR_PATTERN.finditer(question):
+        fiscal, year = match.groups()
+        if fiscal or year in years or YEAR_CONTEXT_PATTERN.search(question[: match.start()]):
+            explicit.add(year)
+    return explicit | {f"20{year}" for year in FISCAL_YEAR_PATTERN.findall(question)}
+
+
+def parse_year_filter(question: str, years: List[str], hint_years: Iterable[int] = ()) -> YearFilter:
+    """
+    Infers the year filter of a sub-question without the LLM
+    :param years: Years of the indexed documents, as in their year metadata
+    :param hint_years: Years of the attachments of the sub-question's company, used when the question has
+        no period
+    """
+    explicit = _explicit_years(question, years)
+    if explicit:
+        if len(explicit) > 1 or not explicit <= set(years) or RANGE_PATTERN.search(question):
+            return YearFilter(ambiguous=True)
+        return YearFilter(year=explicit.pop())
+
+    if LATEST_PATTERN.search(question):
+        # An index without years has no latest documents to filter on
+        return YearFilter(year=max(years)) if years else YearFilter()
+    if RELATIVE_PATTERN.search(question):
+        return YearFilter(ambiguous=True)
+
+    hints = {str(year) for year in hint_years} & set(years)
+    if len(hints) == 1:
+        return YearFilter(year=hints.pop())
+    return YearFilter()
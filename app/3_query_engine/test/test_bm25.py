@@ -0,0 +1,54 @@
+from llama_index.vector_stores.types import ExactMatchFilter, MetadataFilters
+from mmap_store.bm25 import BM25Index, tokenize
+
+
+def index():
+    texts = [
+        "Apple revenue was 394,328 million in 2022",
+        "Microsoft revenue grew in 2022",
+        "AAPL gross margin and the AAPL share buyback",
+        "Employees of Apple",
+    ]
+    metadata = [{"year": "2022"}, {"year": "2022"}, {"year": "2021"}, {"year": "2021"}]
+    return BM25Index.build([f"node-{row}" for row in range(len(texts))], texts, metadata)
+
+
+def test_tokenize():
+    assert tokenize("What was AAPL's revenue in FY2022?") == ["aapl", "s", "revenue", "fy2022"]
+    # Figures are kept whole, without their thousands separators
+    assert tokenize("Revenue of $394,328.5 million") == ["revenue", "394328.5", "million"]
+
+
+def test_query_ranks_exact_terms():
+    results = index().query("AAPL buyback", k=3)
+    assert [node_id for node_id, _ in results] == ["node-2"]
+    assert results[0][1] > 0
+
+
+def test_query_figures():
+    assert [node_id for node_id, _ in index().query("394,328", k=3)] == ["node-0"]
+
+
+def test_query_orders_by_score():
+    results = index().query("Apple revenue", k=4)
+    assert [node_id for node_id, _ in results][0] == "node-0"
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+    # Nodes matching no term are not returned
+    assert "node-2" not in {node_id for node_id, _ in results}
+
+
+def test_query_top_k():
+    assert len(index().query("Apple revenue", k=1)) == 1
+    assert index().query("unknown terms", k=3) == []
+
+
+def test_query_filters():
+    filters = MetadataFilters(filters=[ExactMatchFilter(key="year", value="2021")])
+    assert [node_id for node_id, _ in index().query("Apple", k=4, filters=filters)] == ["node-3"]
+
+
+def test_persist_and_load(tmp_path):
+    index().persist(str(tmp_path))
+    assert BM25Index.load(str(tmp_path)).query("AAPL buyback", k=3) == index().query("AAPL buyback", k=3)
+    assert BM25Index.load(str(tmp_path / "missing")) is None
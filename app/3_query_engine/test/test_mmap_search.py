@@ -0,0 +1,65 @@
+import numpy as np
+from llama_index.vector_stores.types import ExactMatchFilter, MetadataFilters
+from mmap_store.search import MetadataColumns, normalize, top_k
+
+
+def year_filter(year):
+    return MetadataFilters(filters=[ExactMatchFilter(key="year", value=year)])
+
+
+def test_top_k_matches_a_full_sort():
+    rng = np.random.default_rng(0)
+    matrix, _ = normalize(rng.standard_normal((500, 16), dtype=np.float32))
+    query, _ = normalize(rng.standard_normal((1, 16), dtype=np.float32))
+    rows, scores = top_k(matrix, query[0], 10)
+    expected = np.argsort(-(matrix @ query[0]))[:10]
+    assert rows.tolist() == expected.tolist()
+    assert np.allclose(scores, (matrix @ query[0])[expected])
+
+
+def test_top_k_with_mask():
+    matrix = np.eye(4, dtype=np.float32)
+    query = np.array([0.9, 0.5, 0.1, 0.0], dtype=np.float32)
+    rows, scores = top_k(matrix, query, 2, mask=np.array([False, True, True, True]))
+    assert rows.tolist() == [1, 2]
+    assert np.allclose(scores, [0.5, 0.1])
+
+
+def test_top_k_with_more_rows_than_the_matrix():
+    rows, _ = top_k(np.eye(3, dtype=np.float32), np.ones(3, dtype=np.float32), 10)
+    assert sorted(rows.tolist()) == [0, 1, 2]
+    rows, scores = top_k(np.zeros((0, 3), dtype=np.float32), np.ones(3, dtype=np.float32), 10)
+    assert len(rows) == len(scores) == 0
+
+
+def test_metadata_columns_mask():
+    columns = MetadataColumns([{"year": "2021"}, {"year": "2022"}, {}, {"year": "2022"}])
+    assert columns.mask(year_filter("2022")).tolist() == [False, True, False, True]
+    assert not columns.mask(year_filter("2015")).any()
+
+
+def test_metadata_columns_mask_several_keys():
+    columns = MetadataColumns(
+        [
+            {"year": "2022", "ticker": "AAPL"},
+            {"year": "2022", "ticker": "MSFT"},
+            {"year": "2021", "ticker": "AAPL"},
+        ]
+    )
+    filters = MetadataFilters(
+        filters=[ExactMatchFilter(key="year", value="2022"), ExactMatchFilter(key="ticker", value="AAPL")]
+    )
+    assert columns.mask(filters).tolist() == [True, False, False]
+
+
+def test_metadata_columns_mask_unsupported():
+    # List values can't be encoded in a column, the caller filters row by row
+    columns = MetadataColumns([{"year": ["2021", "2022"]}, {"year": "2022"}])
+    assert columns.mask(year_filter("2022")) is None
+
+
+def test_metadata_columns_values():
+    columns = MetadataColumns([{"year": "2021"}, {"year": "2022"}, {}, {"year": "2022"}])
+    assert sorted(columns.values("year")) == ["2021", "2022"]
+    assert columns.values("year", np.array([False, True, True, False])) == ["2022"]
+    assert columns.values("ticker") == []
@@ -0,0 +1,72 @@
+import pytest
+from year_filter import YearFilter, parse_year_filter
+
+YEARS = ["2019", "2020", "2021", "2022"]
+
+
+@pytest.mark.parametrize(
+    "question, year",
+    [
+        ("What was Apple's revenue in 2021?", "2021"),
+        ("What was Apple's revenue in FY2021?", "2021"),
+        ("What was Apple's revenue in FY 2021?", "2021"),
+        ("What was Apple's revenue in FY22?", "2022"),
+        ("What was Apple's revenue in FY'22?", "2022"),
+        ("What is Apple's latest revenue?", "2022"),
+        ("What is Apple's most recent gross margin?", "2022"),
+    ],
+)
+def test_parsed_year(question, year):
+    assert parse_year_filter(question, YEARS) == YearFilter(year=year)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "How did Apple's revenue change between 2020 and 2022?",
+        "What was Apple's revenue in 2021 compared to 2022?",
+        "How has Apple's revenue grown since 2020?",
+        "What was Apple's revenue last year?",
+        "What was Apple's revenue two years ago?",
+        "What was Apple's revenue in the previous fiscal year?",
+        # Not an indexed year, the LLM decides which documents answer it
+        "What was Apple's revenue in 2015?",
+    ],
+)
+def test_ambiguous_period(question):
+    assert parse_year_filter(question, YEARS) == YearFilter(ambiguous=True)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "What is Apple's current ratio?",
+        "What are Apple's current assets?",
+        "How many employees does Apple have?",
+        # Four-digit figures are not years
+        "Which segment has 2000 total stores?",
+        "Is the 1999 total above 2000 units?",
+    ],
+)
+def test_no_period(question):
+    assert parse_year_filter(question, YEARS) == YearFilter()
+
+
+def test_figure_next_to_a_year():
+    assert parse_year_filter("Did Apple open 2000 stores in 2021?", YEARS) == YearFilter(year="2021")
+
+
+def test_hint_years():
+    question = "What is Apple's current ratio?"
+    assert parse_year_filter(question, YEARS, hint_years=[2021]) == YearFilter(year="2021")
+    # Several or unindexed attachment years are no hint
+    assert parse_year_filter(question, YEARS, hint_years=[2020, 2021]) == YearFilter()
+    assert parse_year_filter(question, YEARS, hint_years=[2015]) == YearFilter()
+    # An explicit year wins over the attachments
+    assert parse_year_filter("Revenue in 2020?", YEARS, hint_years=[2021]) == YearFilter(year="2020")
+
+
+def test_index_without_years():
+    assert parse_year_filter("latest revenue", []) == YearFilter()
+    assert parse_year_filter("What is Apple's current ratio?", [], hint_years=[2021]) == YearFilter()
+    assert parse_year_filter("Revenue in 2021?", []) == YearFilter(ambiguous=True)
@@ -1,6 +1,6 @@
 import asyncio
-import pickle
 import threading
+from concurrent import futures
 from queue import Empty
 
 import grpc
@@ -21,34 +21,61 @@ class ResponseSynthesizerService(
 ):
     def __init__(self):
         self.synthesizer = ResponseSynthesizer()
+        self.executor = futures.ThreadPoolExecutor(max_workers=vars.NO_OF_WORKERS)
+        self.pending = 0
+        self.pending_lock = threading.Lock()
+
+    def _submit(self, session, context) -> futures.Future:
+        with self.pending_lock:
+            if self.pending >= vars.NO_OF_WORKERS + vars.SYNTHESIS_MAX_QUEUE_DEPTH:
+                _logger.warning(f"Rejecting request, {self.pending} synthesis requests pending")
+                context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Synthesis queue is full")
+            self.pending += 1
+
+        future = self.executor.submit(self.synthesizer.synthesize, session)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _):
+        with self.pending_lock:
+            self.pending -= 1
 
     def summarizeResponse(
         self, request: response_synthesizer_pb2.getFinalAnswerRequest, context
     ) -> response_synthesizer_pb2.getFinalAnswerResponse:
         message = ""
+        generation_error = None
         query = request.query
         model_params = request.params
         qa_pairs = request.qaPairs
-        source_nodes = pickle.loads(request.Sources)
+        source_nodes = request.sources
         _logger.info(f"Synthesizing Response for question: {query} | {qa_pairs}")
 
-        streamer = self.synthesizer.initialize_synthesizer(
+        session = self.synthesizer.create_session(
             query, qa_pairs, source_nodes, model_params
         )
+        generation_task = self._submit(session, context)
+        if not session.started.wait(vars.SYNTHESIS_QUEUE_TIMEOUT):
+            generation_task.cancel()
+            context.abort(
+                grpc.StatusCode.RESOURCE_EXHAUSTED,
+                f"No synthesis worker available within {vars.SYNTHESIS_QUEUE_TIMEOUT}s",
+            )
 
         try:
-            generation_task = threading.Thread(target=self.synthesizer.synthesize)
-            generation_task.start()
-            _logger.info("Synthesizer: Background generation task submitted...")
+            _logger.info("Synthesizer: Background generation task started...")
 
-            for token in streamer:
+            for token in session.streamer:
                 token = token.replace("#", "")
                 if token:
                     yield response_synthesizer_pb2.getFinalAnswerResponse(Answer=token)
+            generation_error = generation_task.exception()
 
         except Empty:
-            _logger.warning("Streamer did not yield any tokens on time")
-            message = "Sorry, I am taking too long to respond. Please try later"
+            generation_error = generation_task.exception() if generation_task.done() else None
+            if generation_error is None:
+                _logger.warning("Streamer did not yield any tokens on time")
+                message = "Sorry, I am taking too long to respond. Please try later"
 
         except Exception as exc:
             _logger.exception(f"Streamer failed with exception: {exc}")
@@ -63,6 +90,10 @@ class ResponseSynthesizerService(
 
                 yield response_synthesizer_pb2.getFinalAnswerResponse(Answer=words[-1])
 
+        if generation_error is not None:
+            _logger.error(f"Synthesis failed with exception: {generation_error!r}")
+            context.abort(grpc.StatusCode.INTERNAL, f"Synthesis failed: {generation_error}")
+
     def getSynthesizerDefaultParams(
         self, request: response_synthesizer_pb2.FinalEmpty, context
     ) -> response_synthesizer_pb2.FinalParams:
@@ -73,7 +104,14 @@ class ResponseSynthesizerService(
 # Below is boilerplate code to start the server.
 async def serve():
     """Start the server"""
-    server = grpc.aio.server()
+    # summarizeResponse is a sync generator blocking on its streamer, so each in-flight or queued
+    # request holds a thread of the migration pool. Requests above the limit are rejected by gRPC with
+    # RESOURCE_EXHAUSTED instead of waiting for a thread of the pool
+    max_rpcs = vars.NO_OF_WORKERS + vars.SYNTHESIS_MAX_QUEUE_DEPTH
+    server = grpc.aio.server(
+        migration_thread_pool=futures.ThreadPoolExecutor(max_workers=max_rpcs),
+        maximum_concurrent_rpcs=max_rpcs,
+    )
     response_synthesizer_pb2_grpc.add_ResponseSynthesizerServicer_to_server(
         ResponseSynthesizerService(), server
     )
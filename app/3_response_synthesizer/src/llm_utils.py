@@ -1,5 +1,6 @@
+from contextvars import ContextVar
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Dict
 
 from llama_index.llms import (
     CompletionResponse,
@@ -10,6 +11,10 @@ from llama_index.llms import (
 from llama_index.llms.base import llm_completion_callback
 from transformers import Pipeline
 
+# Generation parameters (sampling params and the streamer) of the session being synthesized.
+# The pipeline is shared by every session, so they are passed on each generation call.
+generation_params: ContextVar[Dict] = ContextVar("generation_params", default={})
+
 
 @dataclass
 class Config:
@@ -64,6 +69,14 @@ class Config:
     def to_dict(self):
         return self.__dict__
 
+    def to_generation_kwargs(self) -> Dict:
+        return {
+            "top_k": self.rs_top_k,
+            "temperature": self.rs_temperature,
+            "repetition_penalty": self.rs_repetition_penalty,
+            "max_new_tokens": self.rs_max_new_tokens,
+        }
+
     def __post_init__(self) -> None:
         if not (1 <= self.rs_k <= 15):
             raise ValueError("k should belong to [1, 15]")
@@ -83,6 +96,8 @@ class Config:
 
 class Summarizer(CustomLLM):
     model: Pipeline = None
+    # BatchScheduler sharing the model with concurrent requests, the pipeline is used when unset
+    scheduler: Any = None
     max_tokens: int = 100
     context_window: int = 2048
     model_name: str = ""
@@ -125,12 +140,14 @@ class Summarizer(CustomLLM):
             message, tokenize=False, add_generation_prompt=True
         )
         prompt_length = len(prompt)
-        response = self.model(prompt, max_new_tokens=self.max_tokens)[0][
-            "generated_text"
-        ]
-
-        # only return newly generated tokens
-        text = response[prompt_length:]
+        kwargs = {"max_new_tokens": self.max_tokens, **generation_params.get()}
+        if self.scheduler is not None:
+            text = self.scheduler.generate(prompt, **kwargs)
+        else:
+            response = self.model(prompt, **kwargs)[0]["generated_text"]
+
+            # only return newly generated tokens
+            text = response[prompt_length:]
         return CompletionResponse(text=text)
 
     @llm_completion_callback()
@@ -162,10 +179,12 @@ class Summarizer(CustomLLM):
             message, tokenize=False, add_generation_prompt=True
         )
         prompt_length = len(prompt)
-        response = self.model(prompt, max_new_tokens=self.max_tokens)[0][
-            "generated_text"
-        ]
-
-        # only return newly generated tokens
-        text = response[prompt_length:]
+        kwargs = {"max_new_tokens": self.max_tokens, **generation_params.get()}
+        if self.scheduler is not None:
+            text = self.scheduler.generate(prompt, **kwargs)
+        else:
+            response = self.model(prompt, **kwargs)[0]["generated_text"]
+
+            # only return newly generated tokens
+            text = response[prompt_length:]
         return CompletionResponse(text=text)
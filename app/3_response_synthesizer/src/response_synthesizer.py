@@ -1,15 +1,21 @@
+import threading
+from dataclasses import dataclass, field
+from queue import Empty
+from typing import List
+
 import variables as vars
+from embedding import get_embed_model
+from generation import BATCHING_ENABLED, BatchScheduler
 from llama_index import ServiceContext, get_response_synthesizer
 from llama_index.callbacks import (
     CallbackManager,
     LlamaDebugHandler,
     OpenInferenceCallbackHandler,
 )
-from llama_index.embeddings import HuggingFaceEmbedding
 from llama_index.prompts.base import PromptTemplate
 from llama_index.prompts.prompt_type import PromptType
 from llama_index.schema import NodeWithScore, QueryBundle, TextNode
-from llm_utils import Config, Summarizer
+from llm_utils import Config, Summarizer, generation_params
 from logger import create_logger
 from transformers import (
     AutoModelForCausalLM,
@@ -21,6 +27,46 @@ from transformers import (
 _logger = create_logger("response_synthesizer:model")
 
 
+class AdmittedStreamer(TextIteratorStreamer):
+    """
+    Text streamer whose per-token timeout only applies once the generation started. Until then, e.g. while the
+    batch scheduler decodes the batch ahead of the request, the reader waits up to `admission_timeout`.
+    """
+
+    def __init__(self, tokenizer, admission_timeout: float, timeout: float, **kwargs) -> None:
+        super().__init__(tokenizer, timeout=timeout, **kwargs)
+        self.admission_timeout = admission_timeout
+        self.admitted = threading.Event()
+
+    def put(self, value):
+        # The first put is the prompt, at the start of the generation
+        self.admitted.set()
+        super().put(value)
+
+    def end(self):
+        self.admitted.set()
+        super().end()
+
+    def __next__(self):
+        if not self.admitted.wait(self.admission_timeout):
+            raise Empty()
+        return super().__next__()
+
+
+@dataclass
+class SynthesisSession:
+    """
+    State of a single synthesis request, the shared model and pipeline are never mutated per request.
+    """
+
+    query: QueryBundle
+    nodes: List[NodeWithScore]
+    additional_source_nodes: List
+    params: Config
+    streamer: AdmittedStreamer
+    started: threading.Event = field(default_factory=threading.Event)
+
+
 class ResponseSynthesizer(object):
     prompt_template = PromptTemplate(
         vars.TEXT_FINAL_PROMPT_TMPL, prompt_type=PromptType.QUESTION_ANSWER
@@ -31,7 +77,7 @@ class ResponseSynthesizer(object):
         llama_debug = LlamaDebugHandler(print_trace_on_end=True)
         callback_handler = OpenInferenceCallbackHandler()
         self.callback_manager = CallbackManager([llama_debug, callback_handler])
-        self.embed_model = HuggingFaceEmbedding(model_name=vars.EMBEDDING_MODEL)
+        self.embed_model = get_embed_model(vars.EMBEDDING_MODEL)
         self.tokenizer = AutoTokenizer.from_pretrained(vars.MODEL_ID)
 
         self.llm = AutoModelForCausalLM.from_pretrained(
@@ -41,6 +87,7 @@ class ResponseSynthesizer(object):
             device_map="auto",
         )
 
+        self._create_pipeline()
         _logger.info("Response Synthesizer initilized")
 
     def _create_nodes(self, qa_pairs):
@@ -50,28 +97,46 @@ class ResponseSynthesizer(object):
             nodes.append(NodeWithScore(node=TextNode(text=node_text)))
         return nodes
 
-    # update parameters
-    def _create_instance(self):
-        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, timeout=5)
+    @staticmethod
+    def _create_source_nodes(sources):
+        return [
+            NodeWithScore(
+                node=TextNode(
+                    id_=source.node_id,
+                    text=source.text,
+                    embedding=list(source.embedding) or None,
+                    metadata={
+                        "file_name": source.file_name,
+                        "page_label": source.page,
+                        "document_id": source.document_id,
+                    },
+                ),
+                score=source.score,
+            )
+            for source in sources
+        ]
 
+    def _create_pipeline(self):
+        # Sampling parameters and the streamer differ per request, they are passed to every
+        # generation call through `generation_params` instead of being baked into the pipeline
         llm_pipeline = pipeline(
             "text-generation",
             model=self.llm,
             tokenizer=self.tokenizer,
-            streamer=streamer,
             use_cache=True,
             device_map="auto",
-            top_k=self.params.rs_top_k,
-            repetition_penalty=self.params.rs_repetition_penalty,
-            max_new_tokens=self.params.rs_max_new_tokens,
             do_sample=True,
-            temperature=self.params.rs_temperature,
             num_return_sequences=1,
         )
 
+        # Concurrent sessions are decoded together in dynamic batches, the streamer of each
+        # session receives its own tokens
+        scheduler = BatchScheduler(self.llm, self.tokenizer) if BATCHING_ENABLED else None
+
         custom_llm = Summarizer(
             model=llm_pipeline,
-            max_tokens=self.params.rs_max_new_tokens,
+            scheduler=scheduler,
+            max_tokens=Config.rs_max_new_tokens,
             context_window=self.context_length,
             model_name=vars.MODEL_ID,
         )
@@ -88,24 +153,44 @@ class ResponseSynthesizer(object):
             service_context=service_context,
             streaming=True,
         )
-        _logger.info(f"Synthesizer setup: {self.params}")
-        return streamer
-
-    def initialize_synthesizer(self, query, qa_pairs, sources, params):
-        self.query_str = query
-        self.query = QueryBundle(query_str=query)
-        self.nodes = self._create_nodes(qa_pairs=qa_pairs)
-        self.additional_source_nodes = sources
-        self.params = Config().from_proto(params)
-        _logger.info(f"Request: {query} | {params}")
 
-        return self._create_instance()
+    def create_session(self, query, qa_pairs, sources, params) -> SynthesisSession:
+        """
+        Creates the state of a single synthesis request
+        :param query: User query
+        :param qa_pairs: Answers of the sub-questions keyed by sub-question
+        :param sources: FinalSourceNode messages of the citations
+        :param params: FinalParams of the request
+        """
+        _logger.info(f"Request: {query} | {params}")
+        return SynthesisSession(
+            query=QueryBundle(query_str=query),
+            nodes=self._create_nodes(qa_pairs=qa_pairs),
+            additional_source_nodes=self._create_source_nodes(sources),
+            params=Config().from_proto(params),
+            streamer=AdmittedStreamer(
+                self.tokenizer,
+                admission_timeout=vars.SYNTHESIS_ADMISSION_TIMEOUT,
+                timeout=vars.SYNTHESIS_TOKEN_TIMEOUT,
+                skip_prompt=True,
+            ),
+        )
 
-    def synthesize(self):
-        _logger.info(f"Synthesizing answer: {self.query_str}")
-        response = self.summarizer.synthesize(
-            query=self.query,
-            nodes=self.nodes,
-            additional_source_nodes=self.additional_source_nodes,
+    def synthesize(self, session: SynthesisSession):
+        session.started.set()
+        _logger.info(f"Synthesizing answer: {session.query.query_str}")
+        token = generation_params.set(
+            {**session.params.to_generation_kwargs(), "streamer": session.streamer}
         )
-        return response
+        try:
+            return self.summarizer.synthesize(
+                query=session.query,
+                nodes=session.nodes,
+                additional_source_nodes=session.additional_source_nodes,
+            )
+        except Exception:
+            # Stops the client's iteration right away, the error is surfaced from the generation task
+            session.streamer.end()
+            raise
+        finally:
+            generation_params.reset(token)
@@ -10,7 +10,15 @@ PORT = os.environ.get("PORT", 5006)
 TEXT_FINAL_PROMPT_TMPL = "{context_str}" "---" "{query_str}"
 
 DEBUG = os.environ.get("DEBUG", "false").lower() == "true"
-NO_OF_WORKERS = os.getenv("NO_OF_WORKERS", 2 if DEBUG else 4)
+NO_OF_WORKERS = int(os.getenv("NO_OF_WORKERS", 2 if DEBUG else 4))
+# Requests allowed to wait for a free worker before new ones are rejected with RESOURCE_EXHAUSTED
+SYNTHESIS_MAX_QUEUE_DEPTH = int(os.getenv("SYNTHESIS_MAX_QUEUE_DEPTH", 16))
+# Seconds a queued request waits for a worker before it is rejected
+SYNTHESIS_QUEUE_TIMEOUT = float(os.getenv("SYNTHESIS_QUEUE_TIMEOUT", 30))
+# Seconds a started request waits for its generation to begin, at worst after a whole batch ahead of it
+SYNTHESIS_ADMISSION_TIMEOUT = float(os.getenv("SYNTHESIS_ADMISSION_TIMEOUT", 120))
+# Seconds between two generated tokens before the answer is abandoned
+SYNTHESIS_TOKEN_TIMEOUT = float(os.getenv("SYNTHESIS_TOKEN_TIMEOUT", 5))
 
 MODEL_ID = os.getenv("MODEL_ID", "MBZUAI/LaMini-GPT-124M")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
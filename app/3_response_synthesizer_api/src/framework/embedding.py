@@ -1,4 +1,5 @@
 
+from embedding import cached
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 
 
@@ -14,8 +15,9 @@ class EmbeddingModel:
     def set_embedding_model(self):
         match self.embedding_type:
             case "huggingface":
-                self.embed_model = HuggingFaceEmbedding(
+                embed_model = HuggingFaceEmbedding(
                     model_name=EMBEDDING_MODEL,
                     device="cpu",
                 )
-                self.embed_dim = self.embed_model._model._modules["1"].word_embedding_dimension
\ No newline at end of file
+                self.embed_dim = embed_model._model._modules["1"].word_embedding_dimension
+                self.embed_model = cached(embed_model)
\ No newline at end of file
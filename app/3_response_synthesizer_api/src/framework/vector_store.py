@@ -5,7 +5,8 @@ from llama_index.indices.vector_store.retrievers.retriever import VectorIndexRet
 from llama_index.indices.vector_store.retrievers.auto_retriever import (
     VectorIndexAutoRetriever,
 )
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from embedding import cached
+from llama_index.embeddings import OpenAIEmbedding
 from llama_index.llms.openai import OpenAI
 from llama_index.vector_stores.postgres import PGVectorStore
 
@@ -70,7 +71,9 @@ class VectorStore:
 class VectorRetriever:
 
     def __init__(self, store_type: str, embedding_table_name: str = "test"):
-        self.service_context = ServiceContext.from_defaults(llm=OpenAI(model="gpt-4"))
+        self.service_context = ServiceContext.from_defaults(
+            llm=OpenAI(model="gpt-4"), embed_model=cached(OpenAIEmbedding())
+        )
         self.vector_store = VectorStore(store_type=store_type, embed_dim=1536, embedding_table_name=embedding_table_name)
         self.vector_store_info = None
         self.vector_retriever = None
@@ -1,13 +1,13 @@
 from typing import Any
 
 import torch
+from embedding import get_embed_model
 from llama_index import ServiceContext, get_response_synthesizer
 from llama_index.callbacks import (
     CallbackManager,
     LlamaDebugHandler,
     OpenInferenceCallbackHandler,
 )
-from llama_index.embeddings import HuggingFaceEmbedding
 from llama_index.llms import (
     CompletionResponse,
     CompletionResponseGen,
@@ -117,7 +117,7 @@ def load_response_synthesizer():
     callback_handler = OpenInferenceCallbackHandler()
     callback_manager = CallbackManager([llama_debug, callback_handler])
     # embed_model
-    embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-large-en")
+    embed_model = get_embed_model("BAAI/bge-large-en")
     # llm model
 
     # service context
@@ -9,7 +9,7 @@ from llama_index.callbacks import (
 )
 from llama_index import get_response_synthesizer
 
-from llama_index.embeddings import HuggingFaceEmbedding
+from embedding import get_embed_model
 from llama_index.prompts.base import PromptTemplate
 from llama_index.prompts.prompt_type import PromptType
 from llama_index.schema import NodeWithScore, QueryBundle, TextNode
@@ -48,7 +48,7 @@ class LeadGenerator(object):
         llama_debug = LlamaDebugHandler(print_trace_on_end=True)
         callback_handler = OpenInferenceCallbackHandler()
         self.callback_manager = CallbackManager([llama_debug, callback_handler])
-        self.embed_model = HuggingFaceEmbedding(model_name=vars.EMBEDDING_MODEL)
+        self.embed_model = get_embed_model(vars.EMBEDDING_MODEL)
         self.llm = OpenAI(model="gpt-4")
         self.service_context = ServiceContext.from_defaults(llm=self.llm)
         self.vector_store: LeadGenVectorStore = get_vector_store()
@@ -7,7 +7,7 @@ from llama_index.callbacks import (
 from llama_index import VectorStoreIndex, SimpleDirectoryReader, get_response_synthesizer
 from llama_index.retrievers import VectorIndexRetriever
 from llama_index.query_engine import RetrieverQueryEngine
-from llama_index.embeddings import HuggingFaceEmbedding
+from embedding import get_embed_model
 from llama_index.prompts.base import PromptTemplate
 from llama_index.prompts.prompt_type import PromptType
 from llama_index.schema import NodeWithScore, QueryBundle, TextNode
@@ -30,7 +30,7 @@ class ResponseSynthesizer(object):
         llama_debug = LlamaDebugHandler(print_trace_on_end=True)
         callback_handler = OpenInferenceCallbackHandler()
         self.callback_manager = CallbackManager([llama_debug, callback_handler])
-        self.embed_model = HuggingFaceEmbedding(model_name=vars.EMBEDDING_MODEL)
+        self.embed_model = get_embed_model(vars.EMBEDDING_MODEL)
         self.vector_store = get_vector_store()
         self.llm = OpenAI(model="gpt-4")
         _logger.info("Response Synthesizer initilized")